@@ -0,0 +1,195 @@
+import asyncio
+import time
+import uuid
+
+from concurrent.futures import Executor
+from typing import Union
+
+from redis.asyncio import StrictRedis
+
+from audio import AudioPreprocessor
+from client import TranscriptionContext, create_data_key, create_file_key, create_s3_file_key, create_request, create_unique_key2, upload_audio
+from downloader.base_downloader import BaseDownloader
+from transcribers import Lang, Vendor, Transcription
+from messaging import PRIORITY_NORMAL, CLAIM_HIT, CLAIM_CLAIMED, create_partial_key, create_request_queue, claim_request_async, release_request_async, AsyncReplyWaiter
+from transcription_cache import TranscriptionCache, create_cache_key, hash_file
+from monitoring.tracing import Trace
+
+
+class AsyncTranscriptionContext:
+    """
+    TranscriptionContext 의 asyncio 버전 - 같은 요청 합치기, 저장소 확인/업로드, 요청, 대기, 정리를 같은 방식으로 수행한다.
+    Redis 는 redis.asyncio 로 기다리고, 파일 해시/전처리/S3 업로드처럼 블로킹 작업만 executor 에서 실행한다.
+    cache 는 동기 StrictRedis 로 만든 TranscriptionCache 이며 executor 에서 호출한다.
+    """
+
+    FLIGHT_TTL = TranscriptionContext.FLIGHT_TTL
+
+    def __init__(self, redis: StrictRedis, downloader: BaseDownloader, filename: str, unique_key: str, unique_key2: str, cache: TranscriptionCache = None,
+                 preprocessor: AudioPreprocessor = None, tracing=False, queue_backend='list', executor: Executor = None, waiter: AsyncReplyWaiter = None):
+        self.__redis = redis
+        self.__downloader = downloader
+        self.__cache = cache
+        self.__preprocessor = preprocessor
+        self.__tracing = tracing
+        self.__executor = executor
+        self.__waiter = waiter or AsyncReplyWaiter(redis)
+        self.__audio = None
+        self.__content_hash = None
+        self.__queue = create_request_queue(redis, queue_backend)
+        self.__filename = filename
+        self.__unique_key = unique_key
+        self.__unique_key2 = unique_key2
+
+    @property
+    def filename(self):
+        return self.__filename
+
+    @property
+    def unique_key2(self):
+        return self.__unique_key2
+
+    @property
+    def unique_key(self):
+        return self.__unique_key
+
+    @property
+    def file_key(self):
+        return create_file_key(self.filename, self.unique_key)
+
+    @property
+    def s3_file_key(self):
+        return create_s3_file_key(self.filename, self.unique_key, self.unique_key2)
+
+    async def __call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, fn, *args)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._cleanup_storage(self.s3_file_key)
+
+    async def _upload_to_storage(self, local_filename, remote_filename):
+        print(f'Upload - {remote_filename}')
+        self.__audio = await self.__call(upload_audio, self.__downloader, self.__preprocessor, local_filename, remote_filename)
+
+    async def _cleanup_storage(self, remote_filename):
+        print(f'Cleanup - {remote_filename}')
+        try:
+            await self.__call(self.__downloader.delete_file, remote_filename)
+        except:
+            # 파일 삭제 예외 무시
+            pass
+
+    async def _check_storage(self, remote_filename):
+        print(f'Check - {remote_filename}')
+        try:
+            return await self.__call(self.__downloader.check_file, remote_filename)
+        except:
+            pass
+        return False
+
+    async def _request_to_process(self, data_key: str, lang: Lang, vendor: Vendor, priority: int = PRIORITY_NORMAL, trace_id: str = None):
+        # 이 컨텍스트에서 업로드하지 않은 파일은 원본 그대로 올라간 것으로 본다
+        audio = self.__audio or await self.__call(AudioPreprocessor.probe, self.filename)
+        await self.__queue.push_async(create_request(data_key, self.s3_file_key, self.file_key, lang, vendor, audio.media_format, priority, audio.duration, trace_id))
+
+    async def _wait_for_response(self, key, timeout=60):
+        # 완료 신호 대기
+        await self.__waiter.wait(key, timeout)
+        data = await self.__redis.get(key)
+        return data if data else b''
+
+    async def _hit(self, data_key):
+        return await self.__redis.get(data_key)
+
+    async def _cache_key(self, lang: Lang, vendor: Vendor):
+        # 같은 컨텍스트에서는 파일 해시를 한번만 계산한다
+        if self.__content_hash is None:
+            self.__content_hash = await self.__call(hash_file, self.filename)
+        return create_cache_key(self.__content_hash, lang, vendor)
+
+    async def partial(self, vendor: Vendor = Vendor.AWS, lang: Lang = Lang.LANG_KO) -> Union[Transcription, None]:
+        data_key = create_data_key(self.filename, self.unique_key, lang, vendor)
+        result = await self._hit(data_key) or await self.__redis.get(create_partial_key(data_key))
+        return Transcription.loads(result) if result else None
+
+    async def transcribe(self, vendor: Vendor = Vendor.AWS, lang: Lang = Lang.LANG_KO, priority: int = PRIORITY_NORMAL) -> Transcription:
+        # 동일한 오디오 파일, 동일한 언어, 동일한 벤더의 요청은 하나로 합쳐진다 - 동기 클라이언트의 요청과도 합쳐진다
+        data_key = create_data_key(self.filename, self.unique_key, lang, vendor)
+        trace = Trace(vendor=vendor.value).mark('started')
+        try:
+            return await self.__transcribe(data_key, vendor, lang, priority, trace)
+        finally:
+            if self.__tracing:
+                await trace.flush_async(self.__redis)
+
+    async def __transcribe(self, data_key: str, vendor: Vendor, lang: Lang, priority: int, trace: Trace, timeout=60) -> Transcription:
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while True:
+            status, result = await claim_request_async(self.__redis, data_key, owner, self.FLIGHT_TTL)
+            trace.mark('claimed')
+            if status == CLAIM_HIT:
+                return Transcription.loads(result)
+            if status == CLAIM_CLAIMED:
+                return await self.__request(data_key, owner, vendor, lang, priority, trace, max(0, deadline - time.monotonic()))
+
+            # 진행중인 요청에 합류 - 완료 신호를 받으면 다시 claim 해서 결과를 가져온다
+            if not await self.__waiter.wait(data_key, max(0, deadline - time.monotonic())):
+                return Transcription.loads(await self.__redis.get(data_key) or b'')
+
+    async def __request(self, data_key: str, owner: str, vendor: Vendor, lang: Lang, priority: int, trace: Trace, timeout) -> Transcription:
+        enqueued = False
+        try:
+            # 같은 내용의 오디오가 이미 인식되었다면 캐시 결과를 data_key 에도 기록하고 반환
+            cache_key = await self._cache_key(lang, vendor) if self.__cache else None
+            if cache_key:
+                result = await self.__call(self.__cache.get, cache_key)
+                if result:
+                    await self.__call(self.__cache.put_for, data_key, result)
+                    return Transcription.loads(result)
+
+            uploaded = await self._check_storage(self.s3_file_key)
+            trace.mark('checked')
+            if not uploaded:
+                await self._upload_to_storage(self.filename, self.s3_file_key)
+                trace.mark('uploaded')
+
+            await self._request_to_process(data_key, lang, vendor, priority, trace.trace_id if self.__tracing else None)
+            enqueued = True
+            trace.mark('enqueued')
+            result = await self._wait_for_response(data_key, timeout)
+            trace.mark('completed')
+            if cache_key:
+                await self.__call(self.__cache.put, cache_key, result)
+            return Transcription.loads(result)
+        finally:
+            if not enqueued:
+                # 요청하지 않고 끝났다면 (캐시 hit, 업로드 실패, 취소) 진행중 표시를 지우고 합류한 클라이언트를 깨운다
+                await release_request_async(self.__redis, data_key, owner)
+
+
+class AsyncTranscriptionBroker:
+    """
+    TranscriptionBroker 의 asyncio 버전 - FastAPI 같은 asyncio 서비스에서 스레드를 점유하지 않고 많은 음성인식을 함께 기다린다.
+    모든 컨텍스트가 하나의 AsyncReplyWaiter 로 완료 신호를 기다리므로, 기다리는 요청 수만큼 Redis 커넥션이 필요하지 않다.
+    """
+
+    def __init__(self, redis: StrictRedis, downloader: BaseDownloader, cache: TranscriptionCache = None, preprocessor: AudioPreprocessor = None, tracing=False,
+                 queue_backend='list', executor: Executor = None):
+        self.__redis = redis
+        self.__downloader = downloader
+        self.__cache = cache
+        self.__preprocessor = preprocessor
+        self.__tracing = tracing
+        self.__queue_backend = queue_backend
+        self.__executor = executor
+        self.__waiter = AsyncReplyWaiter(redis)
+
+    def with_file(self, filename: str, unique_key: str) -> AsyncTranscriptionContext:
+        unique_key2 = create_unique_key2()
+        return AsyncTranscriptionContext(self.__redis, self.__downloader, filename, unique_key, unique_key2, self.__cache, self.__preprocessor, self.__tracing,
+                                         self.__queue_backend, self.__executor, self.__waiter)
@@ -0,0 +1,3 @@
+from .preprocess import AudioPreprocessor, PreprocessedAudio, to_mono
+
+__all__ = ('AudioPreprocessor', 'PreprocessedAudio', 'to_mono')
@@ -0,0 +1,164 @@
+import logging
+import os
+import tempfile
+import wave
+
+from typing import NamedTuple, Union
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+class PreprocessedAudio(NamedTuple):
+    filename: str
+    media_format: str
+    duration: Union[float, None] = None
+    # 전처리로 새로 만든 임시 파일인지 여부 - 업로드 후 지운다
+    temporary: bool = False
+
+
+def to_mono(data: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """PCM 바이트를 채널 평균의 float32 모노 샘플로 바꾼다."""
+    if sample_width == 1:
+        samples = np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128
+        samples *= 256
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32)
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int8).astype(np.int32) << 16)).astype(np.float32)
+        samples /= 256
+    else:
+        samples = np.frombuffer(data, dtype='<i4').astype(np.float32)
+        samples /= 65536
+    return samples.reshape(-1, channels).mean(axis=1)
+
+
+class _Resampler:
+    """블록 단위로 들어오는 샘플을 저역 통과 필터 후 선형 보간으로 리샘플링한다 (블록 사이의 필터 상태를 유지)."""
+
+    def __init__(self, src_rate: int, dst_rate: int, numtaps=63):
+        self.__ratio = src_rate / dst_rate
+        cutoff = min(1.0, dst_rate / src_rate)
+        n = np.arange(numtaps) - (numtaps - 1) / 2
+        taps = np.sinc(cutoff * n) * np.hamming(numtaps)
+        self.__taps = (taps / taps.sum()).astype(np.float32)
+        self.__delay = (numtaps - 1) / 2
+        self.__history = np.zeros(numtaps - 1, dtype=np.float32)
+        # 필터를 거친 샘플 버퍼와 버퍼 첫 샘플의 전체 위치
+        self.__buffer = np.zeros(0, dtype=np.float32)
+        self.__buffer_start = 0
+        self.__next_output = 0
+        self.__consumed = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        self.__consumed += len(samples)
+        extended = np.concatenate((self.__history, samples))
+        self.__history = extended[len(extended) - len(self.__history):]
+        self.__buffer = np.concatenate((self.__buffer, np.convolve(extended, self.__taps, mode='valid')))
+
+        # 필터 지연을 보정한 위치에서 보간할 수 있는 출력 샘플만 만든다
+        buffer_end = self.__buffer_start + len(self.__buffer)
+        last = int(np.floor((buffer_end - 2 - self.__delay) / self.__ratio))
+        if last < self.__next_output:
+            return np.zeros(0, dtype=np.float32)
+        positions = np.arange(self.__next_output, last + 1) * self.__ratio + self.__delay - self.__buffer_start
+        output = np.interp(positions, np.arange(len(self.__buffer)), self.__buffer).astype(np.float32)
+        self.__next_output = last + 1
+
+        keep_from = min(len(self.__buffer), max(0, int(np.floor(self.__next_output * self.__ratio + self.__delay)) - self.__buffer_start))
+        self.__buffer = self.__buffer[keep_from:]
+        self.__buffer_start += keep_from
+        return output
+
+    def flush(self) -> np.ndarray:
+        # 입력 길이에 해당하는 만큼만 남기고 필터에 남은 샘플을 내보낸다
+        remaining = int(np.ceil(self.__consumed / self.__ratio)) - self.__next_output
+        output = self.process(np.zeros(int(np.ceil(self.__delay)) + 2, dtype=np.float32))
+        return output[:max(0, remaining)]
+
+
+class AudioPreprocessor:
+    """
+    업로드 전에 WAV 를 음성인식에 필요한 만큼만 남긴다 - 모노로 합치고 sample_rate 로 리샘플링한 16bit PCM.
+    media_format 이 flac 이고 soundfile 이 설치되어 있다면 FLAC 으로 압축한다.
+    WAV 가 아니거나 이미 조건을 만족하는 파일은 그대로 사용한다.
+    """
+
+    def __init__(self, sample_rate=16000, media_format='wav', tempdir: str = None, block_seconds=10):
+        if media_format == 'flac' and soundfile is None:
+            logging.warning('soundfile is not installed. Preprocessed audio is stored as wav.')
+            media_format = 'wav'
+        self.__sample_rate = sample_rate
+        self.__media_format = media_format
+        self.__tempdir = tempdir
+        self.__block_seconds = block_seconds
+
+    @staticmethod
+    def media_format_of(filename: str) -> str:
+        ext = os.path.splitext(filename)[1][1:].lower()
+        return ext or 'wav'
+
+    @classmethod
+    def probe(cls, filename: str) -> PreprocessedAudio:
+        # 변환 없이 파일 형식과 길이만 확인한다 - 길이는 WAV 만 알 수 있다
+        try:
+            with wave.open(filename, 'rb') as wav:
+                return PreprocessedAudio(filename, 'wav', wav.getnframes() / wav.getframerate())
+        except (wave.Error, EOFError):
+            return PreprocessedAudio(filename, cls.media_format_of(filename))
+
+    def process(self, filename: str) -> PreprocessedAudio:
+        try:
+            wav = wave.open(filename, 'rb')
+        except (wave.Error, EOFError):
+            return PreprocessedAudio(filename, self.media_format_of(filename))
+
+        with wav:
+            rate, channels, sample_width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+            duration = wav.getnframes() / rate
+            if channels == 1 and sample_width == 2 and rate <= self.__sample_rate and self.__media_format == 'wav':
+                return PreprocessedAudio(filename, 'wav', duration)
+
+            fd, output = tempfile.mkstemp(suffix=f'.{self.__media_format}', dir=self.__tempdir)
+            os.close(fd)
+            try:
+                self.__convert(wav, output, rate)
+            except Exception:
+                os.remove(output)
+                raise
+            return PreprocessedAudio(output, self.__media_format, duration, True)
+
+    def __convert(self, wav: wave.Wave_read, output: str, rate: int):
+        dst_rate = min(rate, self.__sample_rate)
+        resampler = _Resampler(rate, dst_rate) if dst_rate != rate else None
+        block_frames = int(rate * self.__block_seconds)
+
+        def blocks():
+            while True:
+                data = wav.readframes(block_frames)
+                if not data:
+                    break
+                samples = to_mono(data, wav.getsampwidth(), wav.getnchannels())
+                yield resampler.process(samples) if resampler else samples
+            if resampler:
+                yield resampler.flush()
+
+        def pcm16(samples: np.ndarray):
+            return np.clip(np.rint(samples), -32768, 32767).astype('<i2')
+
+        if self.__media_format == 'flac':
+            with soundfile.SoundFile(output, 'w', samplerate=dst_rate, channels=1, format='FLAC', subtype='PCM_16') as out:
+                for samples in blocks():
+                    out.write(pcm16(samples))
+        else:
+            with wave.open(output, 'wb') as out:
+                out.setnchannels(1)
+                out.setsampwidth(2)
+                out.setframerate(dst_rate)
+                for samples in blocks():
+                    out.writeframes(pcm16(samples).tobytes())
@@ -0,0 +1,115 @@
+"""
+ClovaNest 웹훅 페이로드 파싱 벤치마크 - 기존 pydantic 모델 검증 + 단어 순회와 비교한다.
+
+    python -m benchmarks.bench_clova_nest --hours 3
+"""
+import json
+import time
+
+from typing import List
+
+import click
+import orjson
+
+from pydantic import BaseModel
+
+from transcribers import Transcription, TranscriptionWord, Vendor
+from transcribers import loads_clova_nest_result, create_clova_nest_transcription
+
+
+class ClovaNestParams(BaseModel):
+    service: str
+    domain: str
+    completion: str
+    diarization: dict
+    boostings: dict
+    forbiddens: str
+    wordAlignment: bool
+    fullText: bool
+    priority: int
+    userdata: dict
+
+
+class ClovaNestResult(BaseModel):
+    result: str
+    message: str
+    token: str
+    version: str
+    params: ClovaNestParams
+    progress: int
+    segments: List[dict]
+    text: str
+    confidence: float
+    speakers: List[dict]
+
+
+def legacy_parse(data: bytes):
+    result = ClovaNestResult(**json.loads(data))
+    words = []
+    for segment in result.segments:
+        for word in segment.get('words', []):
+            words.append(TranscriptionWord(word[2], word[0] / 1000, word[1] / 1000))
+    return Transcription([result.text], [result.confidence], words, Vendor.ClovaNest.value)
+
+
+def fast_parse(data: bytes):
+    return create_clova_nest_transcription(loads_clova_nest_result(data))
+
+
+def create_payload(hours: float, words_per_segment=12, word_ms=400):
+    texts = ['안녕하세요', '오늘', '면접에', '참여해', '주셔서', '감사합니다.']
+    segments = []
+    start = 0
+    end_ms = int(hours * 60 * 60 * 1000)
+    while start < end_ms:
+        words = [[start + i * word_ms, start + (i + 1) * word_ms - 50, texts[i % len(texts)]] for i in range(words_per_segment)]
+        segment_end = start + words_per_segment * word_ms
+        segments.append({
+            'start': start, 'end': segment_end, 'text': ' '.join(word[2] for word in words), 'confidence': 0.9,
+            'diarization': {'label': '1'}, 'speaker': {'label': '1', 'name': 'A', 'edited': False},
+            'textEdited': ' '.join(word[2] for word in words), 'words': words,
+        })
+        start = segment_end
+
+    return orjson.dumps({
+        'result': 'COMPLETED', 'message': 'Succeeded', 'token': 'benchmark-token', 'version': 'ncp_v2',
+        'params': {'service': 'ncp', 'domain': 'general', 'completion': 'async', 'diarization': {'enable': True},
+                   'boostings': {}, 'forbiddens': '', 'wordAlignment': True, 'fullText': True, 'priority': 0, 'userdata': {}},
+        'progress': 100, 'segments': segments, 'text': ' '.join(segment['text'] for segment in segments),
+        'confidence': 0.9, 'speakers': [{'label': '1', 'name': 'A', 'edited': False}],
+    })
+
+
+def measure(fn, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run(hours: float, repeat: int):
+    data = create_payload(hours)
+    result = {
+        'hours': hours,
+        'payload_bytes': len(data),
+        'words': len(fast_parse(data).words),
+        'legacy_parse_ms': measure(lambda: legacy_parse(data), repeat),
+        'fast_parse_ms': measure(lambda: fast_parse(data), repeat),
+    }
+    # 웹훅 핸들러와 같이 파싱 후 Redis 에 저장할 값까지 만든다
+    for fmt in ('json', 'binary'):
+        result[f'legacy_{fmt}_handler_ms'] = measure(lambda: legacy_parse(data).encode(fmt), repeat)
+        result[f'fast_{fmt}_handler_ms'] = measure(lambda: fast_parse(data).encode(fmt), repeat)
+    return result
+
+
+@click.command()
+@click.option('--hours', default=3.0, help='audio length of the synthetic payload', show_default=True)
+@click.option('--repeat', default=5, help='number of repetitions', show_default=True)
+def main(hours: float, repeat: int):
+    for name, value in run(hours, repeat).items():
+        print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+
+
+if __name__ == '__main__':
+    main()
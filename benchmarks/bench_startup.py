@@ -0,0 +1,140 @@
+"""
+러너의 시작 비용 측정 - 새 프로세스에서 main 을 import 하고 첫 요청이 벤더에 전달될 때까지 걸리는 시간.
+- import_s: main 모듈 import (벤더 모듈은 첫 요청에서 import 되므로 포함되지 않는다)
+- registry_s: 벤더 registry 생성
+- vendor_build_s: 첫 요청 벤더의 import 와 클라이언트 생성 (실제 AwsTranscriber/ClovaNestTranscriber)
+- first_dispatch_s: import 시작부터 러너가 첫 요청을 벤더에 전달할 때까지 (벤더 호출은 benchmarks.fakes 로 대신한다)
+- process_s: 프로세스 시작부터 종료까지 (인터프리터 시작 포함)
+--preload 를 주면 시작하자마자 백그라운드에서 모든 벤더를 만든다.
+
+    pip install fakeredis lupa
+    python -m benchmarks.bench_startup --repeat 5 --vendor aw [--vendor cn] [--preload]
+"""
+import time
+
+_started = time.perf_counter()
+
+import os
+import statistics
+import subprocess
+import sys
+
+import click
+import orjson
+
+# 시작할 때 불러오지 않았으면 하는 모듈 - main 을 import 한 직후 로드되어 있는지 기록한다
+HEAVY_MODULES = ('boto3', 'botocore', 'requests', 'smart_open', 'numpy', 'transcribers.aws_transcriber', 'transcribers.clova_nest_transcriber', 'runner.chunking')
+
+
+def measure_once(vendors, preload: bool):
+    # 자식 프로세스에서 실행된다 - 측정하는 모듈은 함수 안에서 import 한다
+    import main as broker_main
+    imported = time.perf_counter()
+    loaded_modules = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    import shutil
+    import tempfile
+    import threading
+    import uuid
+
+    import fakeredis
+
+    from client import create_request
+    from config.config import AwsConfig, CacheConfig, ClovaNestConfig, ExecutorConfig, LoggerConfig, MainConfig, RedisConfig, VendorsConfig
+    from downloader import LocalDownloader
+    from messaging import create_request_queue
+    from runner import ParallelExecutor, TranscriptionRequestRunner, VendorRegistry
+    from transcribers import Lang, Vendor
+    from transport import Transport
+
+    from .fakes import FakeAwsTranscriber, FakeVendor
+
+    storage = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        config = MainConfig(aws=AwsConfig(access_key='bench', secret_access_key='bench', bucket='bench', region='ap-northeast-2'),
+                            clova_nest=ClovaNestConfig(invoke_url='http://127.0.0.1', secret_key='bench', callback='http://127.0.0.1'),
+                            redis=RedisConfig(host='127.0.0.1', port=6379, db=0), cache=CacheConfig(dirpath=storage), executor=ExecutorConfig(max_request=8),
+                            logger=LoggerConfig(), vendors=VendorsConfig(enabled=list(vendors), preload=preload))
+        redis = fakeredis.FakeStrictRedis()
+        transport = Transport(config.executor.max_request)
+        setup_done = time.perf_counter()
+
+        registry = broker_main.create_vendor_registry(config, redis, transport, LocalDownloader(storage))
+        if config.vendors.preload:
+            registry.preload()
+        registered = time.perf_counter()
+
+        # 실제 벤더를 만든 뒤 (import, 클라이언트 생성) 호출은 가짜 벤더로 대신한다
+        dispatched = threading.Event()
+        build_times = {}
+
+        class FirstDispatchTranscriber(FakeAwsTranscriber):
+            def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+                dispatched.set()
+                return super().transcribe(src, lang, media_format, duration=duration)
+
+        def __factory(vendor: Vendor):
+            started_at = time.perf_counter()
+            registry[vendor]
+            build_times[vendor.value] = time.perf_counter() - started_at
+            return FirstDispatchTranscriber(FakeVendor(latency=0, jitter=0, words=10))
+
+        transcribers = VendorRegistry()
+        for vendor in registry:
+            transcribers.register(vendor, lambda vendor=vendor: __factory(vendor))
+
+        vendor = Vendor(vendors[0])
+        queue = create_request_queue(redis, 'reliable', name=f'bench-startup:{uuid.uuid4().hex[:8]}', consumer='bench-startup', batch_size=32, timeout=0.1)
+        redis.lpush(queue.name, create_request(f'bench-startup:{uuid.uuid4().hex}', 'bench.wav', 'bench.wav', Lang.LANG_KO, vendor))
+        runner = TranscriptionRequestRunner(redis, transcribers, ParallelExecutor(config.executor.max_request), LocalDownloader(storage), storage, queue=queue)
+        threading.Thread(target=runner.poll, daemon=True, name='runner').start()
+        dispatched.wait(60)
+        first_dispatch = time.perf_counter()
+        runner.stop()
+
+        return {
+            'import_s': imported - _started,
+            'registry_s': registered - setup_done,
+            'vendor_build_s': build_times.get(vendor.value),
+            'first_dispatch_s': first_dispatch - _started - (setup_done - imported),
+            'modules': loaded_modules,
+        }
+    finally:
+        shutil.rmtree(storage, ignore_errors=True)
+
+
+def run(repeat: int, vendors=('aw',), preload=False):
+    # 이미 import 된 모듈의 영향을 받지 않도록 매번 새 프로세스에서 측정한다
+    command = [sys.executable, '-m', 'benchmarks.bench_startup', '--child'] + [arg for vendor in vendors for arg in ('--vendor', vendor)] + (['--preload'] if preload else [])
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.check_output(command, cwd=os.getcwd())
+        sample = orjson.loads(output.splitlines()[-1])
+        sample['process_s'] = time.perf_counter() - started
+        samples.append(sample)
+
+    result = {'repeat': repeat, 'vendors': list(vendors), 'preload': preload, 'modules': samples[-1]['modules']}
+    for name in ('import_s', 'registry_s', 'vendor_build_s', 'first_dispatch_s', 'process_s'):
+        values = [sample[name] for sample in samples if sample[name] is not None]
+        result[name] = statistics.median(values) if values else None
+    return result
+
+
+@click.command()
+@click.option('--repeat', default=5, help='number of processes', show_default=True)
+@click.option('--vendor', 'vendors', multiple=True, default=('aw',), type=click.Choice(['aw', 'cn']), help='enabled vendors - the first one receives the request', show_default=True)
+@click.option('--preload', is_flag=True, help='load vendors in background at startup')
+@click.option('--child', is_flag=True, hidden=True)
+def main(repeat: int, vendors, preload: bool, child: bool):
+    if child:
+        # 러너 스레드가 남아있어도 바로 끝낸다
+        sys.stdout.write(orjson.dumps(measure_once(vendors, preload)).decode() + '\n')
+        sys.stdout.flush()
+        os._exit(0)
+    for name, value in run(repeat, vendors, preload).items():
+        print(f'{name}: {value:.3f}' if isinstance(value, float) else f'{name}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Redis 에 저장하는 음성인식 결과 포맷(JSON/바이너리) 비교.
+--host 를 주면 실제 Redis 에 두 포맷으로 기록한 뒤 MEMORY USAGE 를 비교한다.
+
+    python -m benchmarks.bench_storage --words 50000 [--host 127.0.0.1 --port 6379 --db 15]
+"""
+import time
+
+import click
+
+from redis import StrictRedis
+
+from transcribers import Transcription, TranscriptionWord
+
+
+def create_transcription(words: int):
+    texts = ['안녕하세요', '오늘', '면접에', '참여해', '주셔서', '감사합니다.']
+    return Transcription([' '.join(texts)], [0.9], [TranscriptionWord(texts[i % len(texts)], round(i * 0.41, 3), round(i * 0.41 + 0.3, 3)) for i in range(words)], 'aw')
+
+
+def measure(fn, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run(words: int, repeat: int, redis: StrictRedis = None):
+    transcription = create_transcription(words)
+    result = {'words': words}
+    for fmt in ('json', 'binary'):
+        data = transcription.encode(fmt)
+        result[f'{fmt}_bytes'] = len(data)
+        result[f'{fmt}_encode_ms'] = measure(lambda: transcription.encode(fmt), repeat)
+        result[f'{fmt}_decode_ms'] = measure(lambda: Transcription.loads(data), repeat)
+        if redis is not None:
+            key = f'bench-storage:{fmt}'
+            redis.set(key, data)
+            result[f'{fmt}_redis_memory'] = redis.memory_usage(key)
+            redis.delete(key)
+    return result
+
+
+@click.command()
+@click.option('--words', default=50000, help='number of words', show_default=True)
+@click.option('--repeat', default=10, help='number of repetitions', show_default=True)
+@click.option('--host', default=None, help='redis host to measure MEMORY USAGE')
+@click.option('--port', default=6379, show_default=True)
+@click.option('--db', default=15, show_default=True)
+def main(words: int, repeat: int, host: str, port: int, db: int):
+    redis = StrictRedis(host=host, port=port, db=db) if host else None
+    for name, value in run(words, repeat, redis).items():
+        print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+실제 AWS/ClovaNest/Redis 없이 한 대의 머신에서 전체 흐름을 측정한다.
+- Redis: fakeredis (또는 --redis-host 로 로컬 Redis), S3: LocalDownloader, 벤더: benchmarks.fakes
+- dispatch: 러너가 큐의 요청을 처리하는 처리량
+- client: 여러 클라이언트가 동시에 요청할 때의 종단 간 지연 시간 (AWS 동기, ClovaNest 웹훅)
+- webhook: 웹훅 앱의 초당 처리 요청 수
+- serialization: 결과 직렬화/파싱 비용 (bench_transcription, bench_storage, bench_clova_nest)
+- startup: 새 프로세스에서 main import 부터 첫 요청이 벤더에 전달될 때까지의 시간 (bench_startup)
+결과는 커밋 간 비교할 수 있도록 JSON 으로 저장한다.
+
+    pip install fakeredis lupa httpx
+    python -m benchmarks.bench_suite --output bench-results.json [--scenario dispatch --scenario client ...]
+"""
+import asyncio
+import datetime
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+from typing import Callable, List
+
+import click
+import orjson
+import redis_lock
+
+from redis import StrictRedis
+
+from client import RedisBuilder, TranscriptionBroker, create_request
+from config.config import LoggerConfig, RedisConfig, ResultConfig, WebHookConfig, WebHookMainConfig
+from downloader import LocalDownloader
+from messaging import create_request_queue, create_webhook_key, wait_for_replies
+from runner import ParallelExecutor, TranscriptionRequestRunner
+from transcribers import Lang, Vendor
+from webhook import create_app
+
+from . import bench_clova_nest, bench_startup, bench_storage, bench_transcription
+from .fakes import FakeAwsTranscriber, FakeClovaNestTranscriber, FakeVendor, WebhookDeliverer
+
+
+class BenchRedis:
+    """시나리오마다 새 Redis 를 만든다 - fakeredis 는 새 서버를, 로컬 Redis 는 지정한 db 를 사용한다"""
+
+    def __init__(self, host: str = None, port: int = 6379, db: int = 15):
+        self.__host = host
+        self.__port = port
+        self.__db = db
+        self.__server = None
+
+    def reset(self):
+        if self.__host is None:
+            import fakeredis
+            self.__server = fakeredis.FakeServer()
+
+    def sync(self) -> StrictRedis:
+        if self.__host is None:
+            import fakeredis
+            return fakeredis.FakeStrictRedis(server=self.__server)
+        return StrictRedis(host=self.__host, port=self.__port, db=self.__db)
+
+    def asyncio(self):
+        if self.__host is None:
+            from fakeredis import aioredis
+            return aioredis.FakeRedis(server=self.__server)
+        from redis.asyncio import StrictRedis as AsyncStrictRedis
+        return AsyncStrictRedis(host=self.__host, port=self.__port, db=self.__db)
+
+
+class BenchRedisBuilder(RedisBuilder):
+    def __init__(self, redis: StrictRedis):
+        self.__redis = redis
+
+    @property
+    def redis_lock(self) -> Callable:
+        return redis_lock.Lock
+
+    @property
+    def redis(self) -> Callable:
+        return lambda: self.__redis
+
+
+def percentiles(values: List[float], prefix: str):
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {f'{prefix}_p50': pick(0.5), f'{prefix}_p90': pick(0.9), f'{prefix}_p99': pick(0.99), f'{prefix}_max': values[-1]}
+
+
+def create_webhook_app(redis):
+    config = WebHookMainConfig(webhook=WebHookConfig(host='127.0.0.1', port=0), redis=RedisConfig(host='127.0.0.1', port=6379, db=0),
+                               result=ResultConfig(), logger=LoggerConfig())
+    return create_app(config, redis)
+
+
+def start_runner(redis: StrictRedis, transcribers, max_request: int, queue_name: str, storage: str):
+    queue = create_request_queue(redis, 'reliable', name=queue_name, consumer=f'bench-{uuid.uuid4().hex[:8]}', batch_size=32, timeout=0.1)
+    runner = TranscriptionRequestRunner(redis, transcribers, ParallelExecutor(max_request), LocalDownloader(storage), storage, queue=queue)
+    threading.Thread(target=runner.poll, daemon=True, name='runner').start()
+    return queue
+
+
+def run_dispatch(bench_redis: BenchRedis, requests: int, max_request: int, words: int):
+    # 지연 없는 벤더로 러너의 꺼내기-실행-기록 처리량을 측정한다
+    bench_redis.reset()
+    redis = bench_redis.sync()
+    storage = tempfile.mkdtemp(prefix='bench-storage-')
+    queue_name = f'bench-dispatch:{uuid.uuid4().hex[:8]}'
+    try:
+        transcribers = {Vendor.AWS: (False, FakeAwsTranscriber(FakeVendor(latency=0, jitter=0, words=words)))}
+        data_keys = [f'bench-dispatch:{uuid.uuid4().hex}' for _ in range(requests)]
+        payloads = [create_request(data_key, 'bench.wav', 'bench.wav', Lang.LANG_KO, Vendor.AWS) for data_key in data_keys]
+        redis.lpush(queue_name, *payloads)
+
+        started = time.perf_counter()
+        start_runner(redis, transcribers, max_request, queue_name, storage)
+        completed = sum(1 for _ in wait_for_replies(redis, data_keys, timeout=max(60, requests / 10)))
+        elapsed = time.perf_counter() - started
+        return {'requests': requests, 'completed': completed, 'elapsed_s': elapsed, 'requests_per_s': completed / elapsed}
+    finally:
+        shutil.rmtree(storage, ignore_errors=True)
+
+
+def run_client(bench_redis: BenchRedis, clients: int, requests_per_client: int, aws: FakeVendor, clova_nest: FakeVendor, max_request: int):
+    # 클라이언트 -> 큐 -> 러너 -> 벤더(-> 웹훅) -> 결과까지의 지연 시간
+    bench_redis.reset()
+    redis = bench_redis.sync()
+    storage = tempfile.mkdtemp(prefix='bench-storage-')
+    workdir = tempfile.mkdtemp(prefix='bench-client-')
+    try:
+        deliverer = WebhookDeliverer(create_webhook_app(bench_redis.asyncio()))
+        transcribers = {
+            Vendor.AWS: (False, FakeAwsTranscriber(aws, seed=1)),
+            Vendor.ClovaNest: (True, FakeClovaNestTranscriber(clova_nest, deliverer, seed=2)),
+        }
+        from messaging import BROKER_QUEUE
+        start_runner(redis, transcribers, max_request, BROKER_QUEUE, storage)
+
+        broker = TranscriptionBroker(BenchRedisBuilder(redis), LocalDownloader(storage))
+        latencies = {Vendor.AWS: [], Vendor.ClovaNest: []}
+        failures = {Vendor.AWS: 0, Vendor.ClovaNest: 0}
+        lock = threading.Lock()
+
+        def __client(index: int):
+            for request in range(requests_per_client):
+                vendor = Vendor.AWS if request % 2 == 0 else Vendor.ClovaNest
+                filename = os.path.join(workdir, f'{index}-{request}.wav')
+                with open(filename, 'wb') as file:
+                    file.write(os.urandom(1024))
+                started = time.perf_counter()
+                try:
+                    with broker.with_file(filename, f'bench-{index}-{request}') as context:
+                        transcription = context.transcribe(vendor)
+                    ok = bool(transcription.words)
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        latencies[vendor].append(elapsed)
+                    else:
+                        failures[vendor] += 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=__client, args=(index,)) for index in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        result = {'clients': clients, 'requests': clients * requests_per_client, 'elapsed_s': elapsed}
+        for vendor in (Vendor.AWS, Vendor.ClovaNest):
+            result[f'{vendor.value}_completed'] = len(latencies[vendor])
+            result[f'{vendor.value}_failures'] = failures[vendor]
+            result.update(percentiles(latencies[vendor], f'{vendor.value}_latency_s'))
+        return result
+    finally:
+        shutil.rmtree(storage, ignore_errors=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_webhook(bench_redis: BenchRedis, requests: int, concurrency: int, words: int):
+    # 웹훅 앱에 동시에 결과를 전달할 때의 초당 처리 요청 수
+    bench_redis.reset()
+    redis = bench_redis.sync()
+    payload = bench_clova_nest.create_payload(words * 0.4 / 3600)
+    tokens = [uuid.uuid4().hex for _ in range(requests)]
+    with redis.pipeline(transaction=False) as pipe:
+        for token in tokens:
+            pipe.set(create_webhook_key(token), f'bench-webhook:{token}', ex=600)
+        pipe.execute()
+
+    async def __run():
+        import httpx
+        app = create_webhook_app(bench_redis.asyncio())
+        semaphore = asyncio.Semaphore(concurrency)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://webhook') as client:
+            async def __post(token: str):
+                async with semaphore:
+                    response = await client.post('/clovanest/webhook', content=payload.replace(b'benchmark-token', token.encode()))
+                    return response.status_code
+
+            started = time.perf_counter()
+            statuses = await asyncio.gather(*(__post(token) for token in tokens))
+            return time.perf_counter() - started, statuses
+
+    elapsed, statuses = asyncio.run(__run())
+    published = sum(1 for token in tokens if redis.exists(f'bench-webhook:{token}'))
+    return {'requests': requests, 'payload_bytes': len(payload), 'ok': statuses.count(200), 'published': published,
+            'elapsed_s': elapsed, 'requests_per_s': requests / elapsed}
+
+
+def run_serialization(words: int, hours: float, repeat: int):
+    return {
+        'transcription': bench_transcription.run(words, repeat),
+        'storage': bench_storage.run(words, repeat),
+        'clova_nest': bench_clova_nest.run(hours, repeat),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+SCENARIOS = ('dispatch', 'client', 'webhook', 'serialization', 'startup')
+
+
+@click.command()
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(SCENARIOS), help='scenarios to run (default: all)')
+@click.option('--output', default='bench-results.json', help='json result path', show_default=True)
+@click.option('--redis-host', default=None, help='local redis host (default: in-process fakeredis)')
+@click.option('--redis-port', default=6379, show_default=True)
+@click.option('--redis-db', default=15, show_default=True)
+@click.option('--requests', default=2000, help='requests for dispatch/webhook', show_default=True)
+@click.option('--clients', default=20, help='concurrent clients', show_default=True)
+@click.option('--requests-per-client', default=10, show_default=True)
+@click.option('--max-request', default=300, help='runner executor size', show_default=True)
+@click.option('--concurrency', default=50, help='concurrent webhook deliveries', show_default=True)
+@click.option('--aws-latency', default=0.5, show_default=True)
+@click.option('--clova-latency', default=0.5, show_default=True)
+@click.option('--jitter', default=0.2, show_default=True)
+@click.option('--failure-rate', default=0.0, show_default=True)
+@click.option('--words', default=2000, help='words per vendor result', show_default=True)
+@click.option('--serialization-words', default=50000, show_default=True)
+@click.option('--serialization-hours', default=3.0, show_default=True)
+@click.option('--repeat', default=5, show_default=True)
+@click.option('--startup-vendor', 'startup_vendors', multiple=True, default=('aw',), type=click.Choice(['aw', 'cn']), help='enabled vendors for startup', show_default=True)
+def main(scenarios, output: str, redis_host: str, redis_port: int, redis_db: int, requests: int, clients: int, requests_per_client: int, max_request: int,
+         concurrency: int, aws_latency: float, clova_latency: float, jitter: float, failure_rate: float, words: int,
+         serialization_words: int, serialization_hours: float, repeat: int, startup_vendors):
+    params = {key: value for key, value in locals().items() if key not in ('scenarios', 'output')}
+    scenarios = scenarios or SCENARIOS
+    bench_redis = BenchRedis(redis_host, redis_port, redis_db)
+
+    results = {}
+    for scenario in scenarios:
+        click.echo(f'Running {scenario}...')
+        if scenario == 'dispatch':
+            results[scenario] = run_dispatch(bench_redis, requests, max_request, words)
+        elif scenario == 'client':
+            aws = FakeVendor(aws_latency, jitter, failure_rate, words)
+            clova_nest = FakeVendor(clova_latency, jitter, failure_rate, words)
+            results[scenario] = run_client(bench_redis, clients, requests_per_client, aws, clova_nest, max_request)
+        elif scenario == 'webhook':
+            results[scenario] = run_webhook(bench_redis, requests, concurrency, words)
+        elif scenario == 'serialization':
+            results[scenario] = run_serialization(serialization_words, serialization_hours, repeat)
+        elif scenario == 'startup':
+            results[scenario] = {'lazy': bench_startup.run(repeat, startup_vendors), 'preload': bench_startup.run(repeat, startup_vendors, preload=True)}
+        click.echo(orjson.dumps(results[scenario], option=orjson.OPT_INDENT_2).decode())
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'redis': 'fakeredis' if redis_host is None else f'{redis_host}:{redis_port}/{redis_db}',
+        'params': params,
+        'results': results,
+    }
+    with open(output, 'wb') as file:
+        file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    click.echo(f'Results are written to {output}')
+
+
+if __name__ == '__main__':
+    main()
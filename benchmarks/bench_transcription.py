@@ -0,0 +1,67 @@
+"""
+Transcription 직렬화 마이크로 벤치마크.
+
+    python -m benchmarks.bench_transcription --words 50000
+"""
+import json
+import time
+
+import click
+
+from transcribers import Transcription, TranscriptionWord
+
+
+class LegacyTranscriptionWord:
+    def __init__(self, word: str, start_time: float, end_time: float):
+        self.word = word
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+def legacy_tojson(transcripts, confidences, words, vendor):
+    return json.dumps({
+        'transcripts': transcripts,
+        'confidences': confidences,
+        'words': list(map(lambda x: vars(x), words)),
+        'vendor': vendor,
+    }, ensure_ascii=False)
+
+
+def legacy_from_json(data: bytes):
+    transcription = json.loads(data.decode())
+    return [LegacyTranscriptionWord(word['word'], word['start_time'], word['end_time']) for word in transcription['words']]
+
+
+def measure(fn, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run(words: int, repeat: int):
+    texts = ['안녕하세요', '오늘', '면접에', '참여해', '주셔서', '감사합니다.']
+    legacy_words = [LegacyTranscriptionWord(texts[i % len(texts)], i * 0.4, i * 0.4 + 0.3) for i in range(words)]
+    transcription = Transcription([' '.join(texts)], [0.9], [TranscriptionWord(w.word, w.start_time, w.end_time) for w in legacy_words], 'aw')
+    legacy_data = legacy_tojson(transcription.transcripts, transcription.confidences, legacy_words, 'aw').encode()
+    data = transcription.dumps()
+
+    return {
+        'words': words,
+        'legacy_encode_ms': measure(lambda: legacy_tojson(transcription.transcripts, transcription.confidences, legacy_words, 'aw'), repeat),
+        'encode_ms': measure(transcription.tojson, repeat),
+        'legacy_decode_ms': measure(lambda: legacy_from_json(legacy_data), repeat),
+        'decode_ms': measure(lambda: Transcription.loads(data), repeat),
+    }
+
+
+@click.command()
+@click.option('--words', default=50000, help='number of words', show_default=True)
+@click.option('--repeat', default=10, help='number of repetitions', show_default=True)
+def main(words: int, repeat: int):
+    for name, value in run(words, repeat).items():
+        print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+벤치마크용 가짜 벤더 - 지연 시간, 실패율, 결과 크기를 설정할 수 있다.
+AWS 는 결과를 바로 반환하고, ClovaNest 는 웹훅을 사용한다면 토큰을 반환한 뒤 지연 시간 후에 웹훅 앱으로 결과를 전달한다.
+"""
+import asyncio
+import random
+import threading
+import time
+import uuid
+
+from typing import NamedTuple
+
+import httpx
+
+from transcribers import BaseTranscriber, Lang, Transcription, Vendor, create_clova_nest_transcription, loads_clova_nest_result
+
+from .bench_clova_nest import create_payload
+
+
+class FakeVendor(NamedTuple):
+    latency: float = 1.0
+    jitter: float = 0.2
+    failure_rate: float = 0.0
+    words: int = 1000
+
+
+def create_fake_transcription(words: int, vendor: Vendor) -> Transcription:
+    texts = ['안녕하세요', '오늘', '면접에', '참여해', '주셔서', '감사합니다.']
+    starts = [i * 0.4 for i in range(words)]
+    return Transcription.from_columns([' '.join(texts)], [0.9], [texts[i % len(texts)] for i in range(words)], starts, [start + 0.35 for start in starts], vendor.value)
+
+
+class _FakeTranscriber(BaseTranscriber):
+    def __init__(self, vendor: FakeVendor, seed: int = None):
+        self._vendor = vendor
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _delay(self):
+        with self._lock:
+            return max(0.0, self._vendor.latency + self._random.uniform(-self._vendor.jitter, self._vendor.jitter))
+
+    def _failed(self):
+        with self._lock:
+            return self._random.random() < self._vendor.failure_rate
+
+
+class FakeAwsTranscriber(_FakeTranscriber):
+    def __init__(self, vendor: FakeVendor, seed: int = None):
+        super().__init__(vendor, seed)
+        self.__transcription = create_fake_transcription(vendor.words, Vendor.AWS)
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        time.sleep(self._delay())
+        return None if self._failed() else self.__transcription
+
+
+class WebhookDeliverer:
+    """별도 스레드의 이벤트 루프에서 웹훅 앱(ASGI)으로 결과를 전달한다 - 네트워크 없이 FastAPI 앱을 그대로 호출한다"""
+
+    def __init__(self, app, path='/clovanest/webhook'):
+        self.__path = path
+        self.__loop = asyncio.new_event_loop()
+        self.__client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://webhook')
+        threading.Thread(target=self.__loop.run_forever, daemon=True, name='webhook').start()
+
+    async def __post(self, payload: bytes, delay: float):
+        await asyncio.sleep(delay)
+        return await self.__client.post(self.__path, content=payload)
+
+    def deliver(self, payload: bytes, delay: float = 0):
+        return asyncio.run_coroutine_threadsafe(self.__post(payload, delay), self.__loop)
+
+
+class FakeClovaNestTranscriber(_FakeTranscriber):
+    def __init__(self, vendor: FakeVendor, deliverer: WebhookDeliverer = None, upload_latency=0.05, seed: int = None):
+        super().__init__(vendor, seed)
+        self.__deliverer = deliverer
+        self.__upload_latency = upload_latency
+        # 단어 하나가 0.4초인 페이로드
+        self.__payload = create_payload(vendor.words * 0.4 / 3600)
+
+    @property
+    def payload(self):
+        return self.__payload
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        time.sleep(self.__upload_latency)
+        if self._failed():
+            return None
+        if self.__deliverer is None:
+            time.sleep(self._delay())
+            return create_clova_nest_transcription(loads_clova_nest_result(self.__payload))
+
+        token = uuid.uuid4().hex
+        self.__deliverer.deliver(self.__payload.replace(b'benchmark-token', token.encode()), self._delay())
+        return token
@@ -1,12 +1,20 @@
 import datetime
 import json
-import time
 import abc
+import os
+import time
+import uuid
 
-from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Tuple, Union
 
+from audio import AudioPreprocessor, PreprocessedAudio
 from downloader.base_downloader import BaseDownloader
 from transcribers import Lang, Vendor, Transcription
+from messaging import PRIORITY_NORMAL, CLAIM_HIT, CLAIM_CLAIMED, create_partial_key, create_request_queue, claim_request, release_request, wait_for_reply, wait_for_replies
+from messaging.reply import CLAIM_SCRIPT, claim_keys, parse_claim
+from transcription_cache import TranscriptionCache, create_cache_key, hash_file
+from monitoring.tracing import Trace
 
 
 def create_file_key(filename: str, unique_key: str):
@@ -21,10 +29,45 @@ def create_data_key(filename: str, unique_key: str, lang: Lang, vendor: Vendor):
     return f'trans-context:{filename}:{unique_key}:{lang.value}:{vendor.value}'
 
 
+def create_unique_key2():
+    # 같은 파일을 동시에 여는 컨텍스트끼리 업로드 경로가 겹치지 않도록 한다
+    return f'{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:8]}'
+
+
+def create_request(data_key: str, s3_file_key: str, file_key: str, lang: Lang, vendor: Vendor, media_format: str = 'wav', priority: int = PRIORITY_NORMAL, duration: float = None, trace_id: str = None):
+    return json.dumps({
+        'data_key': data_key,
+        's3_file_key': s3_file_key,
+        'file_key': file_key,
+        'lang': lang.value,
+        'vendor': vendor.value,
+        'media_format': media_format,
+        'priority': priority,
+        'duration': duration,
+        'enqueued_at': time.time(),
+        'trace_id': trace_id
+    })
+
+
+def upload_audio(downloader: BaseDownloader, preprocessor: Union[AudioPreprocessor, None], filename: str, s3_file_key: str) -> PreprocessedAudio:
+    # 전처리기가 있다면 전처리한 파일을 올리고, 올라간 파일의 형식과 길이를 반환한다
+    if preprocessor is None:
+        downloader.upload_file(filename, s3_file_key)
+        return AudioPreprocessor.probe(filename)
+
+    audio = preprocessor.process(filename)
+    try:
+        downloader.upload_file(audio.filename, s3_file_key)
+    finally:
+        if audio.temporary:
+            os.remove(audio.filename)
+    return audio
+
+
 class RedisBuilder(metaclass=abc.ABCMeta):
     @property
-    @abc.abstractmethod
     def redis_lock(self) -> Callable:
+        # 더 이상 사용하지 않는다 - 같은 요청은 락 없이 하나로 합쳐진다 (claim_request)
         return lambda: ()
 
     @property
@@ -34,14 +77,23 @@ class RedisBuilder(metaclass=abc.ABCMeta):
 
 
 class TranscriptionContext:
-    def __init__(self, builder: RedisBuilder, downloader, filename: str, unique_key: str, unique_key2: str):
+    # 진행중인 요청의 최대 유지 시간 - 주인이 요청 후 사라져도 이 시간 동안은 같은 요청을 다시 하지 않는다
+    FLIGHT_TTL = 60 * 20
+
+    def __init__(self, builder: RedisBuilder, downloader, filename: str, unique_key: str, unique_key2: str, cache: TranscriptionCache = None, preprocessor: AudioPreprocessor = None, tracing=False, queue_backend='list'):
         self.__builder = builder
+        self.__cache = cache
+        self.__preprocessor = preprocessor
+        self.__tracing = tracing
+        self.__audio = None
+        self.__content_hash = None
         self.__redis = builder.redis()
+        # 러너와 같은 큐 백엔드로 요청한다 - list, reliable, priority 는 같은 리스트에 LPUSH 한다
+        self.__queue = create_request_queue(self.__redis, queue_backend)
         self.__downloader = downloader
         self.__filename = filename
         self.__unique_key = unique_key
         self.__unique_key2 = unique_key2
-        self.__file_lock = builder.redis_lock(self.__redis, self.file_key)
 
     @property
     def filename(self):
@@ -64,17 +116,15 @@ class TranscriptionContext:
         return create_s3_file_key(self.filename, self.unique_key, self.unique_key2)
 
     def __enter__(self):
-        self.__file_lock.acquire()
         # self._upload_to_storage(self.filename, self.s3_file_key)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._cleanup_storage(self.s3_file_key)
-        self.__file_lock.release()
 
     def _upload_to_storage(self, local_filename, remote_filename):
         print(f'Upload - {remote_filename}')
-        self.__downloader.upload_file(local_filename, remote_filename)
+        self.__audio = upload_audio(self.__downloader, self.__preprocessor, local_filename, remote_filename)
 
     def _cleanup_storage(self, remote_filename):
         print(f'Cleanup - {remote_filename}')
@@ -92,53 +142,245 @@ class TranscriptionContext:
             pass
         return False
 
-    def _request_to_process(self, data_key: str, lang: Lang, vendor: Vendor):
-        pydict = {
-            'data_key': data_key,
-            's3_file_key': self.s3_file_key,
-            'file_key': self.file_key,
-            'lang': lang.value,
-            'vendor': vendor.value
-        }
-        self.__redis.lpush('trans-broker-queue', json.dumps(pydict))
+    def _request_to_process(self, data_key: str, lang: Lang, vendor: Vendor, priority: int = PRIORITY_NORMAL, trace_id: str = None):
+        # 이 컨텍스트에서 업로드하지 않은 파일은 원본 그대로 올라간 것으로 본다
+        audio = self.__audio or AudioPreprocessor.probe(self.filename)
+        self.__queue.push(create_request(data_key, self.s3_file_key, self.file_key, lang, vendor, audio.media_format, priority, audio.duration, trace_id))
 
     def _wait_for_response(self, key, timeout=60):
-        # 값 폴링
-        for _ in range(timeout):
-            if key in self.__redis:
-                break
-            time.sleep(1)
+        # 완료 신호 대기
+        wait_for_reply(self.__redis, key, timeout)
         data = self.__redis.get(key)
         return data if data else b''
 
     def _hit(self, data_key):
         return self.__redis.get(data_key)
 
-    def transcribe(self, vendor: Vendor = Vendor.AWS, lang: Lang = Lang.LANG_KO) -> Transcription:
-        # 음성 변환 결과에 대한 락 - 동일한 오디오 파일, 동일한 언어, 동일한 벤더의 결과의 요청에 대해서 대기한다.
-        # 락의 최대 대기 시간은 20분이다.
+    def _cache_key(self, lang: Lang, vendor: Vendor):
+        # 같은 컨텍스트에서는 파일 해시를 한번만 계산한다
+        if self.__content_hash is None:
+            self.__content_hash = hash_file(self.filename)
+        return create_cache_key(self.__content_hash, lang, vendor)
+
+    def partial(self, vendor: Vendor = Vendor.AWS, lang: Lang = Lang.LANG_KO) -> Union[Transcription, None]:
+        # 완료된 결과가 있으면 완료된 결과를, 아니면 지금까지 인식된 앞부분의 결과를 반환한다 (긴 오디오를 나눠서 인식하는 경우)
+        data_key = create_data_key(self.filename, self.unique_key, lang, vendor)
+        result = self._hit(data_key) or self.__redis.get(create_partial_key(data_key))
+        return Transcription.loads(result) if result else None
+
+    def transcribe(self, vendor: Vendor = Vendor.AWS, lang: Lang = Lang.LANG_KO, priority: int = PRIORITY_NORMAL) -> Transcription:
+        # 동일한 오디오 파일, 동일한 언어, 동일한 벤더의 요청은 하나로 합쳐진다.
+        # 먼저 claim 한 클라이언트만 업로드와 요청을 하고, 나머지는 락 없이 완료 신호를 기다린다.
         data_key = create_data_key(self.filename, self.unique_key, lang, vendor)
-        with self.__builder.redis_lock(self.__redis, data_key, expire=60 * 20):
-            # 음성 변환 결과에 대한 락이 풀리고 결과가 이미 hit 됬는지 확인 하고 hit 됬다면 바로 반환
-            result = self._hit(data_key)
-            if result:
-                return Transcription.from_json(json.loads(result.decode()))
+        trace = Trace(vendor=vendor.value).mark('started')
+        try:
+            return self.__transcribe(data_key, vendor, lang, priority, trace)
+        finally:
+            if self.__tracing:
+                trace.flush(self.__redis)
+
+    def __transcribe(self, data_key: str, vendor: Vendor, lang: Lang, priority: int, trace: Trace, timeout=60) -> Transcription:
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while True:
+            status, result = claim_request(self.__redis, data_key, owner, self.FLIGHT_TTL)
+            trace.mark('claimed')
+            if status == CLAIM_HIT:
+                return Transcription.loads(result)
+            if status == CLAIM_CLAIMED:
+                return self.__request(data_key, owner, vendor, lang, priority, trace, max(0, deadline - time.monotonic()))
+
+            # 진행중인 요청에 합류 - 완료 신호를 받으면 다시 claim 해서 결과를 가져온다
+            # 주인이 요청하지 못하고 끝났다면 다시 claim 할 때 주인이 된다
+            if not wait_for_reply(self.__redis, data_key, max(0, deadline - time.monotonic())):
+                # 주인이 결과를 기다리다 끝난 경우와 같이 처리한다
+                return Transcription.loads(self.__redis.get(data_key) or b'')
+
+    def __request(self, data_key: str, owner: str, vendor: Vendor, lang: Lang, priority: int, trace: Trace, timeout) -> Transcription:
+        enqueued = False
+        try:
+            # 같은 내용의 오디오가 이미 인식되었다면 캐시 결과를 data_key 에도 기록하고 반환
+            cache_key = self._cache_key(lang, vendor) if self.__cache else None
+            if cache_key:
+                result = self.__cache.get(cache_key)
+                if result:
+                    self.__cache.put_for(data_key, result)
+                    return Transcription.loads(result)
 
             # hit 되지 않으므로 인식 요청을 수행
-            if not self._check_storage(self.s3_file_key):
+            uploaded = self._check_storage(self.s3_file_key)
+            trace.mark('checked')
+            if not uploaded:
                 # 인식 요청 수행 전 인식 할 파일이 있는지 확인
                 self._upload_to_storage(self.filename, self.s3_file_key)
+                trace.mark('uploaded')
 
             # 음성 인식 수행
-            self._request_to_process(data_key, lang, vendor)
-            return Transcription.from_json(json.loads(self._wait_for_response(data_key).decode()))
+            self._request_to_process(data_key, lang, vendor, priority, trace.trace_id if self.__tracing else None)
+            enqueued = True
+            trace.mark('enqueued')
+            result = self._wait_for_response(data_key, timeout)
+            trace.mark('completed')
+            if cache_key:
+                self.__cache.put(cache_key, result)
+            return Transcription.loads(result)
+        finally:
+            if not enqueued:
+                # 요청하지 않고 끝났다면 (캐시 hit, 업로드 실패) 진행중 표시를 지우고 합류한 클라이언트를 깨운다
+                release_request(self.__redis, data_key, owner)
+
+
+class TranscriptionItem(NamedTuple):
+    filename: str
+    unique_key: str
+    vendor: Vendor = Vendor.AWS
+    lang: Lang = Lang.LANG_KO
+    priority: int = PRIORITY_NORMAL
 
 
 class TranscriptionBroker:
-    def __init__(self, builder: RedisBuilder, downloader: BaseDownloader):
+    def __init__(self, builder: RedisBuilder, downloader: BaseDownloader, cache: TranscriptionCache = None, preprocessor: AudioPreprocessor = None, tracing=False, queue_backend='list'):
         self.__builder = builder
         self.__downloader = downloader
+        self.__cache = cache
+        self.__preprocessor = preprocessor
+        self.__tracing = tracing
+        self.__queue_backend = queue_backend
 
     def with_file(self, filename: str, unique_key: str) -> TranscriptionContext:
-        unique_key2 = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        return TranscriptionContext(self.__builder, self.__downloader, filename, unique_key, unique_key2)
+        unique_key2 = create_unique_key2()
+        return TranscriptionContext(self.__builder, self.__downloader, filename, unique_key, unique_key2, self.__cache, self.__preprocessor, self.__tracing, self.__queue_backend)
+
+    def __load(self, data: Union[bytes, None]) -> Union[Transcription, None]:
+        return Transcription.loads(data) if data else None
+
+    def __upload(self, filename: str, s3_file_key: str) -> PreprocessedAudio:
+        try:
+            if self.__downloader.check_file(s3_file_key):
+                return AudioPreprocessor.probe(filename)
+        except:
+            pass
+        print(f'Upload - {s3_file_key}')
+        return upload_audio(self.__downloader, self.__preprocessor, filename, s3_file_key)
+
+    def __cleanup(self, s3_file_key: str):
+        print(f'Cleanup - {s3_file_key}')
+        try:
+            self.__downloader.delete_file(s3_file_key)
+        except:
+            # 파일 삭제 예외 무시
+            pass
+
+    def transcribe_many(self, items: Iterable[TranscriptionItem], timeout=60, as_completed=False, max_uploads=8) -> Union[List[Union[Transcription, None]], Iterator[Tuple[int, Union[Transcription, None]]]]:
+        """
+        여러 파일/벤더의 음성인식을 한번에 요청한다.
+        - 결과 확인(캐시 포함)은 하나의 파이프라인으로, 업로드는 동시에, 요청은 한번의 LPUSH 로 수행하고 결과를 함께 기다린다.
+        - as_completed=False 이면 items 순서대로 결과 목록을, True 이면 완료되는 순서대로 (인덱스, 결과)를 반환한다.
+        - 실패하거나 timeout 안에 완료되지 않은 결과는 None 이다.
+        """
+        items = list(items)
+        results = self.__transcribe_many(items, timeout, max_uploads)
+        if as_completed:
+            return results
+        ordered = [None] * len(items)
+        for index, transcription in results:
+            ordered[index] = transcription
+        return ordered
+
+    def __transcribe_many(self, items: List[TranscriptionItem], timeout, max_uploads):
+        redis = self.__builder.redis()
+        unique_key2 = create_unique_key2()
+        data_keys = [create_data_key(item.filename, item.unique_key, item.lang, item.vendor) for item in items]
+
+        # 같은 data_key 를 가진 항목은 한번만 요청한다
+        indexes = {}
+        for index, data_key in enumerate(data_keys):
+            indexes.setdefault(data_key, []).append(index)
+        keys = list(indexes)
+
+        hits = redis.mget(keys)
+
+        content_hashes = {}
+        cache_keys = {}
+        missed = {}
+        for data_key, hit in zip(keys, hits):
+            item = items[indexes[data_key][0]]
+            if not hit and self.__cache:
+                if item.filename not in content_hashes:
+                    content_hashes[item.filename] = hash_file(item.filename)
+                cache_keys[data_key] = create_cache_key(content_hashes[item.filename], item.lang, item.vendor)
+            if hit:
+                for index in indexes[data_key]:
+                    yield index, self.__load(hit)
+            else:
+                missed[data_key] = item
+
+        if cache_keys:
+            with redis.pipeline(transaction=False) as pipe:
+                for cache_key in cache_keys.values():
+                    self.__cache.get(cache_key, client=pipe)
+                cached = dict(zip(cache_keys, pipe.execute()))
+            for data_key, result in cached.items():
+                if result:
+                    self.__cache.put_for(data_key, result)
+                    missed.pop(data_key)
+                    for index in indexes[data_key]:
+                        yield index, self.__load(result)
+
+        if not missed:
+            return
+
+        # 다른 클라이언트가 이미 요청한 항목은 요청하지 않고 완료 신호만 기다린다
+        owner = uuid.uuid4().hex
+        claim = redis.register_script(CLAIM_SCRIPT)
+        with redis.pipeline(transaction=False) as pipe:
+            for data_key in missed:
+                claim(keys=claim_keys(data_key), args=[owner, TranscriptionContext.FLIGHT_TTL], client=pipe)
+            claims = [parse_claim(reply) for reply in pipe.execute()]
+        owned = {}
+        for (data_key, item), (status, result) in list(zip(missed.items(), claims)):
+            if status == CLAIM_HIT:
+                missed.pop(data_key)
+                for index in indexes[data_key]:
+                    yield index, self.__load(result)
+            elif status == CLAIM_CLAIMED:
+                owned[data_key] = item
+
+        files = {}
+        for item in owned.values():
+            files[(item.filename, item.unique_key)] = create_s3_file_key(item.filename, item.unique_key, unique_key2)
+
+        enqueued = False
+        try:
+            # 인식 할 파일들을 동시에 업로드
+            with ThreadPoolExecutor(max_workers=max_uploads) as executor:
+                audios = dict(zip(files, executor.map(lambda file: self.__upload(file[0][0], file[1]), files.items())))
+
+            # 모든 요청을 한번에 추가
+            requests = []
+            for data_key, item in owned.items():
+                audio = audios[(item.filename, item.unique_key)]
+                requests.append(create_request(data_key, files[(item.filename, item.unique_key)], create_file_key(item.filename, item.unique_key), item.lang, item.vendor,
+                                               audio.media_format, item.priority, audio.duration))
+            if requests:
+                create_request_queue(redis, self.__queue_backend).push(*requests)
+            enqueued = True
+
+            # 완료되는 순서대로 결과 반환
+            for data_key in wait_for_replies(redis, missed, timeout):
+                result = redis.get(data_key)
+                if self.__cache and data_key in cache_keys:
+                    self.__cache.put(cache_keys[data_key], result)
+                missed.pop(data_key)
+                for index in indexes[data_key]:
+                    yield index, self.__load(result)
+
+            for data_key in missed:
+                for index in indexes[data_key]:
+                    yield index, None
+        finally:
+            if not enqueued:
+                for data_key in owned:
+                    release_request(redis, data_key, owner)
+            for s3_file_key in files.values():
+                self.__cleanup(s3_file_key)
@@ -1,5 +1,6 @@
 from .mixin import YamlMixin, EnvVarMixin, KwargsMixin
 from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
 
 import os
 import logging
@@ -20,10 +21,28 @@ class AwsConfig(EnvVarMixin, YamlMixin, KwargsMixin):
         }
 
 
-class ClovaNestConfig(EnvVarMixin, YamlMixin, KwargsMixin):
+class AwsTrackerConfig(EnvVarMixin, YamlMixin):
+    enabled: bool = False
+    min_delay: float = 2
+    max_delay: float = 30
+    # 오디오 1초를 처리하는데 걸리는 예상 시간(초)
+    speed: float = 0.3
+
+    @property
+    def kwargs(self):
+        return {'min_delay': self.min_delay, 'max_delay': self.max_delay, 'speed': self.speed}
+
+
+class ClovaNestConfig(EnvVarMixin, YamlMixin):
     invoke_url: str
     secret_key: str
     callback: str
+    # False 면 웹훅 없이 결과를 기다린다 - 러너가 결과를 직접 기록하므로 다른 벤더와 서로 백업(hedging)이 될 수 있다
+    webhook: bool = True
+
+    @property
+    def kwargs(self):
+        return {'invoke_url': self.invoke_url, 'secret_key': self.secret_key, 'callback': self.callback if self.webhook else None}
 
 
 class RedisConfig(EnvVarMixin, YamlMixin, KwargsMixin):
@@ -32,6 +51,18 @@ class RedisConfig(EnvVarMixin, YamlMixin, KwargsMixin):
     db: int
 
 
+class RedisPoolConfig(EnvVarMixin, YamlMixin, KwargsMixin):
+    # 커넥션이 모두 사용중이면 timeout 동안 빈 커넥션을 기다린다
+    max_connections: int = 64
+    timeout: int = 5
+
+
+class ResultConfig(EnvVarMixin, YamlMixin):
+    # Redis 에 저장하는 음성인식 결과 포맷 - json: 기존 포맷, binary: 압축된 바이너리 포맷
+    # 읽는 쪽은 두 포맷을 모두 읽으므로, 모든 클라이언트를 배포한 뒤 binary 로 바꾼다
+    format: str = 'json'
+
+
 class LoggerConfig(EnvVarMixin, YamlMixin):
     filename: str = 'logs/asr-broker.log'
     format: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -50,6 +81,135 @@ class LoggerConfig(EnvVarMixin, YamlMixin):
 
 class ExecutorConfig(EnvVarMixin, YamlMixin, KwargsMixin):
     max_request: int
+    # 벤더(aw, cn)별 최대 동시 요청 수 - 없는 벤더는 max_request 까지 사용한다
+    vendor_limits: Dict[str, int] = {}
+
+
+class TransportConfig(EnvVarMixin, YamlMixin):
+    # 비어있으면 executor.max_request 를 사용한다
+    pool_size: Optional[int] = None
+    retries: int = 3
+    backoff_factor: float = 0.5
+
+
+class QueueConfig(EnvVarMixin, YamlMixin):
+    backend: str = 'list'
+    consumer: Optional[str] = None
+    batch_size: int = 32
+    timeout: int = 1
+    # priority 백엔드 - 오디오 1초당 늦춰지는 시간(초), 우선순위 1당 앞당겨지는 시간(초), 최대로 늦춰지는 시간(초)
+    duration_weight: float = 1.0
+    priority_boost: float = 600
+    max_penalty: float = 3600
+    # stream 백엔드 - 컨슈머 그룹, 스트림 최대 길이, 다른 컨슈머의 요청을 회수하는 유휴 시간(초)과 확인 주기(초)
+    # 러너는 claim_idle / 3 마다 처리중인 요청을 갱신하므로, claim_idle 은 poll 루프 한번(queue.timeout)보다 충분히 길어야 한다
+    group: str = 'trans-broker'
+    maxlen: int = 100000
+    claim_idle: float = 60 * 30
+    claim_interval: float = 30
+    # reliable/priority/stream 백엔드 - 러너의 heartbeat 유효 시간(초), 끊긴 러너의 처리중인 요청을 다른 러너가 되돌린다
+    # consumer 를 지정하지 않으면 호스트 이름, pid, 임의의 값으로 정한다 - 지정한다면 러너마다 달라야 한다
+    heartbeat_ttl: float = 60
+
+    @property
+    def kwargs(self):
+        kwargs = {'backend': self.backend, 'consumer': self.consumer, 'batch_size': self.batch_size, 'timeout': self.timeout}
+        if self.backend == 'priority':
+            kwargs.update({'duration_weight': self.duration_weight, 'priority_boost': self.priority_boost, 'max_penalty': self.max_penalty})
+        elif self.backend == 'stream':
+            kwargs.update({'group': self.group, 'maxlen': self.maxlen, 'claim_idle': self.claim_idle, 'claim_interval': self.claim_interval})
+        if self.backend != 'list':
+            kwargs['heartbeat_ttl'] = self.heartbeat_ttl
+        return kwargs
+
+
+class RunnerConfig(EnvVarMixin, YamlMixin):
+    # thread: ParallelExecutor 기반, asyncio: 이벤트 루프 기반
+    engine: str = 'thread'
+    max_in_flight: int = 3000
+    # SIGTERM 을 받으면 실행중인 요청을 기다리는 시간(초) - 남은 요청은 큐로 되돌리고 벤더 작업은 다른 러너가 이어받는다
+    drain_timeout: float = 60
+
+
+class ChunkingConfig(EnvVarMixin, YamlMixin):
+    # 긴 WAV 를 침묵 지점에서 나눠서 동시에 인식한다 (웹훅을 사용하지 않는 벤더만)
+    enabled: bool = False
+    chunk_seconds: float = 300
+    overlap_seconds: float = 2
+    search_seconds: float = 10
+    min_seconds: float = 600
+    # 요청 하나의 동시 조각 수
+    max_parallel: int = 8
+
+    @property
+    def kwargs(self):
+        return {key: value for key, value in self.__dict__.items() if key != 'enabled'}
+
+
+class HedgingConfig(EnvVarMixin, YamlMixin):
+    # 요청된 벤더가 느리면 다른 벤더에도 요청하고 먼저 끝난 결과를 사용한다 (웹훅을 사용하지 않는 벤더끼리만)
+    # thread 엔진에서만 사용할 수 있다 - asyncio 엔진에서 켜면 시작하지 않는다
+    enabled: bool = False
+    # 최근 지연 시간의 percentile 이 지나도 끝나지 않으면 백업 요청을 보낸다
+    percentile: float = 0.95
+    min_delay: float = 5
+    max_delay: float = 120
+    # 요청된 벤더의 상태 점수가 백업 벤더보다 이 배수 이상 나쁘면 백업 벤더에 먼저 요청한다
+    switch_ratio: float = 2
+    window: int = 100
+    min_samples: int = 10
+
+    @property
+    def kwargs(self):
+        return {'percentile': self.percentile, 'min_delay': self.min_delay, 'max_delay': self.max_delay, 'switch_ratio': self.switch_ratio}
+
+    @property
+    def health_kwargs(self):
+        return {'window': self.window, 'min_samples': self.min_samples}
+
+
+class VendorRateLimitConfig(YamlMixin, KwargsMixin):
+    # 초당 요청 수와 최대 순간 요청 수 - 비어있으면 제한하지 않는다
+    rate: Optional[float] = None
+    burst: Optional[int] = None
+    # 최대 동시 요청 수 - 비어있으면 제한하지 않는다
+    max_concurrent: Optional[int] = None
+    # 러너가 죽어서 반납되지 않은 슬롯은 이 시간(초)이 지나면 반납된다
+    slot_ttl: float = 3600
+
+
+class RateLimitConfig(EnvVarMixin, YamlMixin):
+    # 모든 러너가 Redis 로 공유하는 벤더(aw, cn)별 요청량 제한
+    enabled: bool = False
+    vendors: Dict[str, VendorRateLimitConfig] = {}
+    # 요청량 제한에 걸렸을 때의 재시도
+    max_retries: int = 5
+    base_delay: float = 1
+    max_delay: float = 30
+
+    @property
+    def kwargs(self):
+        return {'max_retries': self.max_retries, 'base_delay': self.base_delay, 'max_delay': self.max_delay}
+
+
+class MetricsConfig(EnvVarMixin, YamlMixin):
+    # Prometheus 지표 - 러너는 port 의 별도 HTTP 서버로, 웹훅은 /metrics 로 노출한다
+    enabled: bool = False
+    host: str = '0.0.0.0'
+    port: int = 9413
+
+
+class VendorsConfig(EnvVarMixin, YamlMixin):
+    # 이 러너가 처리하는 벤더(aw, cn) - 벤더 모듈과 클라이언트는 해당 벤더의 첫 요청에서 만들어진다
+    # 없는 벤더의 요청은 빈 결과로 끝나므로, 같은 큐를 사용하는 러너는 같은 벤더를 사용한다
+    enabled: List[str] = ['aw', 'cn']
+    # 시작하자마자 백그라운드에서 벤더를 만들어서 첫 요청이 기다리지 않게 한다
+    preload: bool = False
+
+
+class TracingConfig(EnvVarMixin, YamlMixin):
+    # 클라이언트가 추적을 요청한 요청의 단계별 시각을 Redis 스트림(trans-trace)에 기록한다
+    enabled: bool = False
 
 
 class CacheConfig(EnvVarMixin, YamlMixin):
@@ -58,10 +218,24 @@ class CacheConfig(EnvVarMixin, YamlMixin):
 
 class MainConfig(EnvVarMixin, YamlMixin):
     aws: AwsConfig
-    clova_nest: ClovaNestConfig
+    aws_tracker: AwsTrackerConfig = AwsTrackerConfig()
+    # vendors.enabled 에 cn 이 없으면 비워둘 수 있다
+    clova_nest: ClovaNestConfig = None
     redis: RedisConfig
+    # asyncio 엔진의 Redis 커넥션 풀
+    redis_pool: RedisPoolConfig = RedisPoolConfig()
     cache: CacheConfig
     executor: ExecutorConfig
+    transport: TransportConfig = TransportConfig()
+    queue: QueueConfig = QueueConfig()
+    runner: RunnerConfig = RunnerConfig()
+    chunking: ChunkingConfig = ChunkingConfig()
+    hedging: HedgingConfig = HedgingConfig()
+    rate_limit: RateLimitConfig = RateLimitConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    tracing: TracingConfig = TracingConfig()
+    result: ResultConfig = ResultConfig()
+    vendors: VendorsConfig = VendorsConfig()
     logger: LoggerConfig
 
 
@@ -73,4 +247,8 @@ class WebHookConfig(EnvVarMixin, YamlMixin, KwargsMixin):
 class WebHookMainConfig(EnvVarMixin, YamlMixin):
     webhook: WebHookConfig
     redis: RedisConfig
+    redis_pool: RedisPoolConfig = RedisPoolConfig()
+    result: ResultConfig = ResultConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    tracing: TracingConfig = TracingConfig()
     logger: LoggerConfig
@@ -1,21 +1,35 @@
 import datetime
 import os
+import threading
 
-import boto3
 import logging
 
+from transport import Transport
+
 from .base_downloader import BaseDownloader
 
 logging.getLogger('urllib3').setLevel(logging.CRITICAL)
 
 
 class AwsS3Downloader(BaseDownloader):
-    def __init__(self, bucket_name, **aws_params):
+    def __init__(self, bucket_name, transport: Transport = None, **aws_params):
         self._bucket_name = bucket_name
-        self._s3 = boto3.client('s3',
-                                aws_access_key_id=aws_params['aws_access_key_id'],
-                                aws_secret_access_key=aws_params['aws_secret_access_key'],
-                                )
+        self._transport = transport
+        self._aws_params = aws_params
+        self._s3_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def _s3(self):
+        # S3 클라이언트는 처음 내려받거나 올릴 때 만든다 - 조각 인식을 쓰지 않는 러너는 boto3 를 불러오지 않는다
+        if self._s3_client is None:
+            with self._lock:
+                if self._s3_client is None:
+                    self._s3_client = (self._transport or Transport()).client('s3',
+                                                                              aws_access_key_id=self._aws_params['aws_access_key_id'],
+                                                                              aws_secret_access_key=self._aws_params['aws_secret_access_key'],
+                                                                              )
+        return self._s3_client
 
     def _process_downloading(self, src_path, download_path) -> str:
         with open(download_path, 'wb') as f:
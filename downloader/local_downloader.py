@@ -23,7 +23,7 @@ class LocalDownloader(BaseDownloader):
         shutil.copyfile(src_path, target_path)
 
     def _process_check(self, target_path) -> bool:
-        return os.path.exists(target_path)
+        return os.path.exists(os.path.join(self._video_storage_dir, target_path))
 
 
 def main():
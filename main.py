@@ -1,33 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 from redis import StrictRedis
+from redis.asyncio import StrictRedis as AsyncStrictRedis, BlockingConnectionPool as AsyncBlockingConnectionPool
 
 from config import MainConfig
-from downloader import AwsS3Downloader
-from transcribers import AwsTranscriber, ClovaNestTranscriber
+from downloader.base_downloader import BaseDownloader
+from transcribers import AsyncAwsTranscriber, AsyncTranscriberAdapter
 from transcribers.enums import Vendor
 
-from runner import ParallelExecutor, TranscriptionRequestRunner
+from runner import ParallelExecutor, TranscriptionRequestRunner, AsyncTranscriptionRequestRunner, VendorRegistry
+from runner.hedging import HedgedTranscriber, VendorHealth
+from runner.ratelimit import RedisRateLimiter, RateLimitedTranscriber
+from messaging import create_request_queue
+from monitoring import RunnerCollector, start_metrics_server
+from transcription_cache import TranscriptionCache
 
 import click
+import asyncio
 import logging
+import signal
+
+if TYPE_CHECKING:
+    # transport 는 requests 를 불러오므로 main 에서 만들 때 import 한다
+    from transport import Transport
+
+
+def with_rate_limit(config: MainConfig, redis: StrictRedis, vendor: Vendor, transcriber):
+    # 설정된 벤더만 모든 러너가 공유하는 요청량 제한을 적용한다
+    limit = config.rate_limit.vendors.get(vendor.value)
+    if not config.rate_limit.enabled or limit is None:
+        return transcriber
+    return RateLimitedTranscriber(transcriber, RedisRateLimiter(redis, vendor.value, **limit.kwargs), **config.rate_limit.kwargs)
+
+
+def create_vendor_registry(config: MainConfig, redis: StrictRedis, transport: 'Transport', downloader: BaseDownloader) -> VendorRegistry:
+    # 벤더 모듈은 factory 안에서 import 한다 - 사용하지 않는 벤더는 import 하지도, 클라이언트를 만들지도 않는다
+    registry = VendorRegistry(config.vendors.enabled)
+    asyncio_engine = config.runner.engine == 'asyncio'
+
+    def __aws():
+        from transcribers import AwsTranscriber
+        aws = AwsTranscriber(**config.aws.kwargs, transport=transport)
+        if config.aws_tracker.enabled:
+            aws.enable_tracker(**config.aws_tracker.kwargs)
+        transcriber = with_rate_limit(config, redis, Vendor.AWS, aws)
+        if config.chunking.enabled:
+            from runner.chunking import ChunkedTranscriber
+            transcriber = ChunkedTranscriber(transcriber, downloader, config.cache.dirpath, **config.chunking.kwargs)
+        if asyncio_engine:
+            if transcriber is aws:
+                return AsyncAwsTranscriber(aws)
+            # 요청량 제한과 조각 인식은 동기 구현만 있으므로, 켜져 있다면 ClovaNest 와 같이 스레드 풀에서 실행한다
+            return AsyncTranscriberAdapter(transcriber, ThreadPoolExecutor(config.executor.max_request))
+        return transcriber
+
+    def __clova_nest():
+        from transcribers import ClovaNestTranscriber
+        transcriber = with_rate_limit(config, redis, Vendor.ClovaNest, ClovaNestTranscriber(**{**config.clova_nest.kwargs, **config.aws.kwargs}, transport=transport))
+        if asyncio_engine:
+            # ClovaNest 는 비동기 구현이 없으므로 기존과 같은 크기의 스레드 풀에서 실행한다
+            return AsyncTranscriberAdapter(transcriber, ThreadPoolExecutor(config.executor.max_request))
+        return transcriber
+
+    registry.register(Vendor.AWS, __aws)
+    registry.register(Vendor.ClovaNest, __clova_nest, use_webhook=config.clova_nest is None or config.clova_nest.webhook)
+    # 설정 오류는 첫 요청이 아니라 시작할 때 알린다
+    if Vendor.ClovaNest in registry and config.clova_nest is None:
+        raise ValueError('clova_nest config is required when vendors.enabled has cn.')
+    return registry
+
+
+def with_hedging(config: MainConfig, registry: VendorRegistry, executor: ParallelExecutor) -> VendorRegistry:
+    # 웹훅을 사용하지 않는 벤더끼리만 서로의 백업이 된다 - 백업 벤더는 처음 백업 요청을 보낼 때 만들어진다
+    sync_vendors = [vendor for vendor in registry if not registry.use_webhook(vendor)]
+    if len(sync_vendors) < 2:
+        logging.warning('Hedging needs at least two vendors without webhook. Set clova_nest.webhook to false to hedge between AWS and ClovaNest.')
+    health = {vendor: VendorHealth(**config.hedging.health_kwargs) for vendor in sync_vendors}
+    backups = registry.view(sync_vendors)
+    hedged = VendorRegistry()
+    for vendor in registry:
+        if vendor in health:
+            # 첫 요청은 러너가 자리를 준 요청이므로, 풀은 벤더의 동시 요청 수 제한보다 클 필요가 없다
+            max_parallel = executor.vendor_limits.get(vendor.value, executor.max_request)
+            hedged.register(vendor, lambda vendor=vendor, max_parallel=max_parallel: HedgedTranscriber(vendor, backups, health, executor, **config.hedging.kwargs, max_parallel=max_parallel))
+        else:
+            hedged.register(vendor, lambda vendor=vendor: registry[vendor][1], registry.use_webhook(vendor))
+    return hedged
+
+
+async def poll_until_stopped(runner: AsyncTranscriptionRequestRunner):
+    # 종료 시그널을 받으면 새 요청을 꺼내지 않고 실행중인 요청을 정리한 뒤 끝난다
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, runner.stop)
+    await runner.poll()
 
 
 @click.command()
 @click.option('-c', '--config_path', default='config/config-local.yml', help='config yaml file path', show_default=True)
 def main(config_path: str):
+    # boto3 는 벤더나 S3 클라이언트를 처음 만들 때 불러온다
+    from downloader import AwsS3Downloader
+    from transport import Transport
+
     config = MainConfig.load_from_yml(config_path)
     config.logger.setup()
+    # hedging 은 ParallelExecutor 로 백업 요청의 자리를 얻으므로 thread 엔진에서만 사용할 수 있다 - 조용히 무시하지 않고 시작할 때 알린다
+    if config.runner.engine == 'asyncio' and config.hedging.enabled:
+        raise ValueError('hedging.enabled is not supported with runner.engine asyncio. Use the thread engine or disable hedging.')
     redis = StrictRedis(**config.redis.kwargs)
-    downloader = AwsS3Downloader(config.aws.bucket, **config.aws.session_param)
-    executor = ParallelExecutor(**config.executor.kwargs)
-
-    transcribers = {
-        Vendor.AWS: (False, AwsTranscriber(**config.aws.kwargs)),
-        Vendor.ClovaNest: (True, ClovaNestTranscriber(**{**config.clova_nest.kwargs, **config.aws.kwargs}))
-    }
+    # 모든 벤더가 커넥션 풀을 공유하고, 풀 크기는 동시 요청 수에 맞춘다
+    transport = Transport(config.transport.pool_size or config.executor.max_request, config.transport.retries, config.transport.backoff_factor)
+    downloader = AwsS3Downloader(config.aws.bucket, transport=transport, **config.aws.session_param)
+    queue = create_request_queue(redis, **config.queue.kwargs)
+    transcribers = create_vendor_registry(config, redis, transport, downloader)
 
-    logging.info('Starting Insight-ASR broker')
-    runner = TranscriptionRequestRunner(redis, transcribers, executor, downloader, config.cache.dirpath)
-    runner.poll()
+    logging.info(f'Starting Insight-ASR broker. Vendors={[vendor.value for vendor in transcribers]}')
+    if config.vendors.preload:
+        transcribers.preload()
+    if config.runner.engine == 'asyncio':
+        # 동시에 실행하는 요청 수(max_in_flight)보다 커넥션이 적으므로, 커넥션이 모두 사용중이면 오류 대신 빈 커넥션을 기다린다
+        async_redis = AsyncStrictRedis(connection_pool=AsyncBlockingConnectionPool(**config.redis.kwargs, **config.redis_pool.kwargs))
+        runner = AsyncTranscriptionRequestRunner(async_redis, transcribers, queue, config.runner.max_in_flight, result_format=config.result.format, tracing=config.tracing.enabled,
+                                                 drain_timeout=config.runner.drain_timeout)
+        if config.metrics.enabled:
+            collector = RunnerCollector(redis, queue, transport=transport, cache=TranscriptionCache(redis), in_flight=lambda: runner.in_flight)
+            start_metrics_server(config.metrics.port, config.metrics.host, collector)
+        asyncio.run(poll_until_stopped(runner))
+    else:
+        executor = ParallelExecutor(**config.executor.kwargs)
+        if config.hedging.enabled:
+            transcribers = with_hedging(config, transcribers, executor)
+        runner = TranscriptionRequestRunner(redis, transcribers, executor, downloader, config.cache.dirpath, queue=queue, result_format=config.result.format, tracing=config.tracing.enabled,
+                                            drain_timeout=config.runner.drain_timeout)
+        if config.metrics.enabled:
+            collector = RunnerCollector(redis, queue, executor, [vendor.value for vendor in transcribers], transport, TranscriptionCache(redis))
+            start_metrics_server(config.metrics.port, config.metrics.host, collector)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: runner.stop())
+        runner.poll()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,6 @@
+from .queues import BROKER_QUEUE, PRIORITY_NORMAL, PRIORITY_INTERACTIVE, QueueItem, RequestQueue, ListRequestQueue, ReliableRequestQueue, PriorityRequestQueue, StreamRequestQueue, create_request_queue
+from .reply import CLAIM_HIT, CLAIM_CLAIMED, CLAIM_JOINED, create_reply_key, create_partial_key, create_webhook_key, create_inflight_key, claim_request, release_request, claim_request_async, release_request_async, publish_result, publish_result_async, wait_for_reply, wait_for_reply_async, wait_for_replies, AsyncReplyWaiter
+
+__all__ = ('BROKER_QUEUE', 'PRIORITY_NORMAL', 'PRIORITY_INTERACTIVE', 'QueueItem', 'RequestQueue', 'ListRequestQueue', 'ReliableRequestQueue', 'PriorityRequestQueue', 'StreamRequestQueue', 'create_request_queue',
+           'CLAIM_HIT', 'CLAIM_CLAIMED', 'CLAIM_JOINED', 'create_reply_key', 'create_partial_key', 'create_webhook_key', 'create_inflight_key', 'claim_request', 'release_request', 'claim_request_async', 'release_request_async',
+           'publish_result', 'publish_result_async', 'wait_for_reply', 'wait_for_reply_async', 'wait_for_replies', 'AsyncReplyWaiter')
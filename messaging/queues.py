@@ -0,0 +1,526 @@
+import abc
+import os
+import socket
+import time
+import uuid
+
+from typing import Any, List, NamedTuple, Union
+
+import orjson
+
+from redis import StrictRedis
+from redis.exceptions import ResponseError
+
+
+BROKER_QUEUE = 'trans-broker-queue'
+
+# 요청 우선순위 - 사용자가 기다리는 요청은 PRIORITY_INTERACTIVE 로 요청한다
+PRIORITY_NORMAL = 0
+PRIORITY_INTERACTIVE = 1
+
+
+class QueueItem(NamedTuple):
+    payload: bytes
+    receipt: Any = None
+
+
+def _enqueued_at(payload: Union[bytes, None]) -> Union[float, None]:
+    try:
+        return float(orjson.loads(payload)['enqueued_at'])
+    except Exception:
+        return None
+
+
+def create_consumer_name() -> str:
+    # 같은 호스트에서 여러 러너를 실행해도 처리중 리스트와 스트림 컨슈머가 겹치지 않도록 pid 와 임의의 값을 붙인다
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class RequestQueue(metaclass=abc.ABCMeta):
+    """
+    러너가 요청을 꺼내는 큐.
+    처리중인 요청을 컨슈머별로 들고 있는 백엔드는 {name}:heartbeat:{consumer} 키를 heartbeat_ttl 초마다 갱신하고 {name}:consumers 에 컨슈머를 등록한다.
+    recover 는 heartbeat 가 끊긴 (죽은) 컨슈머의 처리중인 요청만 되돌리므로, 살아있는 러너의 요청을 가져오지 않는다.
+    """
+
+    def __init__(self, redis: StrictRedis, name: str = BROKER_QUEUE, consumer: str = None, batch_size: int = 1, timeout: int = 1, heartbeat_ttl: float = 60):
+        self._redis = redis
+        self._name = name
+        self._consumer = consumer or create_consumer_name()
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._consumers = f'{name}:consumers'
+        self._heartbeat_ttl = heartbeat_ttl
+        self._beat_at = 0.0
+        self._recovered = False
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def consumer(self):
+        return self._consumer
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @abc.abstractmethod
+    def push(self, *payloads):
+        pass
+
+    async def push_async(self, *payloads):
+        # redis.asyncio 클라이언트로 만든 큐에서 사용한다 - 클라이언트가 요청을 넣는 쪽은 리스트 큐 모두 LPUSH 이다
+        await self._redis.lpush(self._name, *payloads)
+
+    @abc.abstractmethod
+    def pop(self, count: int = None) -> List[QueueItem]:
+        pass
+
+    def ack(self, item: QueueItem):
+        pass
+
+    def requeue(self, item: QueueItem):
+        # 러너가 멈추면서 처리하지 못한 요청을 큐의 맨 앞(꺼내는 쪽)으로 되돌린다 - 먼저 들어온 요청이 뒤로 밀리지 않는다
+        self._redis.rpush(self._name, item.payload)
+        self.ack(item)
+
+    def defer(self, item: QueueItem):
+        # 벤더가 바빠서 지금 처리할 수 없는 요청을 큐의 뒤로 보낸다 - 다른 벤더의 요청을 먼저 꺼낼 수 있다
+        self._redis.lpush(self._name, item.payload)
+        self.ack(item)
+
+    def _heartbeat_key(self, consumer: str) -> str:
+        return f'{self._name}:heartbeat:{consumer}'
+
+    def heartbeat(self):
+        self._beat_at = time.monotonic()
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._heartbeat_key(self._consumer), 1, px=int(self._heartbeat_ttl * 1000))
+            pipe.sadd(self._consumers, self._consumer)
+            pipe.execute()
+
+    def dead_consumers(self) -> List[str]:
+        consumers = [consumer.decode() for consumer in self._redis.smembers(self._consumers)]
+        consumers = [consumer for consumer in consumers if consumer != self._consumer]
+        if not consumers:
+            return []
+        with self._redis.pipeline(transaction=False) as pipe:
+            for consumer in consumers:
+                pipe.exists(self._heartbeat_key(consumer))
+            alive = pipe.execute()
+        return [consumer for consumer, exists in zip(consumers, alive) if not exists]
+
+    def _recover_consumer(self, consumer: str) -> int:
+        # 컨슈머가 처리하던 요청을 되돌리고, 되돌린 요청 수를 반환한다
+        return 0
+
+    def recover(self) -> int:
+        # 자신의 heartbeat 를 먼저 남겨서, 동시에 시작한 다른 러너가 자신을 죽은 컨슈머로 보지 않게 한다
+        self.heartbeat()
+        count = 0
+        if not self._recovered:
+            # 처음에는 같은 이름으로 실행했던 이전 러너의 요청도 되돌린다 - consumer 를 지정하지 않았다면 새 이름이므로 비어있다
+            self._recovered = True
+            count += self._recover_consumer(self._consumer)
+        for consumer in self.dead_consumers():
+            count += self._recover_consumer(consumer)
+            self._redis.srem(self._consumers, consumer)
+        return count
+
+    def keepalive(self, items: List[QueueItem]):
+        # 러너가 poll 루프마다 처리중인 요청으로 호출한다 - heartbeat 를 갱신하고, 그 사이에 죽은 러너의 요청을 되돌린다
+        if time.monotonic() - self._beat_at >= self._heartbeat_ttl / 3:
+            self.recover()
+
+    def depth(self) -> int:
+        return self._redis.llen(self._name)
+
+    def oldest(self) -> Union[float, None]:
+        # 가장 오래 기다린 요청의 enqueued_at - 꺼내는 쪽 끝의 요청
+        return _enqueued_at(self._redis.lindex(self._name, -1))
+
+
+class ListRequestQueue(RequestQueue):
+    """기존 방식의 큐 - LPOP 으로 하나씩 꺼내고, 비어있으면 timeout 만큼 쉰다."""
+
+    def push(self, *payloads):
+        self._redis.lpush(self._name, *payloads)
+
+    def pop(self, count: int = None) -> List[QueueItem]:
+        payload = self._redis.lpop(self._name)
+        if not payload:
+            time.sleep(self._timeout)
+            return []
+        return [QueueItem(payload)]
+
+    # LPOP 으로 꺼내므로 꺼내는 쪽은 왼쪽이다
+    def requeue(self, item: QueueItem):
+        self._redis.lpush(self._name, item.payload)
+
+    def defer(self, item: QueueItem):
+        self._redis.rpush(self._name, item.payload)
+
+    # 꺼낸 요청을 들고 있지 않으므로 되돌릴 요청도, 갱신할 heartbeat 도 없다
+    def recover(self) -> int:
+        return 0
+
+    def keepalive(self, items: List[QueueItem]):
+        pass
+
+
+class ReliableRequestQueue(RequestQueue):
+    """
+    BRPOPLPUSH 로 요청을 러너별 처리중(in-flight) 리스트로 옮기며 꺼내는 큐.
+    요청은 결과가 기록된 뒤 ack 될 때 처리중 리스트에서 지워지므로, 러너가 죽어도 요청이 사라지지 않는다.
+    """
+
+    # 블로킹 pop 이후 큐에 남은 요청을 batch 만큼 한번에 옮긴다
+    POP_SCRIPT = """
+    local items = {}
+    for i = 1, tonumber(ARGV[1]) do
+        local item = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+        if not item then
+            break
+        end
+        items[i] = item
+    end
+    return items
+    """
+
+    # 처리중 리스트의 요청을 큐의 맨 앞(꺼내는 쪽)으로 되돌린다
+    RECOVER_SCRIPT = """
+    local count = 0
+    local item = redis.call('LPOP', KEYS[1])
+    while item do
+        redis.call('RPUSH', KEYS[2], item)
+        count = count + 1
+        item = redis.call('LPOP', KEYS[1])
+    end
+    return count
+    """
+
+    def __init__(self, redis: StrictRedis, name: str = BROKER_QUEUE, consumer: str = None, batch_size: int = 32, timeout: int = 1, heartbeat_ttl: float = 60):
+        super().__init__(redis, name, consumer, batch_size, timeout, heartbeat_ttl)
+        self._processing = self._processing_key(self._consumer)
+        self._pop_script = redis.register_script(self.POP_SCRIPT)
+        self._recover_script = redis.register_script(self.RECOVER_SCRIPT)
+
+    def _processing_key(self, consumer: str) -> str:
+        return f'{self._name}:processing:{consumer}'
+
+    @property
+    def processing(self):
+        return self._processing
+
+    def push(self, *payloads):
+        self._redis.lpush(self._name, *payloads)
+
+    def pop(self, count: int = None) -> List[QueueItem]:
+        count = count or self._batch_size
+        payload = self._redis.brpoplpush(self._name, self._processing, self._timeout)
+        if not payload:
+            return []
+
+        items = [QueueItem(payload)]
+        if count > 1:
+            # 큐가 깊다면 남은 요청을 한번의 왕복으로 가져온다
+            items.extend(QueueItem(payload) for payload in self._pop_script(keys=[self._name, self._processing], args=[count - 1]))
+        return items
+
+    def ack(self, item: QueueItem):
+        self._redis.lrem(self._processing, 1, item.payload)
+
+    def requeue(self, item: QueueItem):
+        with self._redis.pipeline() as pipe:
+            pipe.rpush(self._name, item.payload)
+            pipe.lrem(self._processing, 1, item.payload)
+            pipe.execute()
+
+    def defer(self, item: QueueItem):
+        with self._redis.pipeline() as pipe:
+            pipe.lpush(self._name, item.payload)
+            pipe.lrem(self._processing, 1, item.payload)
+            pipe.execute()
+
+    def _recover_consumer(self, consumer: str) -> int:
+        # 스크립트 안에서 옮기므로 여러 러너가 동시에 되돌려도 요청이 한번만 옮겨진다
+        return self._recover_script(keys=[self._processing_key(consumer), self._name])
+
+
+class PriorityRequestQueue(ReliableRequestQueue):
+    """
+    짧은 작업을 먼저 처리하는 큐 (Shortest-Job-First + aging).
+    클라이언트는 기존과 같이 리스트에 LPUSH 하고, 러너가 꺼낼 때 리스트의 요청을 정렬 집합으로 옮긴 뒤 점수가 낮은 순서로 꺼낸다.
+    점수는 enqueued_at + min(duration * duration_weight, max_penalty) - priority * priority_boost 이다.
+    - 긴 작업은 최대 max_penalty 초 늦게 들어온 것처럼 취급되므로, 그보다 오래 기다리지 않는다.
+    - priority 가 1 높을 때마다 priority_boost 초 먼저 들어온 것처럼 취급된다.
+    """
+
+    # 리스트의 요청을 점수와 함께 정렬 집합으로 옮기고, 점수가 낮은 요청부터 처리중 리스트로 옮긴다
+    POP_SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local duration_weight, priority_boost = tonumber(ARGV[3]), tonumber(ARGV[4])
+    local max_penalty, default_duration = tonumber(ARGV[5]), tonumber(ARGV[6])
+    for i = 1, tonumber(ARGV[2]) do
+        local item = redis.call('RPOP', KEYS[1])
+        if not item then
+            break
+        end
+        local score = now
+        local ok, req = pcall(cjson.decode, item)
+        if ok and type(req) == 'table' then
+            local duration = tonumber(req['duration']) or default_duration
+            local priority = tonumber(req['priority']) or 0
+            score = (tonumber(req['enqueued_at']) or now) + math.min(duration * duration_weight, max_penalty) - priority * priority_boost
+        end
+        redis.call('ZADD', KEYS[2], score, item)
+    end
+
+    local items = {}
+    local popped = redis.call('ZPOPMIN', KEYS[2], tonumber(ARGV[1]))
+    for i = 1, #popped, 2 do
+        redis.call('LPUSH', KEYS[3], popped[i])
+        items[#items + 1] = popped[i]
+    end
+    return items
+    """
+
+    # 뒤로 보낸 요청은 지금 들어온 가장 긴 작업보다 뒤에 둔다 - 점수를 다시 계산하면 같은 요청을 계속 먼저 꺼내게 된다
+    DEFER_SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+    redis.call('LREM', KEYS[2], 1, ARGV[1])
+    """
+
+    def __init__(self, redis: StrictRedis, name: str = BROKER_QUEUE, consumer: str = None, batch_size: int = 32, timeout: int = 1,
+                 duration_weight: float = 1.0, priority_boost: float = 600, max_penalty: float = 3600, default_duration: float = 60, ingest_size: int = 1000,
+                 heartbeat_ttl: float = 60):
+        super().__init__(redis, name, consumer, batch_size, timeout, heartbeat_ttl)
+        self._scheduled = f'{name}:scheduled'
+        self._args = [ingest_size, duration_weight, priority_boost, max_penalty, default_duration]
+        self._max_penalty = max_penalty
+        self._defer_script = redis.register_script(self.DEFER_SCRIPT)
+
+    @property
+    def scheduled(self):
+        return self._scheduled
+
+    def depth(self) -> int:
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self._name)
+            pipe.zcard(self._scheduled)
+            return sum(pipe.execute())
+
+    def oldest(self) -> Union[float, None]:
+        # 정렬 집합 전체를 보지 않고, 양 끝(가장 짧은 작업, 가장 긴 작업)과 아직 옮기지 않은 요청 중 가장 오래된 것으로 추정한다
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.lindex(self._name, -1)
+            pipe.zrange(self._scheduled, 0, 0)
+            pipe.zrange(self._scheduled, -1, -1)
+            tail, first, last = pipe.execute()
+        enqueued = [_enqueued_at(payload) for payload in [tail, *first, *last]]
+        enqueued = [value for value in enqueued if value is not None]
+        return min(enqueued) if enqueued else None
+
+    def pop(self, count: int = None) -> List[QueueItem]:
+        keys = [self._name, self._scheduled, self._processing]
+        payloads = self._pop_script(keys=keys, args=[count or self._batch_size, *self._args])
+        if not payloads:
+            # 비어있다면 새 요청이 들어올 때까지 기다린다 - 요청은 같은 리스트로 돌려놓고 다시 꺼낸다
+            if not self._redis.brpoplpush(self._name, self._name, self._timeout):
+                return []
+            payloads = self._pop_script(keys=keys, args=[count or self._batch_size, *self._args])
+        return [QueueItem(payload) for payload in payloads]
+
+    def defer(self, item: QueueItem):
+        self._defer_script(keys=[self._scheduled, self._processing], args=[item.payload, self._max_penalty])
+
+
+class StreamRequestQueue(RequestQueue):
+    """
+    Redis Streams 컨슈머 그룹 큐 - 여러 러너가 같은 그룹으로 요청을 나눠 가져간다.
+    - 요청은 결과가 기록된 뒤 ack 될 때 XACK + XDEL 되므로, 스트림에는 아직 처리되지 않은 요청만 남는다.
+    - heartbeat 가 끊긴 컨슈머의 요청은 recover 에서 바로 가져온다. 그 외에 claim_idle 초 넘게 ack 되지 않은 요청도 XAUTOCLAIM 으로 가져와 다시 처리한다.
+      살아있는 러너는 keepalive 로 claim_idle / 3 마다 처리중인 요청의 유휴 시간을 초기화하므로, 오래 걸리는 작업도 회수되지 않는다.
+    - 스트림은 maxlen 으로 대략 잘린다 - 처리되지 않은 요청이 maxlen 을 넘으면 오래된 요청부터 사라지므로 여유있게 설정한다.
+    리스트 큐와 타입이 다르므로 스트림 키는 {name}:stream 을 사용한다.
+    """
+
+    def __init__(self, redis: StrictRedis, name: str = BROKER_QUEUE, consumer: str = None, batch_size: int = 32, timeout: int = 1,
+                 group: str = 'trans-broker', maxlen: int = 100000, claim_idle: float = 60 * 30, claim_interval: float = 30, heartbeat_ttl: float = 60):
+        super().__init__(redis, name, consumer, batch_size, timeout, heartbeat_ttl)
+        self._stream = f'{name}:stream'
+        self._group = group
+        self._maxlen = maxlen
+        self._claim_idle = claim_idle
+        self._claim_interval = claim_interval
+        self._claimed_at = 0.0
+        self._kept_at = 0.0
+        # recover 로 가져온 요청 (이 컨슈머가 받았지만 ack 하지 않은 요청) 을 이 id 다음부터 읽는다 - 모두 읽으면 None 이 되고 새 요청('>')을 읽는다
+        self._pending_cursor = None
+        # 죽은 컨슈머에게서 옮겨온 요청 - pending 에는 처리중인 요청도 있으므로 다시 읽지 않고 옮길 때 받은 요청을 그대로 꺼낸다
+        self._reclaimed: List[QueueItem] = []
+        self._group_created = False
+
+    @property
+    def stream(self):
+        return self._stream
+
+    @property
+    def group(self):
+        return self._group
+
+    def __create_group(self):
+        if self._group_created:
+            return
+        try:
+            self._redis.xgroup_create(self._stream, self._group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_created = True
+
+    def push(self, *payloads):
+        with self._redis.pipeline(transaction=False) as pipe:
+            for payload in payloads:
+                pipe.xadd(self._stream, {'payload': payload}, maxlen=self._maxlen, approximate=True)
+            pipe.execute()
+
+    async def push_async(self, *payloads):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for payload in payloads:
+                pipe.xadd(self._stream, {'payload': payload}, maxlen=self._maxlen, approximate=True)
+            await pipe.execute()
+
+    @staticmethod
+    def __items(entries) -> List[QueueItem]:
+        # 잘려서 사라진 요청은 필드가 비어있다
+        return [QueueItem(fields[b'payload'], entry_id) for entry_id, fields in entries if fields and b'payload' in fields]
+
+    def __claim(self, count: int) -> List[QueueItem]:
+        now = time.monotonic()
+        if now - self._claimed_at < self._claim_interval:
+            return []
+        self._claimed_at = now
+        _, entries, *_ = self._redis.xautoclaim(self._stream, self._group, self._consumer, int(self._claim_idle * 1000), '0-0', count=count)
+        return self.__items(entries)
+
+    def pop(self, count: int = None) -> List[QueueItem]:
+        count = count or self._batch_size
+        self.__create_group()
+        if self._reclaimed:
+            items, self._reclaimed = self._reclaimed[:count], self._reclaimed[count:]
+            return items
+        while self._pending_cursor is not None:
+            response = self._redis.xreadgroup(self._group, self._consumer, {self._stream: self._pending_cursor}, count=count)
+            entries = response[0][1] if response else []
+            if not entries:
+                self._pending_cursor = None
+                break
+            self._pending_cursor = entries[-1][0]
+            items = self.__items(entries)
+            if items:
+                return items
+
+        items = self.__claim(count)
+        if items:
+            return items
+        response = self._redis.xreadgroup(self._group, self._consumer, {self._stream: '>'}, count=count, block=int(self._timeout * 1000))
+        return self.__items(response[0][1]) if response else []
+
+    def ack(self, item: QueueItem):
+        with self._redis.pipeline() as pipe:
+            pipe.xack(self._stream, self._group, item.receipt)
+            pipe.xdel(self._stream, item.receipt)
+            pipe.execute()
+
+    def requeue(self, item: QueueItem):
+        # 스트림은 맨 앞에 다시 넣을 수 없으므로 새 요청으로 다시 넣는다
+        self.defer(item)
+
+    def defer(self, item: QueueItem):
+        with self._redis.pipeline() as pipe:
+            pipe.xadd(self._stream, {'payload': item.payload}, maxlen=self._maxlen, approximate=True)
+            pipe.xack(self._stream, self._group, item.receipt)
+            pipe.xdel(self._stream, item.receipt)
+            pipe.execute()
+
+    def keepalive(self, items: List[QueueItem]):
+        super().keepalive(items)
+        # XCLAIM JUSTID 는 전달 횟수를 늘리지 않고 유휴 시간만 0 으로 되돌린다
+        now = time.monotonic()
+        if now - self._kept_at < self._claim_idle / 3:
+            return
+        self._kept_at = now
+        # 옮겨와서 아직 꺼내지 않은 요청도 처리중인 요청처럼 유휴 시간을 초기화한다 - 다른 러너가 XAUTOCLAIM 으로 가져가지 않는다
+        receipts = [item.receipt for item in [*items, *self._reclaimed] if item.receipt is not None]
+        if receipts:
+            self._redis.xclaim(self._stream, self._group, self._consumer, 0, receipts, justid=True)
+
+    def _recover_consumer(self, consumer: str) -> int:
+        # 시작할 때는 처리중인 요청이 없으므로, 같은 이름이었던 이전 러너의 요청을 pending 부터 다시 읽는다
+        if consumer == self._consumer:
+            pending = self._redis.xpending(self._stream, self._group)
+            count = sum(entry['pending'] for entry in pending['consumers'] if entry['name'] == consumer.encode())
+            if count:
+                self._pending_cursor = '0'
+            return count
+
+        # 죽은 컨슈머의 요청을 claim_idle 을 기다리지 않고 이 컨슈머로 옮긴다
+        # 최소 유휴 시간을 주어, 여러 러너가 동시에 되돌릴 때 먼저 옮긴 러너의 요청을 다시 빼앗지 않는다
+        min_idle = int(self._heartbeat_ttl * 1000 / 2)
+        count = 0
+        while True:
+            pending = self._redis.xpending_range(self._stream, self._group, '-', '+', 1000, consumername=consumer)
+            claimed = self._redis.xclaim(self._stream, self._group, self._consumer, min_idle, [entry['message_id'] for entry in pending]) if pending else []
+            self._reclaimed.extend(self.__items(claimed))
+            count += len(claimed)
+            if len(claimed) < len(pending):
+                # 최근에 갱신된 요청이 남아있다 - 컨슈머를 지우면 pending 도 사라지므로 남겨두고 XAUTOCLAIM 에 맡긴다
+                break
+            if not pending:
+                self._redis.xgroup_delconsumer(self._stream, self._group, consumer)
+                break
+        return count
+
+    def recover(self) -> int:
+        self.__create_group()
+        return super().recover()
+
+    def depth(self) -> int:
+        # 스트림에는 처리중인 요청도 남아있으므로 그룹의 pending 을 뺀다
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.xlen(self._stream)
+            pipe.xpending(self._stream, self._group)
+            try:
+                length, pending = pipe.execute()
+            except ResponseError:
+                # 그룹이 아직 없다
+                return self._redis.xlen(self._stream)
+        return max(0, length - pending['pending'])
+
+    def oldest(self) -> Union[float, None]:
+        entries = self._redis.xrange(self._stream, '-', '+', count=1)
+        return _enqueued_at(entries[0][1].get(b'payload')) if entries else None
+
+
+QUEUE_BACKENDS = {
+    'list': ListRequestQueue,
+    'reliable': ReliableRequestQueue,
+    'priority': PriorityRequestQueue,
+    'stream': StreamRequestQueue,
+}
+
+
+def create_request_queue(redis: StrictRedis, backend: str = 'list', **kwargs) -> RequestQueue:
+    if backend not in QUEUE_BACKENDS:
+        raise ValueError(f'Unknown queue backend. backend={backend}')
+    return QUEUE_BACKENDS[backend](redis, **kwargs)
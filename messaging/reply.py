@@ -0,0 +1,280 @@
+import asyncio
+import math
+import time
+
+from typing import Dict, List, Tuple, Union
+
+from redis import StrictRedis
+from redis.exceptions import ConnectionError, TimeoutError
+
+
+REPLY_PREFIX = 'trans-reply:'
+WEBHOOK_PREFIX = 'transcriber-webhook:'
+INFLIGHT_PREFIX = 'trans-inflight:'
+
+# 웹훅 토큰으로 data_key 를 찾아 결과 기록, 완료 신호, 토큰 삭제를 한번에 수행한다
+# 같은 토큰의 웹훅이 두번 전달되어도 먼저 실행된 쪽만 결과를 기록한다
+WEBHOOK_PUBLISH_SCRIPT = """
+local data_key = redis.call('GET', KEYS[1])
+if data_key then
+    redis.call('SET', data_key, ARGV[1], 'EX', ARGV[2])
+    local reply_key = ARGV[3] .. data_key
+    redis.call('DEL', reply_key)
+    redis.call('RPUSH', reply_key, 1)
+    redis.call('EXPIRE', reply_key, ARGV[2])
+    redis.call('DEL', ARGV[4] .. data_key)
+end
+redis.call('DEL', KEYS[1])
+return data_key
+"""
+
+
+# BLPOP 으로 꺼낸 완료 신호를 결과와 같은 TTL 로 되돌려 놓는다
+RESTORE_REPLY_SCRIPT = """
+redis.call('RPUSH', KEYS[1], 1)
+local ttl = redis.call('TTL', KEYS[2])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+"""
+
+
+# 같은 요청의 단일 실행 (single-flight) - 락 없이 한번의 왕복으로 결정한다
+# 결과가 있으면 hit, 진행중인 요청이 없으면 주인이 되고(claimed), 있으면 합류한다(joined)
+# 주인이 되면 이전 요청이 남긴 완료 신호를 지워서, 합류한 클라이언트가 이번 요청의 신호를 기다리게 한다
+CLAIM_SCRIPT = """
+local result = redis.call('GET', KEYS[1])
+if result and result ~= '' then
+    return {'hit', result}
+end
+if redis.call('SET', KEYS[2], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    redis.call('DEL', KEYS[3])
+    return {'claimed'}
+end
+return {'joined'}
+"""
+
+# 요청하지 못하고 끝난 주인이 진행중 표시를 지우고, 합류한 클라이언트를 깨워 다시 claim 하게 한다
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('RPUSH', KEYS[2], 1)
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+CLAIM_HIT = 'hit'
+CLAIM_CLAIMED = 'claimed'
+CLAIM_JOINED = 'joined'
+
+
+def create_reply_key(data_key: str):
+    return f'{REPLY_PREFIX}{data_key}'
+
+
+def create_partial_key(data_key: str):
+    return f'trans-partial:{data_key}'
+
+
+def create_webhook_key(token: str):
+    return f'{WEBHOOK_PREFIX}{token}'
+
+
+def create_inflight_key(data_key: str):
+    return f'{INFLIGHT_PREFIX}{data_key}'
+
+
+def claim_keys(data_key: str):
+    return [data_key, create_inflight_key(data_key), create_reply_key(data_key)]
+
+
+def parse_claim(reply) -> Tuple[str, Union[bytes, None]]:
+    return reply[0].decode(), reply[1] if len(reply) > 1 else None
+
+
+def claim_request(redis: StrictRedis, data_key: str, owner: str, ttl: int = 60 * 20) -> Tuple[str, Union[bytes, None]]:
+    # (CLAIM_HIT, 결과) / (CLAIM_CLAIMED, None) / (CLAIM_JOINED, None)
+    return parse_claim(redis.register_script(CLAIM_SCRIPT)(keys=claim_keys(data_key), args=[owner, ttl]))
+
+
+def release_request(redis: StrictRedis, data_key: str, owner: str, ex: int = 60) -> bool:
+    return bool(redis.register_script(RELEASE_SCRIPT)(keys=[create_inflight_key(data_key), create_reply_key(data_key)], args=[owner, ex]))
+
+
+async def claim_request_async(redis, data_key: str, owner: str, ttl: int = 60 * 20) -> Tuple[str, Union[bytes, None]]:
+    return parse_claim(await redis.register_script(CLAIM_SCRIPT)(keys=claim_keys(data_key), args=[owner, ttl]))
+
+
+async def release_request_async(redis, data_key: str, owner: str, ex: int = 60) -> bool:
+    return bool(await redis.register_script(RELEASE_SCRIPT)(keys=[create_inflight_key(data_key), create_reply_key(data_key)], args=[owner, ex]))
+
+
+def publish_result(redis: StrictRedis, data_key: str, value, ex: int = 60 * 60 * 24):
+    # 결과 기록과 완료 신호를 한번에 보낸다 - 신호는 결과와 같은 시간 동안 유지된다
+    reply_key = create_reply_key(data_key)
+    with redis.pipeline() as pipe:
+        pipe.set(data_key, value, ex=ex)
+        pipe.delete(reply_key)
+        pipe.rpush(reply_key, 1)
+        pipe.expire(reply_key, ex)
+        # 결과가 기록되면 진행중인 요청도 끝난다
+        pipe.delete(create_inflight_key(data_key))
+        pipe.execute()
+
+
+async def publish_result_async(redis, data_key: str, value, ex: int = 60 * 60 * 24):
+    reply_key = create_reply_key(data_key)
+    async with redis.pipeline() as pipe:
+        pipe.set(data_key, value, ex=ex)
+        pipe.delete(reply_key)
+        pipe.rpush(reply_key, 1)
+        pipe.expire(reply_key, ex)
+        pipe.delete(create_inflight_key(data_key))
+        await pipe.execute()
+
+
+def wait_for_reply(redis: StrictRedis, data_key: str, timeout: int = 60) -> bool:
+    reply_key = create_reply_key(data_key)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = math.ceil(deadline - time.monotonic())
+        if remaining <= 0:
+            return False
+
+        try:
+            # 신호를 같은 리스트로 되돌려 놓으므로 같은 결과를 기다리는 다른 클라이언트도 깨어난다
+            if redis.brpoplpush(reply_key, reply_key, remaining) is not None:
+                return True
+        except (ConnectionError, TimeoutError):
+            # 재접속 중에 신호를 놓쳤을 수 있으므로 결과를 직접 확인한다
+            try:
+                if redis.exists(data_key):
+                    return True
+            except (ConnectionError, TimeoutError):
+                pass
+            time.sleep(min(1, max(0, deadline - time.monotonic())))
+
+
+async def wait_for_reply_async(redis, data_key: str, timeout: int = 60) -> bool:
+    # 기다리는 동안 커넥션 하나를 점유한다 - 많은 요청을 함께 기다린다면 AsyncReplyWaiter 를 사용한다
+    reply_key = create_reply_key(data_key)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = math.ceil(deadline - loop.time())
+        if remaining <= 0:
+            return False
+
+        try:
+            if await redis.brpoplpush(reply_key, reply_key, remaining) is not None:
+                return True
+        except (ConnectionError, TimeoutError):
+            try:
+                if await redis.exists(data_key):
+                    return True
+            except (ConnectionError, TimeoutError):
+                pass
+            await asyncio.sleep(min(1, max(0, deadline - loop.time())))
+
+
+class AsyncReplyWaiter:
+    """
+    여러 코루틴의 완료 신호 대기를 하나의 BLPOP 루프로 모은다 - 기다리는 요청 수와 무관하게 커넥션 하나만 점유한다.
+    BLPOP 이 돌아올 때마다 기다리는 키 목록을 다시 읽으므로, 새로 추가된 키는 최대 poll_timeout 뒤부터 감시된다.
+    이미 온 신호는 리스트에 남아있으므로 놓치지 않는다.
+    """
+
+    def __init__(self, redis, poll_timeout: float = 0.5):
+        self.__redis = redis
+        self.__poll_timeout = poll_timeout
+        self.__restore_reply = redis.register_script(RESTORE_REPLY_SCRIPT)
+        self.__waiters: Dict[str, List[asyncio.Future]] = {}
+        self.__task: Union[asyncio.Task, None] = None
+
+    @property
+    def waiting(self):
+        return sum(len(futures) for futures in self.__waiters.values())
+
+    async def wait(self, data_key: str, timeout: float = 60) -> bool:
+        reply_key = create_reply_key(data_key)
+        future = asyncio.get_running_loop().create_future()
+        self.__waiters.setdefault(reply_key, []).append(future)
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.create_task(self.__run())
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            futures = self.__waiters.get(reply_key)
+            if futures and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self.__waiters[reply_key]
+
+    def __wake(self, reply_key: str):
+        for future in self.__waiters.pop(reply_key, []):
+            if not future.done():
+                future.set_result(True)
+
+    async def __run(self):
+        while self.__waiters:
+            try:
+                reply = await self.__redis.blpop(list(self.__waiters), timeout=self.__poll_timeout)
+                if reply is None:
+                    continue
+                reply_key = reply[0].decode()
+                # 같은 결과를 기다리는 다른 클라이언트를 위해 신호를 되돌려 놓는다
+                await self.__restore_reply(keys=[reply_key, reply_key[len(REPLY_PREFIX):]])
+                self.__wake(reply_key)
+            except (ConnectionError, TimeoutError):
+                # 재접속 중에 신호를 놓쳤을 수 있으므로 결과를 직접 확인한다
+                try:
+                    reply_keys = list(self.__waiters)
+                    async with self.__redis.pipeline(transaction=False) as pipe:
+                        for reply_key in reply_keys:
+                            pipe.exists(reply_key[len(REPLY_PREFIX):])
+                        exists = await pipe.execute()
+                    for reply_key, found in zip(reply_keys, exists):
+                        if found:
+                            self.__wake(reply_key)
+                except (ConnectionError, TimeoutError):
+                    pass
+                await asyncio.sleep(1)
+
+
+def wait_for_replies(redis: StrictRedis, data_keys, timeout: int = 60):
+    """여러 data_key 의 완료 신호를 함께 기다리고, 완료되는 순서대로 data_key 를 반환한다."""
+    remaining_keys = {create_reply_key(data_key): data_key for data_key in data_keys}
+    restore_reply = redis.register_script(RESTORE_REPLY_SCRIPT)
+    deadline = time.monotonic() + timeout
+    while remaining_keys:
+        remaining = math.ceil(deadline - time.monotonic())
+        if remaining <= 0:
+            return
+
+        try:
+            reply = redis.blpop(list(remaining_keys), timeout=remaining)
+            if reply is None:
+                continue
+            reply_key = reply[0].decode()
+            data_key = remaining_keys.pop(reply_key)
+            # 같은 결과를 기다리는 다른 클라이언트를 위해 신호를 되돌려 놓는다
+            restore_reply(keys=[reply_key, data_key])
+            yield data_key
+        except (ConnectionError, TimeoutError):
+            # 재접속 중에 신호를 놓쳤을 수 있으므로 결과를 직접 확인한다
+            try:
+                with redis.pipeline(transaction=False) as pipe:
+                    for data_key in remaining_keys.values():
+                        pipe.exists(data_key)
+                    exists = pipe.execute()
+                for (reply_key, data_key), found in zip(list(remaining_keys.items()), exists):
+                    if found:
+                        remaining_keys.pop(reply_key)
+                        yield data_key
+            except (ConnectionError, TimeoutError):
+                pass
+            time.sleep(min(1, max(0, deadline - time.monotonic())))
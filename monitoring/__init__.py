@@ -0,0 +1,5 @@
+from .metrics import DISPATCH_LAG, TRANSCRIBE_LATENCY, TRANSCRIBE_ERRORS, RESULT_BYTES, WEBHOOK_REQUESTS, WEBHOOK_PUBLISH_LATENCY
+from .collector import RunnerCollector, start_metrics_server
+
+__all__ = ('DISPATCH_LAG', 'TRANSCRIBE_LATENCY', 'TRANSCRIBE_ERRORS', 'RESULT_BYTES', 'WEBHOOK_REQUESTS', 'WEBHOOK_PUBLISH_LATENCY',
+           'RunnerCollector', 'start_metrics_server')
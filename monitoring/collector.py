@@ -0,0 +1,108 @@
+import logging
+import time
+
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from prometheus_client import REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from redis import StrictRedis
+
+from messaging import RequestQueue
+from transcription_cache import TranscriptionCache
+
+if TYPE_CHECKING:
+    # runner 가 monitoring 의 지표를 사용하므로 순환 참조를 피한다
+    from runner import ParallelExecutor
+    # 러너가 지표를 import 할 때 boto3 를 불러오지 않는다
+    from transport import Transport
+
+
+class RunnerCollector:
+    """
+    수집 요청(scrape)이 올 때만 계산하는 지표 - 요청 경로에는 비용이 없다.
+    큐 깊이와 가장 오래 기다린 요청의 나이, 실행중인 요청 수, 커넥션 풀 대기, 캐시 적중률, Redis 왕복 시간.
+    """
+
+    def __init__(self, redis: StrictRedis, queue: RequestQueue, executor: 'ParallelExecutor' = None, vendors: Iterable[str] = (),
+                 transport: 'Transport' = None, cache: TranscriptionCache = None, in_flight: Callable[[], int] = None):
+        self.__redis = redis
+        self.__queue = queue
+        self.__executor = executor
+        self.__vendors = list(vendors)
+        self.__transport = transport
+        self.__cache = cache
+        self.__in_flight = in_flight
+
+    def describe(self):
+        # 등록할 때 collect 가 호출되지 않도록 한다
+        return []
+
+    def __collect_queue(self):
+        depth = GaugeMetricFamily('asr_queue_depth', 'Requests waiting in the broker queue', labels=['queue'])
+        depth.add_metric([self.__queue.name], self.__queue.depth())
+        yield depth
+
+        oldest = self.__queue.oldest()
+        age = GaugeMetricFamily('asr_queue_oldest_age_seconds', 'Age of the oldest waiting request', labels=['queue'])
+        age.add_metric([self.__queue.name], max(0.0, time.time() - oldest) if oldest else 0.0)
+        yield age
+
+    def __collect_executor(self):
+        in_flight = GaugeMetricFamily('asr_in_flight', 'Requests being transcribed', labels=['vendor'])
+        if self.__executor:
+            in_flight.add_metric(['all'], self.__executor.running())
+            for vendor in self.__vendors:
+                in_flight.add_metric([vendor], self.__executor.running(vendor))
+            yield GaugeMetricFamily('asr_in_flight_limit', 'Maximum requests being transcribed', value=self.__executor.max_request)
+        elif self.__in_flight:
+            in_flight.add_metric(['all'], self.__in_flight())
+        yield in_flight
+
+    def __collect_transport(self):
+        # pool - http: requests 세션 (결과 파일, ClovaNest), boto3: AWS 클라이언트 (Transcribe, S3)
+        families = {
+            'requests': CounterMetricFamily('asr_http_pool_requests', 'Connections taken from the HTTP pool', labels=['pool']),
+            'waits': CounterMetricFamily('asr_http_pool_waits', 'Connection requests that waited for the HTTP pool', labels=['pool']),
+            'wait_time': CounterMetricFamily('asr_http_pool_wait_seconds', 'Time spent waiting for the HTTP pool', labels=['pool']),
+            'discards': CounterMetricFamily('asr_http_pool_discards', 'Connections discarded because the HTTP pool was full', labels=['pool']),
+        }
+        for pool, stats in (('http', self.__transport.stats), ('boto3', self.__transport.boto_stats)):
+            snapshot = stats.snapshot()
+            for name, family in families.items():
+                family.add_metric([pool], snapshot[name])
+        yield from families.values()
+
+    def __collect_cache(self):
+        stats = self.__cache.stats()
+        yield CounterMetricFamily('asr_cache_hits', 'Transcription cache hits', value=stats['hits'])
+        yield CounterMetricFamily('asr_cache_misses', 'Transcription cache misses', value=stats['misses'])
+        yield CounterMetricFamily('asr_cache_evictions', 'Transcription cache evictions', value=stats['evictions'])
+        yield CounterMetricFamily('asr_cache_expired', 'Transcription cache entries removed after expiry', value=stats['expired'])
+        yield GaugeMetricFamily('asr_cache_hit_ratio', 'Transcription cache hit ratio', value=stats['hit_ratio'])
+        yield GaugeMetricFamily('asr_cache_bytes', 'Transcription cache size', value=stats['bytes'])
+
+    def __collect_redis(self):
+        started = time.perf_counter()
+        self.__redis.ping()
+        yield GaugeMetricFamily('asr_redis_rtt_seconds', 'Redis round trip time (PING)', value=time.perf_counter() - started)
+
+    def collect(self):
+        collectors = [self.__collect_redis, self.__collect_queue, self.__collect_executor]
+        if self.__transport:
+            collectors.append(self.__collect_transport)
+        if self.__cache:
+            collectors.append(self.__collect_cache)
+        for collector in collectors:
+            # Redis 장애 등으로 일부 지표를 얻지 못해도 나머지 지표는 내보낸다
+            try:
+                yield from collector()
+            except Exception:
+                logging.exception('Failed to collect metrics.')
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0', collector: RunnerCollector = None):
+    # 별도 스레드의 HTTP 서버로 /metrics 를 노출한다
+    if collector:
+        REGISTRY.register(collector)
+    start_http_server(port, addr=host)
+    logging.info(f'Metrics server is started. port={port}')
@@ -0,0 +1,29 @@
+from prometheus_client import Counter, Histogram
+
+# 요청 경로에서 갱신하는 지표 - 값 갱신은 락 하나를 잡는 정도의 비용이므로 항상 켜둔다
+
+DISPATCH_LAG = Histogram(
+    'asr_dispatch_lag_seconds', 'Time from enqueue to dispatch of a transcription request', ['vendor'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+
+TRANSCRIBE_LATENCY = Histogram(
+    'asr_transcribe_seconds', 'Vendor transcription latency', ['vendor'],
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+# reason - failed: 벤더 실패, throttled: 요청량 제한, unknown_vendor: Transcriber 없음, invalid: 해석할 수 없는 요청
+TRANSCRIBE_ERRORS = Counter('asr_transcribe_errors_total', 'Failed transcription requests', ['vendor', 'reason'])
+
+# source - runner: 러너가 기록한 결과, webhook: 웹훅으로 받은 결과
+RESULT_BYTES = Histogram(
+    'asr_result_bytes', 'Size of transcription results stored in Redis', ['source'],
+    buckets=(1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20),
+)
+
+WEBHOOK_REQUESTS = Counter('asr_webhook_requests_total', 'Delivered ClovaNest webhooks', ['status'])
+
+WEBHOOK_PUBLISH_LATENCY = Histogram(
+    'asr_webhook_publish_seconds', 'Redis round trip to publish a webhook result',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1),
+)
@@ -0,0 +1,75 @@
+import time
+
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+import click
+
+from redis import StrictRedis
+
+from .tracing import TRACE_SPANS, TRACE_STREAM
+
+
+def load_traces(redis: StrictRedis, since: float, count=1000) -> Dict[str, Dict[str, float]]:
+    # since 이후의 스트림 항목을 추적 아이디별로 합친다
+    traces = defaultdict(dict)
+    start = f'{int(since * 1000)}-0'
+    while True:
+        entries = redis.xrange(TRACE_STREAM, min=start, max='+', count=count)
+        for entry_id, fields in entries:
+            fields = {key.decode(): value.decode() for key, value in fields.items()}
+            trace = traces[fields.pop('trace')]
+            vendor = fields.pop('vendor', '')
+            if vendor:
+                trace['vendor'] = vendor
+            trace.update({stage: float(ts) for stage, ts in fields.items()})
+        if len(entries) < count:
+            break
+        start = '(' + entries[-1][0].decode()
+    return traces
+
+
+def span_latencies(traces: Iterable[Dict[str, float]]) -> Dict[str, Dict[str, List[float]]]:
+    # 벤더별, 구간별 지연 시간 목록
+    latencies = defaultdict(lambda: defaultdict(list))
+    for trace in traces:
+        vendor = trace.get('vendor', 'unknown')
+        for name, starts, end in TRACE_SPANS:
+            start = next((trace[stage] for stage in starts if stage in trace), None)
+            if start is not None and end in trace:
+                latencies[vendor][name].append(trace[end] - start)
+    return latencies
+
+
+def percentile(values: List[float], q: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=6379, show_default=True)
+@click.option('--db', default=1, show_default=True)
+@click.option('--minutes', default=60, help='report window', show_default=True)
+@click.option('--vendor', default=None, help='vendor code (aw, cn)')
+def main(host: str, port: int, db: int, minutes: int, vendor: str):
+    redis = StrictRedis(host=host, port=port, db=db)
+    traces = load_traces(redis, time.time() - minutes * 60)
+    latencies = span_latencies(traces.values())
+
+    click.echo(f'{len(traces)} traces in the last {minutes} minutes')
+    for trace_vendor in sorted(latencies):
+        if vendor and trace_vendor != vendor:
+            continue
+        click.echo(f'\n[{trace_vendor}]')
+        click.echo(f'{"span":<18}{"count":>8}{"p50":>10}{"p90":>10}{"p99":>10}{"max":>10}')
+        for name, _, _ in TRACE_SPANS:
+            values = latencies[trace_vendor].get(name)
+            if not values:
+                continue
+            p50, p90, p99 = (percentile(values, q) for q in (0.5, 0.9, 0.99))
+            click.echo(f'{name:<18}{len(values):>8}{p50:>10.3f}{p90:>10.3f}{p99:>10.3f}{max(values):>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
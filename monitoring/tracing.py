@@ -0,0 +1,87 @@
+import time
+import uuid
+
+from typing import Dict, List, Tuple
+
+from redis import StrictRedis
+
+
+TRACE_STREAM = 'trans-trace'
+TRACE_PREFIX = 'trans-trace:'
+TRACE_MAXLEN = 100000
+
+# 단계 - 클라이언트: started, claimed, checked, uploaded, enqueued, completed
+#        러너: dispatched, vendor_started, vendor_completed, published / 웹훅: webhook_received, published
+# 구간 이름과 (시작 단계들, 끝 단계) - 시작 단계는 기록된 첫번째 것을 사용한다
+TRACE_SPANS: List[Tuple[str, Tuple[str, ...], str]] = [
+    ('claim', ('started',), 'claimed'),
+    ('check_storage', ('claimed',), 'checked'),
+    ('upload', ('checked',), 'uploaded'),
+    ('queue_wait', ('enqueued',), 'dispatched'),
+    ('vendor_start', ('dispatched',), 'vendor_started'),
+    ('vendor', ('vendor_started',), 'vendor_completed'),
+    ('webhook_delivery', ('vendor_completed',), 'webhook_received'),
+    ('result_write', ('webhook_received', 'vendor_completed'), 'published'),
+    ('reply', ('published',), 'completed'),
+    ('total', ('started',), 'completed'),
+]
+
+# 웹훅은 data_key 만 알 수 있으므로, 러너가 남긴 data_key -> trace 로 추적 아이디를 찾아 기록한다
+RECORD_BY_DATA_KEY_SCRIPT = """
+local trace = redis.call('GET', KEYS[1])
+if not trace then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], '*', 'trace', trace, unpack(ARGV, 2))
+return 1
+"""
+
+
+def create_trace_id():
+    return uuid.uuid4().hex
+
+
+def create_trace_key(data_key: str):
+    return f'{TRACE_PREFIX}{data_key}'
+
+
+class Trace:
+    """
+    한 요청의 단계별 시각을 모았다가 스트림에 항목 하나로 기록한다 - 단계마다 Redis 를 왕복하지 않는다.
+    시각은 각 프로세스의 time.time() 이므로 서버 간 시계 차이만큼 오차가 있다.
+    """
+
+    __slots__ = ('trace_id', 'vendor', 'stages')
+
+    def __init__(self, trace_id: str = None, vendor: str = ''):
+        self.trace_id = trace_id or create_trace_id()
+        self.vendor = vendor
+        self.stages: Dict[str, float] = {}
+
+    def mark(self, stage: str, ts: float = None):
+        self.stages[stage] = ts or time.time()
+        return self
+
+    def __fields(self):
+        fields = {'vendor': self.vendor}
+        fields.update({stage: f'{ts:.6f}' for stage, ts in self.stages.items()})
+        return fields
+
+    def flush(self, redis: StrictRedis, maxlen=TRACE_MAXLEN):
+        if self.stages:
+            redis.xadd(TRACE_STREAM, {'trace': self.trace_id, **self.__fields()}, maxlen=maxlen, approximate=True)
+            self.stages = {}
+
+    async def flush_async(self, redis, maxlen=TRACE_MAXLEN):
+        if self.stages:
+            await redis.xadd(TRACE_STREAM, {'trace': self.trace_id, **self.__fields()}, maxlen=maxlen, approximate=True)
+            self.stages = {}
+
+
+async def record_by_data_key_async(redis, script, data_key: str, stages: Dict[str, float], vendor: str = '', maxlen=TRACE_MAXLEN):
+    # script 는 redis.register_script(RECORD_BY_DATA_KEY_SCRIPT)
+    args = [maxlen, 'vendor', vendor]
+    for stage, ts in stages.items():
+        args.extend((stage, f'{ts:.6f}'))
+    return await script(keys=[create_trace_key(data_key), TRACE_STREAM], args=args)
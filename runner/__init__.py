@@ -1,3 +1,4 @@
 from .executor import ParallelExecutor
 from .runner import TranscriptionRequestRunner
-
+from .async_runner import AsyncTranscriptionRequestRunner
+from .registry import VendorRegistry, TranscriberView, loaded_values
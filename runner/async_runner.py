@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set, Tuple
+
+from redis.asyncio import StrictRedis
+
+from transcribers import AsyncBaseTranscriber, ThrottledError
+from transcribers import Vendor, TranscriptionRequest
+from messaging import RequestQueue, QueueItem, publish_result_async, create_webhook_key
+
+import orjson
+
+from monitoring.metrics import DISPATCH_LAG, TRANSCRIBE_LATENCY, TRANSCRIBE_ERRORS, RESULT_BYTES
+from monitoring.tracing import Trace, create_trace_key
+
+from .checkpoint import JobCheckpoints
+from .registry import VendorRegistry, loaded_values
+
+
+class AsyncTranscriptionRequestRunner:
+    """
+    TranscriptionRequestRunner 의 asyncio 버전.
+    요청 처리, 벤더 호출, 작업 상태 조회, 결과 기록이 하나의 이벤트 루프 위의 코루틴으로 동작한다.
+    큐의 블로킹 pop 과 ack 는 기존 큐 구현을 그대로 쓰기 위해 전용 스레드 하나에서 수행한다.
+    """
+
+    def __init__(self, redis: StrictRedis, transcribers: Dict[Vendor, Tuple[bool, AsyncBaseTranscriber]], queue: RequestQueue, max_request=3000, live_timeout=60 * 60 * 24, result_format='json', tracing=False, checkpoints: JobCheckpoints = None, drain_timeout=60):
+        self.__redis = redis
+        self.__result_format = result_format
+        self.__tracing = tracing
+        self.__transcribers = transcribers
+        self.__queue = queue
+        self.__live_timeout = live_timeout
+        self.__slots = asyncio.Semaphore(max_request)
+        self.__queue_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='queue')
+        self.__tasks = {}
+        self.__checkpoints = checkpoints or JobCheckpoints(redis, queue.consumer, live_timeout)
+        # 종료 - 새 요청을 꺼내지 않고, drain_timeout 동안 실행중인 요청을 기다린 뒤 남은 요청은 큐로 되돌린다
+        self.__drain_timeout = drain_timeout
+        self.__stopping = False
+        self.__handed_off = False
+        # 결과 발행을 시작한 요청 - drain 은 이 요청을 취소하거나 큐로 되돌리지 않고 끝날 때까지 기다린다
+        self.__publishing: Set[QueueItem] = set()
+
+    @property
+    def in_flight(self):
+        return len(self.__tasks)
+
+    def stop(self):
+        # 이벤트 루프의 시그널 핸들러에서 호출한다 - poll 이 정리 후 반환된다
+        self.__stopping = True
+
+    async def __queue_call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__queue_executor, fn, *args)
+
+    async def __transcriber(self, vendor: Vendor) -> Tuple[bool, AsyncBaseTranscriber]:
+        # 처음 사용하는 벤더는 import 와 클라이언트 생성이 이벤트 루프를 막지 않도록 스레드에서 만든다
+        if isinstance(self.__transcribers, VendorRegistry) and not self.__transcribers.is_loaded(vendor):
+            return await asyncio.get_running_loop().run_in_executor(None, self.__transcribers.__getitem__, vendor)
+        return self.__transcribers[vendor]
+
+    async def __respond(self, data_key: str, transcription):
+        transcription_text = '' if transcription is None else transcription.encode(self.__result_format)
+        RESULT_BYTES.labels('runner').observe(len(transcription_text))
+        await publish_result_async(self.__redis, data_key, transcription_text, ex=self.__live_timeout)
+
+    async def __respond_webhook(self, data_key: str, token, trace: Trace = None):
+        if token:
+            # 토큰이 있다면 토큰 등록 후, 나중에 결과를 찾기 위한 토큰과 data_key 등록
+            await self.__redis.set(create_webhook_key(token), data_key, ex=self.__live_timeout)
+            if trace:
+                # 웹훅이 이어서 기록할 수 있도록 data_key 로 추적 아이디를 남긴다
+                await self.__redis.set(create_trace_key(data_key), trace.trace_id, ex=self.__live_timeout)
+        else:
+            # 토큰 반환이 None 이라면 실패한것으로 간주
+            await publish_result_async(self.__redis, data_key, '', ex=self.__live_timeout)
+
+    def __begin_publish(self, item: QueueItem) -> bool:
+        # 확인과 표시 사이에 await 가 없으므로, drain 이 시작된 뒤에는 어떤 요청도 발행을 시작하지 않는다
+        if self.__handed_off:
+            # 다른 러너에게 넘긴 요청은 결과를 기록하지 않는다
+            return False
+        self.__publishing.add(item)
+        return True
+
+    async def handle(self, item: QueueItem):
+        try:
+            req = TranscriptionRequest.parse_obj(orjson.loads(item.payload))
+        except ValueError:
+            # 해석할 수 없는 요청은 다시 처리해도 실패하므로 버린다
+            logging.error(f'Invalid transcription request is dropped. payload={item.payload}')
+            TRANSCRIBE_ERRORS.labels('unknown', 'invalid').inc()
+            await self.__queue_call(self.__queue.ack, item)
+            return
+
+        if req.enqueued_at:
+            DISPATCH_LAG.labels(req.vendor.value).observe(max(0.0, time.time() - req.enqueued_at))
+
+        # 클라이언트가 추적을 요청한 경우 단계별 시각을 기록한다
+        trace = Trace(req.trace_id, req.vendor.value).mark('dispatched') if req.trace_id and self.__tracing else None
+
+        if req.vendor in self.__transcribers:
+            try:
+                use_webhook, transcriber = await self.__transcriber(req.vendor)
+            except Exception:
+                # 벤더를 만들지 못했다 (클라이언트 생성 실패, 설정 오류) - 요청을 실패로 끝낸다
+                logging.exception(f'Failed to load the vendor. Vendor={req.vendor.value}, DataKey={req.data_key}')
+                TRANSCRIBE_ERRORS.labels(req.vendor.value, 'load_failed').inc()
+                if not self.__begin_publish(item):
+                    return
+                await publish_result_async(self.__redis, req.data_key, '', ex=self.__live_timeout)
+                await self.__queue_call(self.__queue.ack, item)
+                return
+            started_at = time.monotonic()
+            if trace:
+                trace.mark('vendor_started')
+            # 이전 러너가 요청하고 결과를 남기기 전에 멈췄다면, 다시 요청하지 않고 남긴 작업을 이어받는다
+            checkpoint = await self.__checkpoints.load_async(req.data_key)
+            handle = checkpoint.handle if checkpoint and checkpoint.vendor == req.vendor.value else None
+            if handle:
+                logging.info(f'Resuming the vendor job. DataKey={req.data_key}, Handle={handle}, Consumer={checkpoint.consumer}')
+            else:
+                if checkpoint:
+                    logging.warning(f'Previous runner stopped before the vendor job is known. Requesting again. DataKey={req.data_key}, Consumer={checkpoint.consumer}')
+                # 벤더에 요청하기 전에 남긴다 - 요청 중에 멈춰도 같은 요청을 다시 처리하는 러너가 작업을 이어받는다
+                await self.__checkpoints.save_async(req.data_key, req.vendor.value, transcriber.job_handle(req.s3_file_key, req.lang, req.media_format))
+            try:
+                if handle and use_webhook:
+                    result = handle
+                else:
+                    if handle:
+                        result = await transcriber.resume(handle, req.s3_file_key, req.lang, req.media_format, duration=req.duration)
+                    else:
+                        result = await transcriber.transcribe(req.s3_file_key, req.lang, req.media_format, duration=req.duration)
+                    TRANSCRIBE_LATENCY.labels(req.vendor.value).observe(time.monotonic() - started_at)
+                    if result is None:
+                        TRANSCRIBE_ERRORS.labels(req.vendor.value, 'failed').inc()
+                    elif use_webhook:
+                        await self.__checkpoints.save_async(req.data_key, req.vendor.value, result)
+            except ThrottledError:
+                logging.error(f'Transcribing is throttled after retries. DataKey={req.data_key}')
+                TRANSCRIBE_ERRORS.labels(req.vendor.value, 'throttled').inc()
+                result = None
+            if not self.__begin_publish(item):
+                return
+            if trace:
+                trace.mark('vendor_completed')
+            if use_webhook:
+                await self.__respond_webhook(req.data_key, result, trace)
+                if trace and not result:
+                    trace.mark('published')
+            else:
+                await self.__respond(req.data_key, result)
+                if trace:
+                    trace.mark('published')
+            if trace:
+                await trace.flush_async(self.__redis)
+            await self.__checkpoints.delete_async(req.data_key)
+        else:
+            # Transcriber 없음
+            TRANSCRIBE_ERRORS.labels(req.vendor.value, 'unknown_vendor').inc()
+            if not self.__begin_publish(item):
+                return
+            await publish_result_async(self.__redis, req.data_key, '', ex=self.__live_timeout)
+        await self.__queue_call(self.__queue.ack, item)
+
+    async def __run(self, item: QueueItem):
+        try:
+            await self.handle(item)
+        except Exception:
+            # ack 되지 않은 요청은 처리중 리스트에 남아 재시작 시 다시 처리된다
+            logging.exception(f'Failed to handle transcription request. payload={item.payload}')
+        finally:
+            self.__slots.release()
+            if not self.__handed_off:
+                self.__publishing.discard(item)
+
+    def __spawn(self, item: QueueItem):
+        task = asyncio.create_task(self.__run(item))
+        self.__tasks[task] = item
+        task.add_done_callback(lambda _: self.__tasks.pop(task, None))
+
+    async def poll(self):
+        # 이전에 죽은 러너가 처리하지 못한 요청을 큐로 되돌린다
+        await self.__queue_call(self.__queue.recover)
+        while not self.__stopping:
+            await self.__queue_call(self.__queue.keepalive, list(self.__tasks.values()))
+            # 처리할 여유가 있을 때만, 여유가 있는 만큼만 큐에서 꺼낸다
+            try:
+                await asyncio.wait_for(self.__slots.acquire(), self.__queue.timeout)
+            except asyncio.TimeoutError:
+                continue
+            count = 1
+            while count < self.__queue.batch_size and not self.__slots.locked():
+                await self.__slots.acquire()
+                count += 1
+
+            items = await self.__queue_call(self.__queue.pop, count)
+            for _ in range(count - len(items)):
+                self.__slots.release()
+            for item in items:
+                self.__spawn(item)
+        await self.__drain()
+
+    async def __drain(self):
+        logging.info(f'Stopping the runner. Waiting for in-flight requests. Running={len(self.__tasks)}')
+        if self.__tasks:
+            await asyncio.wait(list(self.__tasks), timeout=self.__drain_timeout)
+
+        # 끝나지 않은 요청은 큐로 되돌린다 - 벤더 작업은 지우지 않고 남겨두어, 요청을 다시 꺼낸 러너가 이어받는다
+        self.__handed_off = True
+        tasks = dict(self.__tasks)
+        # 취소된 요청이 벤더 작업을 지우지 않도록 먼저 떼어낸다
+        for _, transcriber in loaded_values(self.__transcribers):
+            transcriber.detach()
+        # 결과 발행을 시작한 요청은 발행과 ack 를 마치게 두고, 나머지는 취소한 뒤 모두 끝날 때까지 기다린다
+        for task, item in tasks.items():
+            if item not in self.__publishing:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 결과를 발행하지 않은 요청만 되돌린다 - 같은 요청이 두번 처리되지 않는다
+        handed_off = [item for item in tasks.values() if item not in self.__publishing]
+        for item in handed_off:
+            await self.__queue_call(self.__queue.requeue, item)
+        logging.info(f'Runner is stopped. HandedOff={len(handed_off)}')
+        return len(handed_off)
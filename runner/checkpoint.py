@@ -0,0 +1,77 @@
+import time
+
+from typing import NamedTuple, Union
+
+
+CHECKPOINT_PREFIX = 'trans-job:'
+
+
+def create_checkpoint_key(data_key: str):
+    return f'{CHECKPOINT_PREFIX}{data_key}'
+
+
+class JobCheckpoint(NamedTuple):
+    data_key: str
+    vendor: str
+    handle: str
+    started_at: float
+    consumer: str
+
+
+class JobCheckpoints:
+    """
+    러너가 벤더에 요청한 작업을 data_key 별로 Redis 에 남긴다 - 요청하기 전에 남기고, 결과를 발행하거나 웹훅 토큰을 등록하면 지운다.
+    handle 은 요청 전에 알 수 있는 작업 식별자(AWS 작업 이름)이거나, 요청 후 받은 웹훅 토큰(ClovaNest)이다. 아직 모르면 빈 문자열.
+    러너가 멈춰서 같은 요청을 다시 처리할 때, handle 이 있다면 새로 요청하지 않고 남은 작업을 이어받는다 (BaseTranscriber.resume).
+    redis 는 StrictRedis 또는 redis.asyncio 의 StrictRedis 이며, 후자는 *_async 메소드를 사용한다.
+    """
+
+    def __init__(self, redis, consumer: str, ttl=60 * 60 * 24):
+        self.__redis = redis
+        self.__consumer = consumer
+        self.__ttl = ttl
+
+    def __checkpoint(self, data_key: str, vendor: str, handle: Union[str, None], started_at: float = None):
+        return JobCheckpoint(data_key, vendor, handle or '', started_at or time.time(), self.__consumer)
+
+    @staticmethod
+    def __mapping(checkpoint: JobCheckpoint):
+        return {'vendor': checkpoint.vendor, 'handle': checkpoint.handle, 'started_at': checkpoint.started_at, 'consumer': checkpoint.consumer}
+
+    @staticmethod
+    def __parse(data_key: str, fields) -> Union[JobCheckpoint, None]:
+        if not fields:
+            return None
+        fields = {key.decode(): value.decode() for key, value in fields.items()}
+        return JobCheckpoint(data_key, fields.get('vendor', ''), fields.get('handle', ''), float(fields.get('started_at', 0)), fields.get('consumer', ''))
+
+    def save(self, data_key: str, vendor: str, handle: Union[str, None], started_at: float = None) -> JobCheckpoint:
+        checkpoint = self.__checkpoint(data_key, vendor, handle, started_at)
+        key = create_checkpoint_key(data_key)
+        with self.__redis.pipeline() as pipe:
+            pipe.hset(key, mapping=self.__mapping(checkpoint))
+            pipe.expire(key, self.__ttl)
+            pipe.execute()
+        return checkpoint
+
+    def load(self, data_key: str) -> Union[JobCheckpoint, None]:
+        return self.__parse(data_key, self.__redis.hgetall(create_checkpoint_key(data_key)))
+
+    def delete(self, data_key: str):
+        self.__redis.delete(create_checkpoint_key(data_key))
+
+    # redis.asyncio 를 사용하는 경우
+    async def save_async(self, data_key: str, vendor: str, handle: Union[str, None], started_at: float = None) -> JobCheckpoint:
+        checkpoint = self.__checkpoint(data_key, vendor, handle, started_at)
+        key = create_checkpoint_key(data_key)
+        async with self.__redis.pipeline() as pipe:
+            pipe.hset(key, mapping=self.__mapping(checkpoint))
+            pipe.expire(key, self.__ttl)
+            await pipe.execute()
+        return checkpoint
+
+    async def load_async(self, data_key: str) -> Union[JobCheckpoint, None]:
+        return self.__parse(data_key, await self.__redis.hgetall(create_checkpoint_key(data_key)))
+
+    async def delete_async(self, data_key: str):
+        await self.__redis.delete(create_checkpoint_key(data_key))
@@ -0,0 +1,245 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import wave
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from audio import to_mono
+from transcribers import BaseTranscriber, Lang, Transcription
+from downloader.base_downloader import BaseDownloader
+
+
+class AudioChunk(NamedTuple):
+    index: int
+    # 벤더에 보내는 구간 (겹치는 구간 포함, 초)
+    start: float
+    end: float
+    # 이 조각이 결과를 책임지는 구간 (침묵 지점에서 자른 구간, 초)
+    keep_start: float
+    keep_end: float
+    filename: str = None
+
+
+def frame_energies(wav: wave.Wave_read, frame_seconds=0.02, block_frames=1000) -> np.ndarray:
+    """frame_seconds 단위 프레임의 RMS 에너지 - 긴 파일도 block_frames 개 프레임씩 읽어서 계산한다."""
+    frame_size = max(1, int(wav.getframerate() * frame_seconds))
+    energies = []
+    wav.rewind()
+    while True:
+        data = wav.readframes(frame_size * block_frames)
+        if not data:
+            break
+        samples = to_mono(data, wav.getsampwidth(), wav.getnchannels())
+        count = len(samples) // frame_size
+        if count:
+            frames = samples[:count * frame_size].reshape(count, frame_size)
+            energies.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        if len(samples) > count * frame_size:
+            rest = samples[count * frame_size:]
+            energies.append(np.array([np.sqrt(np.mean(rest * rest))]))
+    return np.concatenate(energies) if energies else np.zeros(0)
+
+
+def find_split_points(energies: np.ndarray, frame_seconds: float, chunk_seconds: float, search_seconds: float) -> List[float]:
+    """chunk_seconds 마다, 앞뒤 search_seconds 안에서 가장 조용한 프레임을 자르는 지점(초)으로 고른다."""
+    duration = len(energies) * frame_seconds
+    points = []
+    target = chunk_seconds
+    while target < duration - chunk_seconds / 2:
+        lo = max(int((target - search_seconds) / frame_seconds), int(points[-1] / frame_seconds) + 1 if points else 0)
+        hi = min(int((target + search_seconds) / frame_seconds) + 1, len(energies))
+        if lo >= hi:
+            break
+        point = (lo + int(np.argmin(energies[lo:hi]))) * frame_seconds
+        points.append(point)
+        target = point + chunk_seconds
+    return points
+
+
+def plan_chunks(duration: float, points: Sequence[float], overlap_seconds: float) -> List[AudioChunk]:
+    bounds = [0.0] + list(points) + [duration]
+    return [AudioChunk(i, max(0.0, bounds[i] - overlap_seconds), min(duration, bounds[i + 1] + overlap_seconds), bounds[i], bounds[i + 1])
+            for i in range(len(bounds) - 1)]
+
+
+def split_wav(filename: str, outdir: str, chunk_seconds=300, overlap_seconds=2, search_seconds=10, frame_seconds=0.02) -> List[AudioChunk]:
+    with wave.open(filename, 'rb') as wav:
+        rate = wav.getframerate()
+        duration = wav.getnframes() / rate
+        points = find_split_points(frame_energies(wav, frame_seconds), frame_seconds, chunk_seconds, search_seconds)
+        chunks = []
+        for chunk in plan_chunks(duration, points, overlap_seconds):
+            start = int(chunk.start * rate)
+            wav.setpos(start)
+            data = wav.readframes(int(chunk.end * rate) - start)
+            chunk_filename = os.path.join(outdir, f'{chunk.index:04d}.wav')
+            with wave.open(chunk_filename, 'wb') as out:
+                out.setnchannels(wav.getnchannels())
+                out.setsampwidth(wav.getsampwidth())
+                out.setframerate(rate)
+                out.writeframes(data)
+            chunks.append(chunk._replace(filename=chunk_filename))
+    return chunks
+
+
+def merge_transcriptions(chunks: Sequence[AudioChunk], transcriptions: Sequence[Transcription]) -> Transcription:
+    """
+    조각별 결과의 단어 시각을 원본 기준으로 옮기고, 겹치는 구간의 단어는 단어의 가운데 시각이 속한 조각의 것만 남긴다.
+    전체 문장은 남긴 단어를 공백으로 이어서 만든다 - 조각의 transcript 는 겹치는 구간을 시각으로 자를 수 없기 때문이다.
+    단어에 붙은 문장 부호(AWS 는 앞 단어에 붙인다)는 남지만, 벤더가 transcript 에만 적용한 정규화(띄어쓰기, 숫자 표기 등)는 사라진다.
+    """
+    texts, start_times, end_times = [], [], []
+    confidence = 0
+    vendor = None
+    for chunk, transcription in zip(chunks, transcriptions):
+        vendor = vendor or transcription.vendor
+        count = 0
+        for text, start, end in zip(*transcription.columns):
+            start, end = start + chunk.start, end + chunk.start
+            middle = (start + end) / 2
+            if chunk.keep_start <= middle < chunk.keep_end:
+                texts.append(text)
+                start_times.append(start)
+                end_times.append(end)
+                count += 1
+        confidence += (transcription.confidences[0] or 0) * count if transcription.confidences else 0
+
+    confidences = [round(confidence / len(texts), 2) if texts else 0]
+    return Transcription.from_columns([' '.join(texts)], confidences, texts, start_times, end_times, vendor)
+
+
+class ChunkedTranscriber(BaseTranscriber):
+    """
+    긴 WAV 를 침묵 지점에서 겹치는 조각으로 나눠서 벤더에 동시에 요청하고, 결과를 하나로 합친다.
+    앞에서부터 이어지는 조각들이 완료될 때마다 on_partial 로 중간 결과를 전달한다.
+    짧거나 WAV 가 아닌 파일은 그대로 transcriber 에 요청한다 - 요청의 duration 으로 판단하고, duration 이 없는 요청만 내려받아 확인한다.
+    max_parallel 은 요청 하나의 동시 조각 수이다.
+    """
+
+    partial_results = True
+
+    def __init__(self, transcriber: BaseTranscriber, downloader: BaseDownloader, tempdir: str,
+                 chunk_seconds=300, overlap_seconds=2, search_seconds=10, min_seconds=600, max_parallel=8):
+        self.__transcriber = transcriber
+        self.__downloader = downloader
+        self.__tempdir = tempdir
+        self.__chunk_seconds = chunk_seconds
+        self.__overlap_seconds = overlap_seconds
+        self.__search_seconds = search_seconds
+        self.__min_seconds = min_seconds
+        self.__max_parallel = max_parallel
+        # 조각으로 나눠 인식중인 요청 - cancel 에서 조각 작업을 찾아 취소한다
+        self.__cancelled: Dict[Tuple[str, Lang], threading.Event] = {}
+        self.__chunk_srcs: Dict[Tuple[str, Lang], Set[str]] = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def transcriber(self):
+        return self.__transcriber
+
+    def detach(self):
+        self.__transcriber.detach()
+
+    def cancel(self, src: str, lang: Lang, media_format: str = 'wav'):
+        # 조각으로 나누지 않은 요청은 src 그대로, 나눈 요청은 시작한 조각 작업을 모두 취소하고 남은 조각은 시작하지 않는다
+        self.__transcriber.cancel(src, lang, media_format)
+        self.__cancel_chunks(src, lang)
+
+    def __cancel_chunks(self, src: str, lang: Lang):
+        with self.__lock:
+            cancelled = self.__cancelled.get((src, lang))
+            chunk_srcs = list(self.__chunk_srcs.get((src, lang), ()))
+            if cancelled:
+                cancelled.set()
+        for chunk_src in chunk_srcs:
+            self.__transcriber.cancel(chunk_src, lang, 'wav')
+
+    @staticmethod
+    def _duration(filename: str) -> Union[float, None]:
+        try:
+            with wave.open(filename, 'rb') as wav:
+                return wav.getnframes() / wav.getframerate()
+        except (wave.Error, EOFError):
+            return None
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', on_partial: Callable[[Transcription], None] = None, duration: float = None):
+        # 조각으로 나눌 수 있는 것은 WAV 뿐이다 - 짧은 것을 알고 있다면 내려받지 않는다
+        if media_format != 'wav' or (duration is not None and duration < self.__min_seconds):
+            return self.__transcriber.transcribe(src, lang, media_format, duration=duration)
+
+        os.makedirs(self.__tempdir, exist_ok=True)
+        workdir = tempfile.mkdtemp(dir=self.__tempdir)
+        try:
+            filename = self.__downloader.download_file(src, workdir)
+            duration = self._duration(filename)
+            if duration is None or duration < self.__min_seconds:
+                return self.__transcriber.transcribe(src, lang, duration=duration)
+
+            chunks = split_wav(filename, workdir, self.__chunk_seconds, self.__overlap_seconds, self.__search_seconds)
+            logging.info(f'Started to transcribe in chunks. Src={src}, Duration={duration:.1f}, Chunks={len(chunks)}')
+            with self.__lock:
+                cancelled = self.__cancelled.setdefault((src, lang), threading.Event())
+                self.__chunk_srcs[(src, lang)] = set()
+            try:
+                return self.__transcribe_chunks(src, lang, chunks, on_partial, cancelled)
+            finally:
+                with self.__lock:
+                    self.__cancelled.pop((src, lang), None)
+                    self.__chunk_srcs.pop((src, lang), None)
+        except Exception as e:
+            logging.exception(f'Failed to transcribe in chunks. Src={src}')
+            return None
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def __transcribe_chunk(self, src: str, lang: Lang, chunk: AudioChunk, cancelled: threading.Event):
+        chunk_src = f'{src}.chunks/{chunk.index:04d}.wav'
+        with self.__lock:
+            if cancelled.is_set():
+                return None
+            self.__chunk_srcs[(src, lang)].add(chunk_src)
+        self.__downloader.upload_file(chunk.filename, chunk_src)
+        try:
+            return self.__transcriber.transcribe(chunk_src, lang, duration=chunk.end - chunk.start)
+        finally:
+            try:
+                self.__downloader.delete_file(chunk_src)
+            except:
+                pass
+
+    def __transcribe_chunks(self, src: str, lang: Lang, chunks: List[AudioChunk], on_partial, cancelled: threading.Event):
+        executor = ThreadPoolExecutor(max_workers=min(self.__max_parallel, len(chunks)), thread_name_prefix='chunk')
+        merged = None
+        try:
+            futures = {executor.submit(self.__transcribe_chunk, src, lang, chunk, cancelled): chunk.index for chunk in chunks}
+            results = [None] * len(chunks)
+            completed = 0
+            for future in as_completed(futures):
+                transcription = future.result()
+                if transcription is None:
+                    # 하나라도 실패하면 전체를 실패로 간주한다
+                    logging.error(f'Failed to transcribe chunk. Src={src}, Chunk={futures[future]}')
+                    return None
+
+                results[futures[future]] = transcription
+                prefix = completed
+                while prefix < len(chunks) and results[prefix] is not None:
+                    prefix += 1
+                if on_partial and completed < prefix < len(chunks):
+                    on_partial(merge_transcriptions(chunks[:prefix], results[:prefix]))
+                completed = prefix
+
+            merged = merge_transcriptions(chunks, results)
+            return merged
+        finally:
+            if merged is None:
+                # 실패했다면 벤더에서 실행중인 조각 작업도 취소한다 - 취소된 조각은 올린 파일을 지우고 끝난다
+                self.__cancel_chunks(src, lang)
+            # 시작하지 않은 조각은 취소하고, 실행중인 조각은 기다리지 않는다
+            executor.shutdown(wait=False, cancel_futures=True)
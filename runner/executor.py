@@ -1,13 +1,88 @@
+import threading
+
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, Future
-from typing import Any, Callable, Union
+from typing import Any, Callable, Dict, Hashable, Iterable, Union
 
 
 class ParallelExecutor:
-    def __init__(self, max_request=300):
+    """
+    동시에 실행하는 요청 수를 max_request 로, 벤더별 요청 수를 vendor_limits 로 제한한다.
+    자리가 없으면 요청을 내부 큐에 쌓지 않으므로, 러너는 available 만큼만 Redis 에서 꺼내야 한다.
+    """
+
+    def __init__(self, max_request=300, vendor_limits: Dict[Hashable, int] = None):
         self.__max_request = max_request
+        self.__vendor_limits = vendor_limits or {}
         self.__executor = ThreadPoolExecutor(max_workers=max_request)
+        self.__condition = threading.Condition()
+        self.__running = 0
+        self.__vendor_running = Counter()
+
+    @property
+    def max_request(self):
+        return self.__max_request
+
+    @property
+    def vendor_limits(self):
+        return dict(self.__vendor_limits)
+
+    @property
+    def available(self):
+        with self.__condition:
+            return self.__max_request - self.__running
+
+    def running(self, vendor: Hashable = None):
+        with self.__condition:
+            return self.__running if vendor is None else self.__vendor_running[vendor]
+
+    def __has_slot(self, vendor: Hashable):
+        if self.__running >= self.__max_request:
+            return False
+        limit = self.__vendor_limits.get(vendor)
+        return limit is None or self.__vendor_running[vendor] < limit
 
-    def submit(self, request_fn: Callable, response_fn: Union[Callable[[Future], Any], None]):
+    def __release(self, vendor: Hashable):
+        with self.__condition:
+            self.__running -= 1
+            self.__vendor_running[vendor] -= 1
+            self.__condition.notify_all()
+
+    def __run(self, request_fn: Callable, response_fn: Union[Callable[[Future], Any], None], vendor: Hashable):
         future = self.__executor.submit(request_fn)
         if response_fn:
             future.add_done_callback(response_fn)
+        # 응답까지 끝난 뒤 자리를 돌려준다
+        future.add_done_callback(lambda _: self.__release(vendor))
+        return future
+
+    def wait_for_capacity(self, timeout: float = None) -> bool:
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.__running < self.__max_request, timeout)
+
+    def wait_for_vendors(self, vendors: Iterable[Hashable], timeout: float = None) -> bool:
+        # vendors 중 하나라도 자리가 날 때까지 기다린다 - 이미 자리가 있다면 바로 반환한다
+        vendors = list(vendors)
+        with self.__condition:
+            return self.__condition.wait_for(lambda: any(self.__has_slot(vendor) for vendor in vendors), timeout)
+
+    def wait_for_release(self, timeout: float = None):
+        with self.__condition:
+            self.__condition.wait(timeout)
+
+    def try_submit(self, request_fn: Callable, response_fn: Union[Callable[[Future], Any], None], vendor: Hashable = None) -> Union[Future, None]:
+        # 자리가 없으면 None 을 반환한다
+        with self.__condition:
+            if not self.__has_slot(vendor):
+                return None
+            self.__running += 1
+            self.__vendor_running[vendor] += 1
+        return self.__run(request_fn, response_fn, vendor)
+
+    def submit(self, request_fn: Callable, response_fn: Union[Callable[[Future], Any], None], vendor: Hashable = None) -> Future:
+        # 자리가 날 때까지 기다린다
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__has_slot(vendor))
+            self.__running += 1
+            self.__vendor_running[vendor] += 1
+        return self.__run(request_fn, response_fn, vendor)
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Mapping, Union
+
+from transcribers import BaseTranscriber, Lang, Vendor
+
+from .executor import ParallelExecutor
+from .registry import loaded_values
+
+
+class VendorHealth:
+    """
+    벤더의 최근 window 개 요청의 지연 시간과 실패 여부로 상태를 계산한다.
+    score 는 성공률을 지연 시간으로 나눈 값으로, 느리거나 자주 실패할수록 낮아진다.
+    """
+
+    def __init__(self, window=100, min_samples=10, latency_scale=30.0):
+        self.__latencies = deque(maxlen=window)
+        self.__failures = deque(maxlen=window)
+        self.__min_samples = min_samples
+        self.__latency_scale = latency_scale
+        self.__lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self.__lock:
+            self.__failures.append(0 if ok else 1)
+            # 실패한 요청의 지연 시간은 분포를 왜곡하므로 성공한 요청만 기록한다
+            if ok:
+                self.__latencies.append(latency)
+
+    def percentile(self, q: float):
+        with self.__lock:
+            if len(self.__latencies) < self.__min_samples:
+                return None
+            latencies = sorted(self.__latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    @property
+    def failure_rate(self):
+        with self.__lock:
+            return sum(self.__failures) / len(self.__failures) if self.__failures else 0.0
+
+    @property
+    def score(self):
+        median = self.percentile(0.5)
+        latency_penalty = 1 + (median or 0) / self.__latency_scale
+        return (1 - self.failure_rate) / latency_penalty
+
+
+class HedgedTranscriber(BaseTranscriber):
+    """
+    요청된 벤더(primary)가 최근 지연 시간의 percentile 안에 끝나지 않으면 다른 벤더(backup)에도 같은 요청을 보낸다.
+    먼저 성공한 결과를 사용하고 나머지 요청은 취소한다.
+    primary 의 상태 점수가 backup 보다 switch_ratio 배 이상 나쁘면 backup 을 먼저 요청한다.
+    웹훅으로 결과를 받는 벤더는 결과를 기다릴 수 없으므로 사용할 수 없다.
+    첫 요청은 러너가 이미 자리를 준 요청이므로 max_parallel 크기의 풀에서 실행하고 (max_parallel 은 벤더의 동시 요청 수 제한에 맞춘다),
+    backup 요청은 러너의 requester 에 자리가 있을 때만 보낸다 - backup 벤더의 동시 요청 수 제한을 넘지 않는다.
+    """
+
+    def __init__(self, vendor: Vendor, transcribers: Mapping[Vendor, BaseTranscriber], health: Dict[Vendor, VendorHealth], requester: ParallelExecutor,
+                 percentile=0.95, min_delay=5.0, max_delay=120.0, switch_ratio=2.0, max_parallel=300):
+        self.__vendor = vendor
+        self.__transcribers = transcribers
+        self.__health = health
+        self.__requester = requester
+        self.__percentile = percentile
+        self.__min_delay = min_delay
+        self.__max_delay = max_delay
+        self.__switch_ratio = switch_ratio
+        self.__executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='hedge')
+
+    @property
+    def transcriber(self):
+        return self.__transcribers[self.__vendor]
+
+    def detach(self):
+        for transcriber in loaded_values(self.__transcribers):
+            transcriber.detach()
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        # 체크포인트는 요청된 벤더의 작업으로 남긴다 - backup 이 먼저 끝나면 결과를 발행하면서 지워진다
+        return self.transcriber.job_handle(src, lang, media_format)
+
+    def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        # 이미 시작한 작업을 이어받으므로 backup 요청은 보내지 않는다
+        return self.transcriber.resume(handle, src, lang, media_format, duration=duration)
+
+    def __route(self) -> List[Vendor]:
+        primary = self.__vendor
+        backups = sorted((vendor for vendor in self.__transcribers if vendor != primary), key=lambda vendor: self.__health[vendor].score, reverse=True)
+        if backups and self.__health[backups[0]].score > self.__health[primary].score * self.__switch_ratio:
+            logging.info(f'Vendor is unhealthy. Routed to backup vendor. Vendor={primary.value}, Backup={backups[0].value}')
+            return [backups[0], primary] + backups[1:]
+        return [primary] + backups
+
+    def __hedge_delay(self, vendor: Vendor):
+        delay = self.__health[vendor].percentile(self.__percentile)
+        if delay is None:
+            return self.__max_delay
+        return min(self.__max_delay, max(self.__min_delay, delay))
+
+    def __start(self, vendor: Vendor, src: str, lang: Lang, media_format: str, duration: float, cancelled: threading.Event, backup: bool) -> Union[Future, None]:
+        # backup 요청은 자리가 없으면 보내지 않고 None 을 반환한다
+        def __request_fn():
+            started_at = time.monotonic()
+            result = None
+            try:
+                result = self.__transcribers[vendor].transcribe(src, lang, media_format, duration=duration)
+                return result
+            finally:
+                elapsed = time.monotonic() - started_at
+                if not cancelled.is_set():
+                    self.__health[vendor].record(elapsed, result is not None)
+                elif backup:
+                    # 이기지 못한 backup 은 실패로 기록한다
+                    self.__health[vendor].record(elapsed, False)
+                else:
+                    # 취소된 첫 요청은 끝까지 걸린 시간을 모르지만 적어도 취소될 때까지는 걸렸다 - 느린 벤더의 점수가 내려가도록 그 시간을 기록한다
+                    self.__health[vendor].record(elapsed, True)
+
+        if backup:
+            return self.__requester.try_submit(__request_fn, None, vendor.value)
+        return self.__executor.submit(__request_fn)
+
+    def __wait(self, pending: Dict[Future, Vendor], timeout: Union[float, None], src: str):
+        # 먼저 성공한 결과를 반환한다 - 모든 요청이 실패했거나 timeout 이 지나면 None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                winner = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    logging.exception(f'Failed to transcribe. Vendor={winner.value}, Src={src}')
+                    result = None
+                if result is not None:
+                    if winner != self.__vendor:
+                        logging.info(f'Backup vendor won. Vendor={self.__vendor.value}, Winner={winner.value}, Src={src}')
+                    return result
+        return None
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        vendors = self.__route()
+        pending = {}
+        cancelled = threading.Event()
+        try:
+            for index, vendor in enumerate(vendors):
+                future = self.__start(vendor, src, lang, media_format, duration, cancelled, index > 0)
+                if future is None:
+                    logging.info(f'Backup vendor is busy. Vendor={self.__vendor.value}, Backup={vendor.value}, Src={src}')
+                else:
+                    pending[future] = vendor
+                # 마지막 벤더를 요청했거나 backup 벤더에 자리가 없다면 진행중인 요청이 모두 끝날 때까지 기다린다
+                last = future is None or index == len(vendors) - 1
+                result = self.__wait(pending, None if last else self.__hedge_delay(vendor), src)
+                if result is not None or last:
+                    return result
+                if not pending:
+                    logging.warning(f'Vendor failed. Retrying with backup vendor. Vendor={vendor.value}, Src={src}')
+                else:
+                    logging.info(f'Vendor is slow. Started backup request. Vendor={vendor.value}, Backup={vendors[index + 1].value}, Src={src}')
+            return None
+        finally:
+            # 먼저 끝난 요청 외의 요청은 취소한다
+            if pending:
+                cancelled.set()
+            for future, vendor in pending.items():
+                try:
+                    self.__transcribers[vendor].cancel(src, lang, media_format)
+                except Exception:
+                    logging.exception(f'Failed to cancel request. Vendor={vendor.value}, Src={src}')
@@ -0,0 +1,157 @@
+import logging
+import random
+import time
+import uuid
+
+from redis import StrictRedis
+
+from transcribers import BaseTranscriber, Lang, ThrottledError
+
+
+RATE_LIMIT_PREFIX = 'trans-ratelimit:'
+
+
+class RedisRateLimiter:
+    """
+    모든 러너가 Redis 로 공유하는 벤더별 요청량 제한.
+    - 토큰 버킷: 초당 rate 개, 최대 burst 개의 요청을 시작할 수 있다.
+    - 동시 슬롯: 동시에 진행중인 요청을 max_concurrent 개로 제한한다. 러너가 죽어도 slot_ttl 이 지나면 슬롯이 반납된다.
+    """
+
+    # 토큰이 있으면 하나를 쓰고 0 을, 없으면 토큰이 생길 때까지 기다려야 하는 시간(초)을 반환한다
+    TOKEN_SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+    return tostring(wait)
+    """
+
+    # 만료된 슬롯을 정리하고, 빈 슬롯이 있으면 차지한다
+    SLOT_SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])))
+    return 1
+    """
+
+    # 요청량 제한에 걸렸다면 다른 러너도 잠시 요청하지 않도록 토큰을 비운다
+    DRAIN_SCRIPT = """
+    local now = redis.call('TIME')
+    redis.call('HSET', KEYS[1], 'tokens', 0, 'ts', tonumber(now[1]) + tonumber(now[2]) / 1000000)
+    return 1
+    """
+
+    def __init__(self, redis: StrictRedis, name: str, rate: float = None, burst: int = None, max_concurrent: int = None, slot_ttl: float = 3600, poll_interval: float = 0.5):
+        self.__redis = redis
+        self.__name = name
+        self.__rate = rate
+        self.__burst = burst or max(1, int(rate or 1))
+        self.__max_concurrent = max_concurrent
+        self.__slot_ttl = slot_ttl
+        self.__poll_interval = poll_interval
+        self.__bucket_key = f'{RATE_LIMIT_PREFIX}{name}:bucket'
+        self.__slots_key = f'{RATE_LIMIT_PREFIX}{name}:slots'
+        self.__token_script = redis.register_script(self.TOKEN_SCRIPT)
+        self.__slot_script = redis.register_script(self.SLOT_SCRIPT)
+        self.__drain_script = redis.register_script(self.DRAIN_SCRIPT)
+
+    @property
+    def name(self):
+        return self.__name
+
+    def acquire_slot(self, timeout: float = None):
+        # 차지한 슬롯의 아이디를 반환한다 - 동시 슬롯 제한이 없으면 None
+        if not self.__max_concurrent:
+            return None
+        slot = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.__slot_script(keys=[self.__slots_key], args=[self.__max_concurrent, self.__slot_ttl, slot]):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise ThrottledError(f'No concurrent slot is available. Vendor={self.__name}')
+            time.sleep(self.__poll_interval * random.uniform(0.5, 1.5))
+        return slot
+
+    def release_slot(self, slot):
+        if slot:
+            self.__redis.zrem(self.__slots_key, slot)
+
+    def acquire_token(self, timeout: float = None):
+        if not self.__rate:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = float(self.__token_script(keys=[self.__bucket_key], args=[self.__rate, self.__burst]))
+            if wait <= 0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise ThrottledError(f'No token is available. Vendor={self.__name}')
+            time.sleep(wait * random.uniform(1, 1.5))
+
+    def drain(self):
+        if self.__rate:
+            self.__drain_script(keys=[self.__bucket_key])
+
+
+class RateLimitedTranscriber(BaseTranscriber):
+    """
+    벤더 요청 전에 RedisRateLimiter 에서 슬롯과 토큰을 얻고, 요청량 제한(ThrottledError)에 걸리면 지터를 넣은 지수 백오프로 다시 요청한다.
+    """
+
+    def __init__(self, transcriber: BaseTranscriber, limiter: RedisRateLimiter, max_retries=5, base_delay=1.0, max_delay=30.0, acquire_timeout: float = None):
+        self.__transcriber = transcriber
+        self.__limiter = limiter
+        self.__max_retries = max_retries
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__acquire_timeout = acquire_timeout
+
+    @property
+    def transcriber(self):
+        return self.__transcriber
+
+    def cancel(self, src: str, lang: Lang, media_format: str = 'wav'):
+        self.__transcriber.cancel(src, lang, media_format)
+
+    def detach(self):
+        self.__transcriber.detach()
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        # resume 은 전달하지 않는다 - 작업이 없어 새로 요청하는 경우에도 요청량 제한을 거치도록 transcribe 로 이어받는다
+        return self.__transcriber.job_handle(src, lang, media_format)
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        attempt = 0
+        while True:
+            slot = self.__limiter.acquire_slot(self.__acquire_timeout)
+            try:
+                self.__limiter.acquire_token(self.__acquire_timeout)
+                return self.__transcriber.transcribe(src, lang, media_format, duration=duration)
+            except ThrottledError:
+                if attempt >= self.__max_retries:
+                    raise
+                self.__limiter.drain()
+            finally:
+                self.__limiter.release_slot(slot)
+
+            # Full Jitter - 여러 러너가 동시에 다시 요청하지 않도록 대기 시간을 흩뜨린다
+            delay = random.uniform(0, min(self.__max_delay, self.__base_delay * 2 ** attempt))
+            attempt += 1
+            logging.warning(f'Transcribing is throttled. Retrying. Vendor={self.__limiter.name}, Src={src}, Attempt={attempt}, Delay={delay:.1f}')
+            time.sleep(delay)
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from transcribers import Vendor
+
+
+class VendorRegistry(Mapping):
+    """
+    벤더별 transcriber 를 처음 요청될 때 만든다 - Dict[Vendor, (use_webhook, transcriber)] 대신 러너에 전달한다.
+    factory 는 벤더 모듈을 함수 안에서 import 하므로, 사용하지 않는 벤더의 모듈과 클라이언트는 만들어지지 않는다.
+    enabled 에 없는 벤더는 등록해도 무시되어 in 검사에서 빠진다.
+    """
+
+    def __init__(self, enabled: Iterable[str] = None):
+        self.__enabled = None if enabled is None else set(enabled)
+        self.__factories: Dict[Vendor, Callable[[], Any]] = {}
+        self.__use_webhook: Dict[Vendor, bool] = {}
+        self.__loaded: Dict[Vendor, Tuple[bool, Any]] = {}
+        self.__lock = threading.Lock()
+
+    def register(self, vendor: Vendor, factory: Callable[[], Any], use_webhook=False):
+        if self.__enabled is not None and vendor.value not in self.__enabled:
+            return self
+        self.__factories[vendor] = factory
+        self.__use_webhook[vendor] = use_webhook
+        return self
+
+    def use_webhook(self, vendor: Vendor) -> bool:
+        return self.__use_webhook[vendor]
+
+    def __getitem__(self, vendor: Vendor) -> Tuple[bool, Any]:
+        loaded = self.__loaded.get(vendor)
+        if loaded is not None:
+            return loaded
+        factory = self.__factories[vendor]
+        with self.__lock:
+            # 같은 벤더의 요청이 동시에 와도 한번만 만든다
+            if vendor not in self.__loaded:
+                started_at = time.perf_counter()
+                self.__loaded[vendor] = (self.__use_webhook[vendor], factory())
+                logging.info(f'Vendor is loaded. Vendor={vendor.value}, Elapsed={time.perf_counter() - started_at:.3f}s')
+            return self.__loaded[vendor]
+
+    def __contains__(self, vendor) -> bool:
+        return vendor in self.__factories
+
+    def __iter__(self):
+        return iter(self.__factories)
+
+    def __len__(self):
+        return len(self.__factories)
+
+    def view(self, vendors: Iterable[Vendor]) -> 'TranscriberView':
+        return TranscriberView(self, vendors)
+
+    def loaded(self) -> Dict[Vendor, Tuple[bool, Any]]:
+        return dict(self.__loaded)
+
+    def is_loaded(self, vendor: Vendor) -> bool:
+        return vendor in self.__loaded
+
+    def preload(self):
+        # 첫 요청을 기다리지 않고 백그라운드에서 미리 만든다 - 만드는 중에 온 요청은 같은 벤더가 만들어질 때까지 기다린다
+        def __load():
+            for vendor in list(self.__factories):
+                try:
+                    self[vendor]
+                except Exception:
+                    logging.exception(f'Failed to load the vendor. Vendor={vendor.value}')
+        thread = threading.Thread(target=__load, daemon=True, name='vendor-preload')
+        thread.start()
+        return thread
+
+
+class TranscriberView(Mapping):
+    """
+    VendorRegistry 의 일부 벤더를 Dict[Vendor, transcriber] 처럼 보여준다 - HedgedTranscriber 처럼 transcriber 만 받는 곳에 전달한다.
+    값을 꺼낼 때 registry 에서 만들어지므로, 백업 벤더는 처음 백업 요청을 보낼 때 만들어진다.
+    """
+
+    def __init__(self, registry: VendorRegistry, vendors: Iterable[Vendor]):
+        self.__registry = registry
+        self.__vendors = [vendor for vendor in vendors if vendor in registry]
+
+    def __getitem__(self, vendor: Vendor):
+        if vendor not in self.__vendors:
+            raise KeyError(vendor)
+        return self.__registry[vendor][1]
+
+    def __iter__(self):
+        return iter(self.__vendors)
+
+    def __len__(self):
+        return len(self.__vendors)
+
+    def loaded(self) -> Dict[Vendor, Any]:
+        return {vendor: transcriber for vendor, (_, transcriber) in self.__registry.loaded().items() if vendor in self.__vendors}
+
+
+def loaded_values(transcribers: Mapping):
+    # 만들어진 값만 반환한다 - 정리하려고 사용하지 않은 벤더를 새로 만들지 않는다
+    if isinstance(transcribers, (VendorRegistry, TranscriberView)):
+        return list(transcribers.loaded().values())
+    return list(transcribers.values())
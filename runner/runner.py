@@ -1,62 +1,262 @@
+from collections import deque
 from concurrent.futures import Future
-from typing import Dict, Any, Tuple
+from typing import Deque, Dict, Any, List, Tuple, Callable, Union
 from redis import StrictRedis
 
-from transcribers import BaseTranscriber
+from transcribers import BaseTranscriber, ThrottledError
 from transcribers import Vendor, Lang, TranscriptionRequest
 from downloader.base_downloader import BaseDownloader
+from messaging import RequestQueue, QueueItem, ListRequestQueue, publish_result, create_webhook_key, create_partial_key
 
 import orjson
+import logging
+import threading
 import time
 
+from monitoring.metrics import DISPATCH_LAG, TRANSCRIBE_LATENCY, TRANSCRIBE_ERRORS, RESULT_BYTES
+from monitoring.tracing import Trace, create_trace_key
+
 from .executor import ParallelExecutor
+from .checkpoint import JobCheckpoints
+from .registry import loaded_values
 
 
 class TranscriptionRequestRunner:
-    def __init__(self, redis: StrictRedis, transcribers: Dict[Vendor, Tuple[bool, Any]], requester: ParallelExecutor, downloader: BaseDownloader, tempdir: str, live_timeout=60 * 60 * 24):
+    def __init__(self, redis: StrictRedis, transcribers: Dict[Vendor, Tuple[bool, Any]], requester: ParallelExecutor, downloader: BaseDownloader, tempdir: str, live_timeout=60 * 60 * 24, queue: RequestQueue = None, result_format='json', tracing=False, checkpoints: JobCheckpoints = None, drain_timeout=60, park_limit: int = None):
         self.__redis = redis
+        self.__result_format = result_format
+        self.__tracing = tracing
+        self.__queue = queue or ListRequestQueue(redis)
         self.__transcribers = transcribers
         self.__requester = requester
         self.__live_timeout = live_timeout
         self.__downloader = downloader
         self.__tempdir = tempdir
+        self.__checkpoints = checkpoints or JobCheckpoints(redis, self.__queue.consumer, live_timeout)
+        # 종료 - 새 요청을 꺼내지 않고, drain_timeout 동안 실행중인 요청을 기다린 뒤 남은 요청은 큐로 되돌린다
+        self.__drain_timeout = drain_timeout
+        self.__stopping = threading.Event()
+        self.__lock = threading.Lock()
+        self.__in_flight: Dict[int, QueueItem] = {}
+        self.__handed_off = False
+        # 벤더가 바빠서 실행하지 못한 요청 - 벤더별로 park_limit 개까지 들고 있다가 자리가 나면 먼저 실행한다
+        # 그보다 많으면 큐의 뒤로 보내서, 바쁜 벤더의 요청이 다른 벤더의 요청을 막지 않게 한다
+        self.__parked: Dict[Vendor, Deque[Tuple[QueueItem, TranscriptionRequest]]] = {}
+        self.__park_limit = park_limit or self.__queue.batch_size
+        # 마지막으로 요청을 실행한 뒤 건너뛴 요청 수 - 큐를 한바퀴 돌았다면 자리가 날 때까지 기다린다
+        self.__skipped = 0
+
+    def stop(self):
+        # 시그널 핸들러에서 호출할 수 있도록 기다리지 않는다 - poll 이 정리 후 반환된다
+        self.__stopping.set()
+
+    def __finish(self, item_id: int) -> bool:
+        # 다른 러너에게 넘긴 요청은 결과를 기록하지 않는다
+        with self.__lock:
+            self.__in_flight.pop(item_id, None)
+            return not self.__handed_off
+
+    def make_request_and_response(self, transcriber: BaseTranscriber, s3_file_key: str, data_key: str, lang: Lang, use_webhook: bool, ack: Union[Callable, None] = None, media_format: str = 'wav', vendor: Vendor = None, trace_id: str = None, finish: Callable[[], bool] = None, duration: float = None):
+        vendor_label = vendor.value if vendor else 'unknown'
+        # 클라이언트가 추적을 요청한 경우 단계별 시각을 기록한다
+        trace = Trace(trace_id, vendor_label).mark('dispatched') if trace_id and self.__tracing else None
+        # 음성인식 중간 결과 - 조각으로 나눠 인식하는 경우
+        chunked = transcriber.partial_results and not use_webhook
+        partial_key = create_partial_key(data_key)
+
+        def __partial_fn(transcription):
+            self.__redis.set(partial_key, transcription.encode(self.__result_format), ex=self.__live_timeout)
 
-    def make_request_and_response(self, transcriber: BaseTranscriber, s3_file_key: str, data_key: str, lang: Lang, use_webhook: bool):
         # 음성인식 요청
         def __request_fn():
-            return data_key, transcriber.transcribe(s3_file_key, lang)
+            started_at = time.monotonic()
+            if trace:
+                trace.mark('vendor_started')
+            # 이전 러너가 요청하고 결과를 남기기 전에 멈췄다면, 다시 요청하지 않고 남긴 작업을 이어받는다
+            checkpoint = self.__checkpoints.load(data_key)
+            handle = checkpoint.handle if checkpoint and checkpoint.vendor == vendor_label else None
+            if handle:
+                logging.info(f'Resuming the vendor job. DataKey={data_key}, Handle={handle}, Consumer={checkpoint.consumer}')
+                if use_webhook:
+                    return data_key, handle
+            else:
+                if checkpoint:
+                    logging.warning(f'Previous runner stopped before the vendor job is known. Requesting again. DataKey={data_key}, Consumer={checkpoint.consumer}')
+                # 벤더에 요청하기 전에 남긴다 - 요청 중에 멈춰도 같은 요청을 다시 처리하는 러너가 작업을 이어받는다
+                self.__checkpoints.save(data_key, vendor_label, transcriber.job_handle(s3_file_key, lang, media_format))
+            try:
+                if handle and not chunked:
+                    result = transcriber.resume(handle, s3_file_key, lang, media_format, duration=duration)
+                elif chunked:
+                    result = transcriber.transcribe(s3_file_key, lang, media_format, on_partial=__partial_fn, duration=duration)
+                else:
+                    result = transcriber.transcribe(s3_file_key, lang, media_format, duration=duration)
+            except ThrottledError:
+                # 재시도 후에도 요청량 제한에 걸렸다면 실패로 처리한다
+                logging.error(f'Transcribing is throttled after retries. DataKey={data_key}')
+                TRANSCRIBE_ERRORS.labels(vendor_label, 'throttled').inc()
+                return data_key, None
+            TRANSCRIBE_LATENCY.labels(vendor_label).observe(time.monotonic() - started_at)
+            if result is None:
+                TRANSCRIBE_ERRORS.labels(vendor_label, 'failed').inc()
+            elif use_webhook:
+                self.__checkpoints.save(data_key, vendor_label, result)
+            if trace:
+                trace.mark('vendor_completed')
+            return data_key, result
 
         # 음성인식 응답 - 동기
         def __response_fn(_future: Future):
+            if finish and not finish():
+                return
             data_key_from_request, transcription = _future.result()
-            transcription_text = '' if transcription is None else transcription.tojson()
-            self.__redis.set(data_key_from_request, transcription_text, ex=self.__live_timeout)
+            transcription_text = '' if transcription is None else transcription.encode(self.__result_format)
+            RESULT_BYTES.labels('runner').observe(len(transcription_text))
+            publish_result(self.__redis, data_key_from_request, transcription_text, ex=self.__live_timeout)
+            self.__checkpoints.delete(data_key_from_request)
+            if chunked:
+                self.__redis.delete(partial_key)
+            if trace:
+                trace.mark('published').flush(self.__redis)
+            if ack:
+                ack()
 
         # 음성인식 응답 - 비동기(웹훅)
         def __webhook_response_fn(_future: Future):
+            if finish and not finish():
+                return
             data_key_from_request, token = _future.result()
             if token:
                 # 토큰이 있다면 토큰 등록 후, 나중에 결과를 찾기 위한 토큰과 data_key 등록
-                self.__redis.set(f'transcriber-webhook:{token}', data_key_from_request, ex=self.__live_timeout)
+                self.__redis.set(create_webhook_key(token), data_key_from_request, ex=self.__live_timeout)
+                if trace:
+                    # 웹훅이 이어서 기록할 수 있도록 data_key 로 추적 아이디를 남긴다
+                    self.__redis.set(create_trace_key(data_key_from_request), trace.trace_id, ex=self.__live_timeout)
+                    trace.flush(self.__redis)
             else:
                 # 토큰 반환이 None 이라면 실패한것으로 간주
-                self.__redis.set(data_key_from_request, '', ex=self.__live_timeout)
+                publish_result(self.__redis, data_key_from_request, '', ex=self.__live_timeout)
+                if trace:
+                    trace.mark('published').flush(self.__redis)
+            self.__checkpoints.delete(data_key_from_request)
+            if ack:
+                ack()
 
         return __request_fn, __webhook_response_fn if use_webhook else  __response_fn
 
+    def __parked_items(self) -> List[QueueItem]:
+        return [item for parked in self.__parked.values() for item, _ in parked]
+
+    def __park(self, item: QueueItem, req: TranscriptionRequest):
+        parked = self.__parked.setdefault(req.vendor, deque())
+        if len(parked) < self.__park_limit:
+            parked.append((item, req))
+        else:
+            self.__queue.defer(item)
+
+    def __submit(self, item: QueueItem, req: TranscriptionRequest, use_webhook: bool, transcriber: BaseTranscriber) -> bool:
+        item_id = id(item)
+        request_fn, response_fn = self.make_request_and_response(transcriber, req.s3_file_key, req.data_key, req.lang, use_webhook, lambda: self.__queue.ack(item), req.media_format, req.vendor, req.trace_id,
+                                                                 lambda: self.__finish(item_id), req.duration)
+        with self.__lock:
+            self.__in_flight[item_id] = item
+        if self.__requester.try_submit(request_fn, response_fn, req.vendor.value) is None:
+            with self.__lock:
+                self.__in_flight.pop(item_id, None)
+            return False
+        if req.enqueued_at:
+            DISPATCH_LAG.labels(req.vendor.value).observe(max(0.0, time.time() - req.enqueued_at))
+        return True
+
+    def dispatch(self, item: QueueItem) -> bool:
+        # 벤더의 동시 요청 수가 가득 차서 요청을 실행하지 못했다면 (들고 있거나 큐의 뒤로 보냈다면) False 를 반환한다
+        try:
+            req = TranscriptionRequest.parse_obj(orjson.loads(item.payload))
+        except ValueError:
+            # 해석할 수 없는 요청은 다시 처리해도 실패하므로 버린다
+            logging.error(f'Invalid transcription request is dropped. payload={item.payload}')
+            TRANSCRIBE_ERRORS.labels('unknown', 'invalid').inc()
+            self.__queue.ack(item)
+            return True
+
+        if req.vendor in self.__transcribers:
+            try:
+                use_webhook, transcriber = self.__transcribers[req.vendor]
+            except Exception:
+                # 벤더를 만들지 못했다 (클라이언트 생성 실패, 설정 오류) - poll 을 멈추지 않고 요청을 실패로 끝낸다
+                logging.exception(f'Failed to load the vendor. Vendor={req.vendor.value}, DataKey={req.data_key}')
+                TRANSCRIBE_ERRORS.labels(req.vendor.value, 'load_failed').inc()
+                publish_result(self.__redis, req.data_key, '', ex=self.__live_timeout)
+                self.__queue.ack(item)
+                return True
+            # 먼저 기다리던 같은 벤더의 요청을 앞지르지 않는다
+            if self.__parked.get(req.vendor) or not self.__submit(item, req, use_webhook, transcriber):
+                self.__park(item, req)
+                return False
+        else:
+            # Transcriber 없음
+            TRANSCRIBE_ERRORS.labels(req.vendor.value, 'unknown_vendor').inc()
+            publish_result(self.__redis, req.data_key, '', ex=self.__live_timeout)
+            self.__queue.ack(item)
+        return True
+
+    def __wait_for_parked(self):
+        self.__requester.wait_for_vendors([vendor.value for vendor, parked in self.__parked.items() if parked], self.__queue.timeout)
+
+    def dispatch_parked(self) -> int:
+        # 자리가 난 벤더의 기다리던 요청을 먼저 실행하고, 실행한 요청 수를 반환한다
+        dispatched = 0
+        for vendor, parked in self.__parked.items():
+            use_webhook, transcriber = self.__transcribers[vendor]
+            while parked and self.__submit(*parked[0], use_webhook, transcriber):
+                parked.popleft()
+                dispatched += 1
+        return dispatched
+
     def poll(self):
-        while True:
-            req = self.__redis.lpop('trans-broker-queue')
-            if not req:
-                time.sleep(1)
+        # 이전에 죽은 러너가 처리하지 못한 요청을 큐로 되돌린다
+        self.__queue.recover()
+        while not self.__stopping.is_set():
+            with self.__lock:
+                in_flight = list(self.__in_flight.values())
+            self.__queue.keepalive(in_flight + self.__parked_items())
+            dispatched = self.dispatch_parked()
+            # 실행할 자리가 있을 때만 꺼낸다 - 나머지 요청은 다른 러너가 가져갈 수 있도록 Redis 에 남겨둔다
+            if not self.__requester.wait_for_capacity(self.__queue.timeout):
+                continue
+            if self.__parked_items() and not self.__queue.depth():
+                # 큐가 비어있다면 pop 에서 기다리지 않고, 들고 있는 요청의 벤더에 자리가 날 때까지 기다린다
+                self.__wait_for_parked()
                 continue
+            items = self.__queue.pop(min(self.__queue.batch_size, self.__requester.available))
+            dispatched += sum(self.dispatch(item) for item in items)
+            if dispatched:
+                self.__skipped = 0
+            elif items:
+                self.__skipped += len(items)
+                # 꺼낸 요청의 벤더가 모두 바쁘다면 큐를 한바퀴 돌 때까지 건너뛰며 다른 벤더의 요청을 찾고,
+                # 그래도 없다면 실행중인 요청이 끝날 때까지 기다린 뒤 다시 찾는다
+                if self.__skipped >= self.__queue.depth():
+                    self.__wait_for_parked()
+                    self.__skipped = 0
+        self.__drain()
 
-            req = TranscriptionRequest.parse_obj(orjson.loads(req.decode()))
+    def __drain(self):
+        deadline = time.monotonic() + self.__drain_timeout
+        logging.info(f'Stopping the runner. Waiting for in-flight requests. Running={self.__requester.running()}')
+        while self.__requester.running() and time.monotonic() < deadline:
+            self.__requester.wait_for_release(min(1.0, max(0.0, deadline - time.monotonic())))
 
-            if req.vendor in self.__transcribers:
-                use_webhook, transcriber = self.__transcribers[req.vendor]
-                request_fn, response_fn = self.make_request_and_response(transcriber, req.s3_file_key, req.data_key, req.lang, use_webhook)
-                self.__requester.submit(request_fn, response_fn)
-            else:
-                # Transcriber 없음
-                self.__redis.set(req.data_key, '')
+        # 끝나지 않은 요청은 큐로 되돌린다 - 벤더 작업은 지우지 않고 남겨두어, 요청을 다시 꺼낸 러너가 이어받는다
+        with self.__lock:
+            self.__handed_off = True
+            items = list(self.__in_flight.values())
+            self.__in_flight.clear()
+        items += self.__parked_items()
+        self.__parked.clear()
+        for item in items:
+            self.__queue.requeue(item)
+        for _, transcriber in loaded_values(self.__transcribers):
+            transcriber.detach()
+        logging.info(f'Runner is stopped. HandedOff={len(items)}')
+        return len(items)
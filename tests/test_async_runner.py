@@ -0,0 +1,64 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import orjson
+
+from messaging import ReliableRequestQueue
+from runner.async_runner import AsyncTranscriptionRequestRunner
+from runner.checkpoint import JobCheckpoints
+from transcribers import AsyncBaseTranscriber, Lang, Transcription, Vendor
+
+
+class DelayedTranscriber(AsyncBaseTranscriber):
+    def __init__(self, vendor: Vendor, delay: float):
+        self.vendor = vendor
+        self.delay = delay
+        self.calls = 0
+
+    async def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return Transcription([src], [1.0], [], self.vendor.value)
+
+
+class SlowDeleteCheckpoints(JobCheckpoints):
+    # 결과를 발행한 뒤 ack 하기 전에 멈춘다 - drain 이 발행중인 요청을 만나게 한다
+    def __init__(self, redis, consumer: str, delay: float):
+        super().__init__(redis, consumer)
+        self.delay = delay
+        self.publishing = asyncio.Event()
+
+    async def delete_async(self, data_key: str):
+        self.publishing.set()
+        await asyncio.sleep(self.delay)
+        await super().delete_async(data_key)
+
+
+def create_payload(data_key: str, vendor: Vendor) -> bytes:
+    return orjson.dumps({'data_key': data_key, 's3_file_key': data_key, 'file_key': data_key, 'lang': Lang.LANG_KO.value, 'vendor': vendor.value})
+
+
+def test_drain_requeues_only_unpublished_requests():
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeStrictRedis(server=server)
+    async_redis = fakeredis.aioredis.FakeRedis(server=server)
+    queue = ReliableRequestQueue(redis, batch_size=4, timeout=1)
+    transcribers = {Vendor.AWS: (False, DelayedTranscriber(Vendor.AWS, 0)), Vendor.ClovaNest: (False, DelayedTranscriber(Vendor.ClovaNest, 10))}
+    queue.push(create_payload('aw-0', Vendor.AWS), create_payload('cn-0', Vendor.ClovaNest))
+
+    async def run():
+        checkpoints = SlowDeleteCheckpoints(async_redis, queue.consumer, 2)
+        runner = AsyncTranscriptionRequestRunner(async_redis, transcribers, queue, checkpoints=checkpoints, drain_timeout=0)
+        poll = asyncio.create_task(runner.poll())
+        await asyncio.wait_for(checkpoints.publishing.wait(), 5)
+        runner.stop()
+        await asyncio.wait_for(poll, 5)
+
+    asyncio.run(run())
+    # 발행을 시작한 요청은 끝까지 처리되고 ack 된다
+    assert redis.get('aw-0')
+    # 끝나지 않은 요청만 한번 되돌린다
+    assert redis.get('cn-0') is None
+    assert redis.lrange(queue.name, 0, -1) == [create_payload('cn-0', Vendor.ClovaNest)]
+    assert redis.llen(queue.processing) == 0
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from botocore.exceptions import ClientError
+
+from transcribers import AsyncAwsTranscriber, Lang, ThrottledError
+from transcribers.aws_transcriber import AwsTranscriber
+
+
+class FailingAwsTranscriber:
+    tracker = None
+    detached = True
+    timeout = 1
+    create_job_name = staticmethod(AwsTranscriber.create_job_name)
+    is_throttled = staticmethod(AwsTranscriber.is_throttled)
+
+    def __init__(self, code: str):
+        self.code = code
+
+    def start_job(self, job_name: str, src: str, lang: Lang, media_format: str = 'wav'):
+        raise ClientError({'Error': {'Code': self.code, 'Message': self.code}}, 'StartTranscriptionJob')
+
+
+def test_throttling_propagates_from_async_aws_transcriber():
+    transcriber = AsyncAwsTranscriber(FailingAwsTranscriber('ThrottlingException'))
+    with pytest.raises(ThrottledError):
+        asyncio.run(transcriber.transcribe('file.wav', Lang.LANG_KO))
+
+
+def test_other_client_errors_fail_the_request():
+    transcriber = AsyncAwsTranscriber(FailingAwsTranscriber('BadRequestException'))
+    assert asyncio.run(transcriber.transcribe('file.wav', Lang.LANG_KO)) is None
+
+
+class ThrottledPollAwsTranscriber(FailingAwsTranscriber):
+    detached = False
+    poll_backoff = staticmethod(lambda attempt: 0 if attempt < 2 else None)
+
+    def __init__(self):
+        super().__init__('ThrottlingException')
+        self.deleted = []
+
+    def start_job(self, job_name: str, src: str, lang: Lang, media_format: str = 'wav'):
+        pass
+
+    def get_job(self, job_name: str):
+        raise ClientError({'Error': {'Code': self.code, 'Message': self.code}}, 'GetTranscriptionJob')
+
+    def delete_job(self, job_name: str):
+        self.deleted.append(job_name)
+
+
+def test_throttled_poll_fails_without_deleting_job():
+    aws = ThrottledPollAwsTranscriber()
+    assert asyncio.run(AsyncAwsTranscriber(aws).transcribe('file.wav', Lang.LANG_KO)) is None
+    assert aws.deleted == []
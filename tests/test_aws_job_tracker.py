@@ -0,0 +1,145 @@
+import datetime
+
+import pytest
+
+from botocore.exceptions import ClientError
+
+from transcribers.utils.aws_job_tracker import TranscribeJobTracker
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class StubTranscribeClient:
+    """최신 작업부터 page_size 개씩 반환하는 ListTranscriptionJobs 와 GetTranscriptionJob"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.list_calls = 0
+        self.get_calls = 0
+
+    def add(self, job_name: str, status='IN_PROGRESS', created_at: datetime.datetime = None):
+        self.jobs[job_name] = {'TranscriptionJobName': job_name, 'TranscriptionJobStatus': status, 'CreationTime': created_at or utcnow()}
+
+    def list_transcription_jobs(self, MaxResults: int, NextToken: str = None, **kwargs):
+        self.list_calls += 1
+        jobs = sorted(self.jobs.values(), key=lambda job: job['CreationTime'], reverse=True)
+        offset = int(NextToken or 0)
+        response = {'TranscriptionJobSummaries': [dict(job) for job in jobs[offset:offset + MaxResults]]}
+        if offset + MaxResults < len(jobs):
+            response['NextToken'] = str(offset + MaxResults)
+        return response
+
+    def get_transcription_job(self, TranscriptionJobName: str):
+        self.get_calls += 1
+        if TranscriptionJobName not in self.jobs:
+            raise ClientError({'Error': {'Code': 'BadRequestException', 'Message': 'not found'}}, 'GetTranscriptionJob')
+        return {'TranscriptionJob': dict(self.jobs[TranscriptionJobName])}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def create_tracker(client, clock, **kwargs):
+    return TranscribeJobTracker(client, min_delay=1, max_delay=10, timeout=60, page_size=2, clock=clock, **kwargs)
+
+
+def test_finished_jobs_are_resolved_with_one_scan():
+    client, clock = StubTranscribeClient(), FakeClock()
+    tracker = create_tracker(client, clock)
+    for name in ('a', 'b', 'c'):
+        client.add(name)
+    futures = {name: tracker.track(name) for name in ('a', 'b', 'c')}
+
+    client.jobs['a']['TranscriptionJobStatus'] = 'COMPLETED'
+    client.jobs['c']['TranscriptionJobStatus'] = 'FAILED'
+    clock.now += 2
+    tracker.poll_once()
+
+    assert futures['a'].result(0)['TranscriptionJobStatus'] == 'COMPLETED'
+    assert futures['c'].result(0)['TranscriptionJobStatus'] == 'FAILED'
+    assert not futures['b'].done()
+    assert client.get_calls == 0
+    assert len(tracker) == 1
+
+
+def test_every_waiter_of_the_same_job_is_resolved():
+    client, clock = StubTranscribeClient(), FakeClock()
+    tracker = create_tracker(client, clock)
+    client.add('a')
+    first, second = tracker.track('a'), tracker.track('a')
+
+    client.jobs['a']['TranscriptionJobStatus'] = 'COMPLETED'
+    clock.now += 2
+    tracker.poll_once()
+
+    assert first.result(0)['TranscriptionJobName'] == 'a'
+    assert second.result(0)['TranscriptionJobName'] == 'a'
+
+
+def test_untracking_one_waiter_keeps_the_others():
+    client, clock = StubTranscribeClient(), FakeClock()
+    tracker = create_tracker(client, clock)
+    client.add('a')
+    first, second = tracker.track('a'), tracker.track('a')
+
+    tracker.untrack('a', first)
+    client.jobs['a']['TranscriptionJobStatus'] = 'COMPLETED'
+    clock.now += 2
+    tracker.poll_once()
+
+    assert first.cancelled()
+    assert second.result(0)['TranscriptionJobName'] == 'a'
+
+
+def test_adopted_job_created_before_the_scan_window_is_found():
+    client, clock = StubTranscribeClient(), FakeClock()
+    tracker = create_tracker(client, clock)
+    # 최신순으로 new-3, new-2 | new-1, new-0 | old-1, old-0 | adopted - 세번째 페이지에서 조회 범위를 벗어난다
+    client.add('adopted', created_at=utcnow() - datetime.timedelta(hours=2))
+    for i in range(2):
+        client.add(f'old-{i}', created_at=utcnow() - datetime.timedelta(hours=1))
+    for i in range(4):
+        client.add(f'new-{i}')
+    future = tracker.track('adopted')
+
+    clock.now += 2
+    tracker.poll_once()
+    assert not future.done()
+    assert client.get_calls == 1
+
+    client.jobs['adopted']['TranscriptionJobStatus'] = 'COMPLETED'
+    clock.now += 10
+    tracker.poll_once()
+    # 생성 시각을 알게 되었으므로 목록에서 찾는다
+    assert future.result(0)['TranscriptionJobStatus'] == 'COMPLETED'
+    assert client.get_calls == 1
+
+
+def test_deleted_job_fails_instead_of_waiting_for_the_deadline():
+    client, clock = StubTranscribeClient(), FakeClock()
+    tracker = create_tracker(client, clock)
+    future = tracker.track('deleted')
+
+    clock.now += 2
+    tracker.poll_once()
+    with pytest.raises(ClientError):
+        future.result(0)
+
+
+def test_job_fails_after_the_deadline():
+    client, clock = StubTranscribeClient(), FakeClock()
+    tracker = create_tracker(client, clock)
+    client.add('slow')
+    future = tracker.track('slow', timeout=5)
+
+    clock.now += 6
+    tracker.poll_once()
+    with pytest.raises(TimeoutError):
+        future.result(0)
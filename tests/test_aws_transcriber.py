@@ -0,0 +1,66 @@
+import pytest
+
+from botocore.exceptions import ClientError
+
+from transcribers import Lang, ThrottledError
+from transcribers.aws_transcriber import AwsTranscriber
+
+
+def client_error(code: str, operation: str):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class FakeTranscribeClient:
+    def __init__(self, start_error: str = None, get_errors=0):
+        self.start_error = start_error
+        self.get_errors = get_errors
+        self.deleted = []
+
+    def start_transcription_job(self, **kwargs):
+        if self.start_error:
+            raise client_error(self.start_error, 'StartTranscriptionJob')
+
+    def get_transcription_job(self, TranscriptionJobName):
+        if self.get_errors:
+            self.get_errors -= 1
+            raise client_error('ThrottlingException', 'GetTranscriptionJob')
+        return {'TranscriptionJob': {'TranscriptionJobStatus': 'FAILED'}}
+
+    def delete_transcription_job(self, TranscriptionJobName):
+        self.deleted.append(TranscriptionJobName)
+
+
+class FakeTransport:
+    def __init__(self, client):
+        self.__client = client
+
+    def client(self, service_name: str, **kwargs):
+        return self.__client
+
+
+def create_transcriber(client: FakeTranscribeClient, poll_retries=2):
+    transcriber = AwsTranscriber('key', 'secret', 'ap-northeast-2', 'bucket', transport=FakeTransport(client), poll_retries=poll_retries, poll_delay=0)
+    transcriber.wait_job = lambda job_name, duration=None: None
+    return transcriber
+
+
+def test_throttled_start_raises_without_deleting_job():
+    client = FakeTranscribeClient(start_error='ThrottlingException')
+    with pytest.raises(ThrottledError):
+        create_transcriber(client).transcribe('file.wav', Lang.LANG_KO)
+    assert client.deleted == []
+
+
+def test_throttled_poll_is_retried():
+    client = FakeTranscribeClient(get_errors=2)
+    assert create_transcriber(client).transcribe('file.wav', Lang.LANG_KO) is None
+    assert client.get_errors == 0
+    # 실패한 작업이므로 지운다
+    assert len(client.deleted) == 1
+
+
+def test_throttled_poll_after_retries_fails_without_deleting_job():
+    client = FakeTranscribeClient(get_errors=10)
+    # 작업은 진행중이므로 ThrottledError 로 다시 요청하게 하지 않고, 지우지도 않는다
+    assert create_transcriber(client).transcribe('file.wav', Lang.LANG_KO) is None
+    assert client.deleted == []
@@ -0,0 +1,70 @@
+from concurrent.futures import Future
+
+import fakeredis
+
+from messaging import ReliableRequestQueue
+from runner import ParallelExecutor, TranscriptionRequestRunner
+from runner.checkpoint import JobCheckpoints
+from transcribers import BaseTranscriber, Lang, Transcription, Vendor
+
+
+class HandleTranscriber(BaseTranscriber):
+    def __init__(self, checkpoints: JobCheckpoints):
+        self.checkpoints = checkpoints
+        self.seen = []
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        return f'job-{src}'
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        # 벤더에 요청하는 시점에 이미 체크포인트가 있어야 한다
+        self.seen.append(('transcribe', self.checkpoints.load(src)))
+        return Transcription([src], [1.0], [], Vendor.AWS.value)
+
+    def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        self.seen.append(('resume', handle))
+        return Transcription([src], [1.0], [], Vendor.AWS.value)
+
+
+def create_runner(redis):
+    queue = ReliableRequestQueue(redis, timeout=1)
+    checkpoints = JobCheckpoints(redis, queue.consumer)
+    return TranscriptionRequestRunner(redis, {}, ParallelExecutor(1), None, None, queue=queue, checkpoints=checkpoints), checkpoints
+
+
+def run(runner: TranscriptionRequestRunner, transcriber: BaseTranscriber, data_key: str):
+    request_fn, response_fn = runner.make_request_and_response(transcriber, data_key, data_key, Lang.LANG_KO, False, vendor=Vendor.AWS)
+    future = Future()
+    future.set_result(request_fn())
+    response_fn(future)
+
+
+def test_checkpoint_is_saved_before_request():
+    redis = fakeredis.FakeStrictRedis()
+    runner, checkpoints = create_runner(redis)
+    transcriber = HandleTranscriber(checkpoints)
+
+    run(runner, transcriber, 'a')
+
+    (action, checkpoint), = transcriber.seen
+    assert action == 'transcribe'
+    assert checkpoint.vendor == Vendor.AWS.value and checkpoint.handle == 'job-a'
+    # 결과를 발행하면 지운다
+    assert redis.get('a') is not None
+    assert checkpoints.load('a') is None
+
+
+def test_polling_request_resumes_checkpoint():
+    redis = fakeredis.FakeStrictRedis()
+    runner, checkpoints = create_runner(redis)
+    transcriber = HandleTranscriber(checkpoints)
+    checkpoints.save('a', Vendor.AWS.value, 'job-a')
+    # 다른 벤더의 체크포인트는 이어받지 않는다
+    checkpoints.save('b', Vendor.ClovaNest.value, 'token-b')
+
+    run(runner, transcriber, 'a')
+    run(runner, transcriber, 'b')
+
+    assert transcriber.seen[0] == ('resume', 'job-a')
+    assert transcriber.seen[1][0] == 'transcribe'
+    assert checkpoints.load('a') is None and checkpoints.load('b') is None
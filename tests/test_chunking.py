@@ -0,0 +1,139 @@
+import shutil
+import threading
+import wave
+
+import numpy as np
+
+from downloader.base_downloader import BaseDownloader
+from runner.chunking import AudioChunk, ChunkedTranscriber, find_split_points, merge_transcriptions, plan_chunks, split_wav
+from transcribers import BaseTranscriber, Lang, Transcription, TranscriptionWord, Vendor
+
+
+RATE = 8000
+
+
+def write_wav(filename: str, seconds: float, silences):
+    # 440Hz 음 사이에 (시작, 끝) 구간의 침묵을 넣는다
+    t = np.arange(int(seconds * RATE)) / RATE
+    samples = 8000 * np.sin(2 * np.pi * 440 * t)
+    for start, end in silences:
+        samples[int(start * RATE):int(end * RATE)] = 0
+    with wave.open(filename, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(samples.astype('<i2').tobytes())
+
+
+def test_find_split_points_picks_quietest_frame_near_target():
+    energies = np.ones(100)
+    # 0.1초 프레임, 목표 지점 3초 앞뒤 1초 안에 가장 조용한 프레임은 3.5초
+    energies[35] = 0
+    # 다음 목표 지점은 자른 지점부터 3초 뒤(6.5초)이다
+    energies[70] = 0
+    # 검색 범위 밖의 더 조용한 프레임은 고르지 않는다
+    energies[10] = -1
+    assert find_split_points(energies, 0.1, 3.0, 1.0) == [3.5, 7.0]
+
+
+def test_split_wav_cuts_at_silence_with_overlap(tmp_path):
+    filename = str(tmp_path / 'long.wav')
+    write_wav(filename, 30, [(11.0, 11.5), (19.0, 19.5)])
+
+    chunks = split_wav(filename, str(tmp_path), chunk_seconds=10, overlap_seconds=1, search_seconds=3)
+
+    assert len(chunks) == 3
+    # 침묵 구간 안에서 자르고, 조각의 책임 구간은 빈틈없이 이어진다
+    assert 11.0 <= chunks[0].keep_end <= 11.5
+    assert 19.0 <= chunks[1].keep_end <= 19.5
+    assert [chunk.keep_start for chunk in chunks[1:]] == [chunk.keep_end for chunk in chunks[:-1]]
+    assert chunks[0].keep_start == 0 and chunks[-1].keep_end == 30
+    # 벤더에 보내는 구간은 앞뒤로 overlap_seconds 만큼 겹친다
+    for chunk in chunks:
+        with wave.open(chunk.filename, 'rb') as wav:
+            assert abs(wav.getnframes() / RATE - (chunk.end - chunk.start)) < 0.01
+        assert chunk.start == max(0.0, chunk.keep_start - 1) and chunk.end == min(30.0, chunk.keep_end + 1)
+
+
+def test_merge_offsets_timestamps_and_drops_overlap_duplicates():
+    chunks = plan_chunks(20.0, [10.0], 2.0)
+    assert chunks == [AudioChunk(0, 0.0, 12.0, 0.0, 10.0), AudioChunk(1, 8.0, 20.0, 10.0, 20.0)]
+    first = Transcription(['a b c'], [0.9], [TranscriptionWord('a', 1.0, 2.0), TranscriptionWord('b', 9.0, 9.5), TranscriptionWord('c', 10.5, 11.0)], Vendor.AWS.value)
+    # 두번째 조각은 8초부터 시작하므로, 조각 기준 시각에 8초를 더한다 - b(9.0~9.5), c(10.5~11.0) 는 첫 조각과 겹친다
+    second = Transcription(['b c d'], [0.6], [TranscriptionWord('b', 1.0, 1.5), TranscriptionWord('c', 2.5, 3.0), TranscriptionWord('d', 5.0, 6.0)], Vendor.AWS.value)
+
+    merged = merge_transcriptions(chunks, [first, second])
+
+    # 단어의 가운데 시각이 속한 조각의 단어만 남는다 - b 는 첫 조각, c 는 두번째 조각
+    assert [(word.word, word.start_time, word.end_time) for word in merged.words] == [('a', 1.0, 2.0), ('b', 9.0, 9.5), ('c', 10.5, 11.0), ('d', 13.0, 14.0)]
+    assert merged.transcripts == ['a b c d']
+    assert merged.confidences == [0.75]
+    assert merged.vendor == Vendor.AWS.value
+
+
+def test_merged_transcript_is_built_from_words():
+    chunks = plan_chunks(10.0, [], 0)
+    # 단어에 붙은 문장 부호는 남고, transcript 에만 있는 벤더의 표기는 남지 않는다
+    transcription = Transcription(['Hello, twenty one.'], [1.0], [TranscriptionWord('Hello,', 0.0, 0.5), TranscriptionWord('twenty', 0.6, 1.0), TranscriptionWord('one.', 1.0, 1.4)], Vendor.AWS.value)
+    assert merge_transcriptions(chunks, [transcription]).transcripts == ['Hello, twenty one.']
+
+    normalized = Transcription(['21'], [1.0], [TranscriptionWord('twenty', 0.6, 1.0), TranscriptionWord('one', 1.0, 1.4)], Vendor.AWS.value)
+    assert merge_transcriptions(chunks, [normalized]).transcripts == ['twenty one']
+
+
+class CopyDownloader(BaseDownloader):
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.uploaded = set()
+        self.lock = threading.Lock()
+
+    def _process_downloading(self, src_path, download_path):
+        shutil.copy(self.filename, download_path)
+
+    def _process_uploading(self, src_path, upload_path):
+        with self.lock:
+            self.uploaded.add(upload_path)
+
+    def _process_delete(self, target_path):
+        with self.lock:
+            self.uploaded.discard(target_path)
+
+
+class FirstChunkFailsTranscriber(BaseTranscriber):
+    def __init__(self):
+        self.cancelled = set()
+        self.events = {}
+        self.lock = threading.Lock()
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        if src.endswith('0000.wav'):
+            # 다른 조각이 시작된 뒤에 실패한다
+            threading.Event().wait(0.2)
+            return None
+        with self.lock:
+            event = self.events.setdefault(src, threading.Event())
+        # 취소될 때까지 벤더에서 실행중이다
+        event.wait(5)
+        return None
+
+    def cancel(self, src: str, lang: Lang, media_format: str = 'wav'):
+        with self.lock:
+            self.cancelled.add(src)
+            self.events.setdefault(src, threading.Event()).set()
+
+
+def test_failed_chunk_cancels_running_chunks(tmp_path):
+    filename = str(tmp_path / 'long.wav')
+    write_wav(filename, 30, [])
+    downloader = CopyDownloader(filename)
+    inner = FirstChunkFailsTranscriber()
+    transcriber = ChunkedTranscriber(inner, downloader, str(tmp_path / 'work'), chunk_seconds=10, overlap_seconds=1, search_seconds=3, min_seconds=20, max_parallel=3)
+
+    assert transcriber.transcribe('long.wav', Lang.LANG_KO) is None
+    # 실행중이던 조각 작업은 취소되고, 취소된 조각은 올린 파일을 지운다
+    assert {'long.wav.chunks/0001.wav', 'long.wav.chunks/0002.wav'} <= inner.cancelled
+    for _ in range(100):
+        if not downloader.uploaded:
+            break
+        threading.Event().wait(0.02)
+    assert downloader.uploaded == set()
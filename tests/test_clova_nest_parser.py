@@ -0,0 +1,40 @@
+import orjson
+import pytest
+
+from transcribers import ClovaNestFailedError, ClovaNestPayloadError, create_clova_nest_transcription, loads_clova_nest_result
+
+
+def create_result(**fields) -> dict:
+    result = {'result': 'COMPLETED', 'message': 'Succeeded', 'token': 'token', 'text': '안녕하세요 반갑습니다', 'confidence': 0.9,
+              'segments': [{'words': [[0, 400, '안녕하세요'], [500, 900, '반갑습니다']]}]}
+    result.update(fields)
+    return result
+
+
+def test_completed_result_is_converted():
+    transcription = create_clova_nest_transcription(loads_clova_nest_result(orjson.dumps(create_result())))
+    assert transcription.transcripts == ['안녕하세요 반갑습니다']
+    assert transcription.confidences == [0.9]
+    assert [(word.word, word.start_time, word.end_time) for word in transcription.words] == [('안녕하세요', 0.0, 0.4), ('반갑습니다', 0.5, 0.9)]
+
+
+def test_failed_result_is_not_a_transcription():
+    result = {'result': 'FAILED', 'message': 'Failed to recognize', 'token': 'token'}
+    with pytest.raises(ClovaNestFailedError):
+        create_clova_nest_transcription(result)
+
+
+def test_completed_result_without_text_and_segments_is_failed():
+    with pytest.raises(ClovaNestFailedError):
+        create_clova_nest_transcription(create_result(text=None, segments=[]))
+
+
+def test_silent_audio_is_an_empty_transcription():
+    transcription = create_clova_nest_transcription(create_result(text='', segments=[]))
+    assert transcription.transcripts == ['']
+    assert transcription.words == []
+
+
+def test_invalid_words_are_rejected():
+    with pytest.raises(ClovaNestPayloadError):
+        create_clova_nest_transcription(create_result(segments=[{'words': [[0, 400]]}]))
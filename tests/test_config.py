@@ -0,0 +1,20 @@
+import os
+
+import yaml
+
+from config import MainConfig
+
+
+CONFIG_TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.yml')
+
+
+def test_shipped_config_template_validates(tmp_path):
+    # 비밀 값은 배포할 때 채우므로 빈 값만 채워서 읽는다 - 선택 설정의 빈 값(transport.pool_size 등)은 그대로 둔다
+    config = yaml.safe_load(open(CONFIG_TEMPLATE))
+    for section in ('aws', 'clova_nest'):
+        config[section] = {key: 'test' if value is None else value for key, value in config[section].items()}
+    filename = tmp_path / 'config.yml'
+    filename.write_text(yaml.safe_dump(config))
+
+    loaded = MainConfig.load_from_yml(str(filename))
+    assert loaded.transport.pool_size is None
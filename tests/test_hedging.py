@@ -0,0 +1,92 @@
+import threading
+import time
+
+from runner import ParallelExecutor
+from runner.hedging import HedgedTranscriber, VendorHealth
+from transcribers import BaseTranscriber, Lang, Transcription, Vendor
+
+
+class SlowTranscriber(BaseTranscriber):
+    def __init__(self, vendor: Vendor, delay: float):
+        self.vendor = vendor
+        self.delay = delay
+        self.cancelled = threading.Event()
+        self.calls = 0
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        self.calls += 1
+        if self.cancelled.wait(self.delay):
+            return None
+        return Transcription([self.vendor.value], [1.0], [], self.vendor.value)
+
+    def cancel(self, src: str, lang: Lang, media_format: str = 'wav'):
+        self.cancelled.set()
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def create_hedged(primary: SlowTranscriber, backup: SlowTranscriber, requester: ParallelExecutor, health=None):
+    transcribers = {primary.vendor: primary, backup.vendor: backup}
+    health = health or {vendor: VendorHealth() for vendor in transcribers}
+    return HedgedTranscriber(primary.vendor, transcribers, health, requester, min_delay=0.05, max_delay=0.05, max_parallel=2)
+
+
+def test_backup_wins_and_primary_is_cancelled():
+    primary = SlowTranscriber(Vendor.AWS, 5)
+    backup = SlowTranscriber(Vendor.ClovaNest, 0)
+    requester = ParallelExecutor(4)
+    result = create_hedged(primary, backup, requester).transcribe('file.wav', Lang.LANG_KO)
+    assert result.vendor == Vendor.ClovaNest.value
+    assert primary.cancelled.is_set()
+
+
+def test_backup_is_not_sent_when_backup_vendor_is_saturated():
+    primary = SlowTranscriber(Vendor.AWS, 0.3)
+    backup = SlowTranscriber(Vendor.ClovaNest, 0)
+    requester = ParallelExecutor(4, {Vendor.ClovaNest.value: 0})
+    result = create_hedged(primary, backup, requester).transcribe('file.wav', Lang.LANG_KO)
+    assert result.vendor == Vendor.AWS.value
+    assert backup.calls == 0
+
+
+def test_losers_are_recorded_in_vendor_health():
+    primary = SlowTranscriber(Vendor.AWS, 5)
+    backup = SlowTranscriber(Vendor.ClovaNest, 0)
+    health = {Vendor.AWS: VendorHealth(min_samples=1), Vendor.ClovaNest: VendorHealth(min_samples=1)}
+    create_hedged(primary, backup, ParallelExecutor(4), health).transcribe('file.wav', Lang.LANG_KO)
+    # 취소된 primary 는 취소될 때까지 걸린 시간이 느린 표본으로 남는다
+    assert wait_until(lambda: health[Vendor.AWS].percentile(0.5) is not None)
+    assert health[Vendor.AWS].failure_rate == 0
+    assert health[Vendor.AWS].percentile(0.5) >= 0.05
+
+    slow_backup = SlowTranscriber(Vendor.ClovaNest, 5)
+    fast_primary = SlowTranscriber(Vendor.AWS, 0.2)
+    health = {Vendor.AWS: VendorHealth(min_samples=1), Vendor.ClovaNest: VendorHealth(min_samples=1)}
+    result = create_hedged(fast_primary, slow_backup, ParallelExecutor(4), health).transcribe('file.wav', Lang.LANG_KO)
+    assert result.vendor == Vendor.AWS.value
+    # 이기지 못한 backup 은 실패로 기록된다
+    assert wait_until(lambda: health[Vendor.ClovaNest].failure_rate == 1.0)
+
+
+class ResumableTranscriber(SlowTranscriber):
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        return f'job-{src}'
+
+    def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        return Transcription([handle], [1.0], [], self.vendor.value)
+
+
+def test_job_handle_and_resume_are_forwarded_to_primary():
+    primary = ResumableTranscriber(Vendor.AWS, 0)
+    backup = SlowTranscriber(Vendor.ClovaNest, 0)
+    hedged = create_hedged(primary, backup, ParallelExecutor(4))
+    assert hedged.job_handle('file.wav', Lang.LANG_KO) == 'job-file.wav'
+    assert hedged.resume('job-file.wav', 'file.wav', Lang.LANG_KO).transcripts == ['job-file.wav']
+    assert primary.calls == 0 and backup.calls == 0
@@ -0,0 +1,126 @@
+import time
+
+import fakeredis
+import orjson
+
+from messaging import PriorityRequestQueue, ReliableRequestQueue, StreamRequestQueue
+
+
+def payloads(items):
+    return [item.payload for item in items]
+
+
+def create_payload(data_key: str, duration: float = None) -> bytes:
+    return orjson.dumps({'data_key': data_key, 'duration': duration, 'enqueued_at': time.time()})
+
+
+def test_reliable_requeue_goes_to_front_and_defer_to_back():
+    redis = fakeredis.FakeStrictRedis()
+    queue = ReliableRequestQueue(redis, batch_size=2, timeout=1)
+    queue.push(b'a', b'b', b'c', b'd')
+
+    a, b = queue.pop()
+    assert payloads([a, b]) == [b'a', b'b']
+    # 멈추면서 되돌린 요청은 먼저 들어온 순서대로 다시 꺼내고, 뒤로 보낸 요청은 가장 늦게 꺼낸다
+    queue.defer(a)
+    queue.requeue(b)
+    assert redis.llen(queue.processing) == 0
+    assert payloads(queue.pop(4)) == [b'b', b'c', b'd', b'a']
+
+
+def test_reliable_ack_removes_only_acked_item():
+    redis = fakeredis.FakeStrictRedis()
+    queue = ReliableRequestQueue(redis, batch_size=2, timeout=1)
+    queue.push(b'a', b'b')
+
+    a, b = queue.pop()
+    queue.ack(a)
+    assert redis.lrange(queue.processing, 0, -1) == [b'b']
+
+
+def test_reliable_recovers_dead_consumer_in_order():
+    redis = fakeredis.FakeStrictRedis()
+    dead = ReliableRequestQueue(redis, consumer='dead', batch_size=3, timeout=1, heartbeat_ttl=0.5)
+    alive = ReliableRequestQueue(redis, consumer='alive', batch_size=3, timeout=1, heartbeat_ttl=60)
+    dead.recover()
+    dead.push(b'a', b'b', b'c', b'd')
+    assert payloads(dead.pop()) == [b'a', b'b', b'c']
+
+    # heartbeat 가 살아있는 동안은 가져오지 않는다
+    assert alive.recover() == 0
+    time.sleep(0.6)
+    assert alive.recover() == 3
+    assert redis.llen(dead.processing) == 0
+    assert b'dead' not in redis.smembers(f'{alive.name}:consumers')
+    assert payloads(alive.pop(4)) == [b'a', b'b', b'c', b'd']
+
+
+def test_priority_pops_short_jobs_first_and_defers_behind_long_jobs():
+    redis = fakeredis.FakeStrictRedis()
+    queue = PriorityRequestQueue(redis, batch_size=1, timeout=1, max_penalty=3600)
+    long, short = create_payload('long', 3000), create_payload('short', 10)
+    queue.push(long, short)
+
+    item, = queue.pop()
+    assert item.payload == short
+    queue.defer(item)
+    assert redis.llen(queue.processing) == 0
+    assert payloads(queue.pop(2)) == [long, short]
+
+
+def test_priority_recovers_dead_consumer():
+    redis = fakeredis.FakeStrictRedis()
+    dead = PriorityRequestQueue(redis, consumer='dead', batch_size=2, timeout=1, heartbeat_ttl=0.5)
+    alive = PriorityRequestQueue(redis, consumer='alive', batch_size=2, timeout=1)
+    dead.recover()
+    dead.push(create_payload('a', 10), create_payload('b', 20))
+    popped = payloads(dead.pop())
+
+    time.sleep(0.6)
+    assert alive.recover() == 2
+    assert payloads(alive.pop()) == popped
+
+
+def test_stream_ack_removes_entry_and_requeue_adds_it_again():
+    redis = fakeredis.FakeStrictRedis()
+    queue = StreamRequestQueue(redis, batch_size=2, timeout=1)
+    queue.push(b'a', b'b')
+
+    a, b = queue.pop()
+    assert payloads([a, b]) == [b'a', b'b']
+    assert queue.depth() == 0
+    queue.ack(a)
+    queue.requeue(b)
+    assert redis.xlen(queue.stream) == 1
+    assert queue.depth() == 1
+    assert payloads(queue.pop()) == [b'b']
+
+
+def test_stream_recovers_dead_consumer_without_waiting_for_claim_idle():
+    redis = fakeredis.FakeStrictRedis()
+    dead = StreamRequestQueue(redis, consumer='dead', batch_size=2, timeout=1, heartbeat_ttl=0.5)
+    alive = StreamRequestQueue(redis, consumer='alive', batch_size=2, timeout=1, heartbeat_ttl=0.5)
+    dead.recover()
+    dead.push(b'a', b'b', b'c')
+    assert payloads(dead.pop()) == [b'a', b'b']
+
+    assert alive.recover() == 0
+    time.sleep(0.6)
+    assert alive.recover() == 2
+    # 옮겨온 요청을 먼저 꺼낸 뒤 새 요청을 읽는다
+    assert payloads(alive.pop()) == [b'a', b'b']
+    assert payloads(alive.pop()) == [b'c']
+    consumers = [consumer['name'] for consumer in redis.xinfo_consumers(alive.stream, alive.group)]
+    assert b'dead' not in consumers
+
+
+def test_stream_resumes_pending_entries_of_previous_runner_with_same_name():
+    redis = fakeredis.FakeStrictRedis()
+    previous = StreamRequestQueue(redis, consumer='runner-1', batch_size=2, timeout=1)
+    previous.recover()
+    previous.push(b'a', b'b')
+    assert payloads(previous.pop()) == [b'a', b'b']
+
+    restarted = StreamRequestQueue(redis, consumer='runner-1', batch_size=2, timeout=1)
+    assert restarted.recover() == 2
+    assert payloads(restarted.pop()) == [b'a', b'b']
@@ -0,0 +1,53 @@
+import fakeredis
+
+from messaging import CLAIM_CLAIMED, CLAIM_HIT, CLAIM_JOINED, claim_request, create_inflight_key, create_reply_key, create_webhook_key, publish_result, release_request, wait_for_reply
+from messaging.reply import INFLIGHT_PREFIX, REPLY_PREFIX, WEBHOOK_PUBLISH_SCRIPT
+
+
+def test_first_claim_owns_request_and_others_join():
+    redis = fakeredis.FakeStrictRedis()
+    # 이전 요청이 남긴 완료 신호는 주인이 될 때 지운다
+    redis.rpush(create_reply_key('key'), 1)
+
+    assert claim_request(redis, 'key', 'owner-1') == (CLAIM_CLAIMED, None)
+    assert redis.llen(create_reply_key('key')) == 0
+    assert claim_request(redis, 'key', 'owner-2') == (CLAIM_JOINED, None)
+
+    publish_result(redis, 'key', b'result')
+    assert wait_for_reply(redis, 'key', 1)
+    assert claim_request(redis, 'key', 'owner-2') == (CLAIM_HIT, b'result')
+    assert not redis.exists(create_inflight_key('key'))
+
+
+def test_failed_result_is_claimed_again():
+    redis = fakeredis.FakeStrictRedis()
+    assert claim_request(redis, 'key', 'owner-1') == (CLAIM_CLAIMED, None)
+    publish_result(redis, 'key', '')
+    assert claim_request(redis, 'key', 'owner-2') == (CLAIM_CLAIMED, None)
+
+
+def test_release_wakes_joiners_only_for_owner():
+    redis = fakeredis.FakeStrictRedis()
+    claim_request(redis, 'key', 'owner-1')
+
+    assert not release_request(redis, 'key', 'owner-2')
+    assert redis.exists(create_inflight_key('key'))
+
+    assert release_request(redis, 'key', 'owner-1')
+    # 합류한 클라이언트가 깨어나서 다시 claim 하면 주인이 된다
+    assert wait_for_reply(redis, 'key', 1)
+    assert claim_request(redis, 'key', 'owner-2') == (CLAIM_CLAIMED, None)
+
+
+def test_duplicate_webhook_publishes_once():
+    redis = fakeredis.FakeStrictRedis()
+    publish = redis.register_script(WEBHOOK_PUBLISH_SCRIPT)
+    claim_request(redis, 'key', 'owner-1')
+    redis.set(create_webhook_key('token'), 'key')
+
+    assert publish(keys=[create_webhook_key('token')], args=[b'first', 60, REPLY_PREFIX, INFLIGHT_PREFIX]) == b'key'
+    # 같은 토큰이 다시 전달되면 data_key 를 찾지 못하고 결과를 덮어쓰지 않는다
+    assert publish(keys=[create_webhook_key('token')], args=[b'second', 60, REPLY_PREFIX, INFLIGHT_PREFIX]) is None
+    assert redis.get('key') == b'first'
+    assert redis.llen(create_reply_key('key')) == 1
+    assert not redis.exists(create_inflight_key('key'))
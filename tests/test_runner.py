@@ -0,0 +1,66 @@
+import threading
+import time
+
+import fakeredis
+import orjson
+
+from messaging import ReliableRequestQueue
+from runner import ParallelExecutor, TranscriptionRequestRunner
+from transcribers import BaseTranscriber, Lang, Transcription, Vendor
+
+
+class BlockingTranscriber(BaseTranscriber):
+    def __init__(self, vendor: Vendor):
+        self.vendor = vendor
+        self.released = threading.Event()
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        self.released.wait(10)
+        return Transcription([src], [1.0], [], self.vendor.value)
+
+
+def create_payload(data_key: str, vendor: Vendor) -> bytes:
+    return orjson.dumps({'data_key': data_key, 's3_file_key': data_key, 'file_key': data_key, 'lang': Lang.LANG_KO.value, 'vendor': vendor.value})
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_saturated_vendor_does_not_block_other_vendors():
+    redis = fakeredis.FakeStrictRedis()
+    queue = ReliableRequestQueue(redis, batch_size=4, timeout=1)
+    clova_nest = BlockingTranscriber(Vendor.ClovaNest)
+    aws = BlockingTranscriber(Vendor.AWS)
+    aws.released.set()
+    transcribers = {Vendor.ClovaNest: (False, clova_nest), Vendor.AWS: (False, aws)}
+    executor = ParallelExecutor(10, {Vendor.ClovaNest.value: 1})
+    runner = TranscriptionRequestRunner(redis, transcribers, executor, None, None, queue=queue)
+
+    # ClovaNest 요청이 앞에 쌓여있고, 뒤에 AWS 요청이 있다
+    clova_nest_keys = [f'cn-{i}' for i in range(10)]
+    aws_keys = [f'aw-{i}' for i in range(3)]
+    queue.push(*[create_payload(key, Vendor.ClovaNest) for key in clova_nest_keys])
+    queue.push(*[create_payload(key, Vendor.AWS) for key in aws_keys])
+
+    thread = threading.Thread(target=runner.poll, daemon=True)
+    thread.start()
+    try:
+        assert wait_until(lambda: all(redis.get(key) for key in aws_keys))
+        assert executor.running(Vendor.ClovaNest.value) == 1
+        assert not any(redis.get(key) for key in clova_nest_keys)
+
+        clova_nest.released.set()
+        assert wait_until(lambda: all(redis.get(key) for key in clova_nest_keys))
+        assert redis.llen(queue.name) == 0
+        assert wait_until(lambda: redis.llen(queue.processing) == 0)
+    finally:
+        clova_nest.released.set()
+        runner.stop()
+        thread.join(5)
+    assert not thread.is_alive()
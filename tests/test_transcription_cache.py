@@ -0,0 +1,67 @@
+import time
+
+import fakeredis
+
+from transcription_cache import TranscriptionCache
+
+
+def test_put_evicts_least_recently_used_entry():
+    redis = fakeredis.FakeStrictRedis()
+    cache = TranscriptionCache(redis, max_entries=2)
+    cache.put('a', b'1')
+    time.sleep(0.01)
+    cache.put('b', b'2')
+    time.sleep(0.01)
+    # a 를 사용했으므로 가장 오래 사용되지 않은 항목은 b 이다
+    assert cache.get('a') == b'1'
+    time.sleep(0.01)
+    cache.put('c', b'3')
+
+    assert redis.get('b') is None
+    assert cache.get('a') == b'1' and cache.get('c') == b'3'
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1 and stats['bytes'] == 2
+
+
+def test_put_evicts_until_total_bytes_fit():
+    redis = fakeredis.FakeStrictRedis()
+    cache = TranscriptionCache(redis, max_bytes=10)
+    cache.put('a', b'x' * 4)
+    time.sleep(0.01)
+    cache.put('b', b'x' * 4)
+    time.sleep(0.01)
+    cache.put('c', b'x' * 8)
+
+    assert redis.get('a') is None and redis.get('b') is None
+    assert cache.stats()['bytes'] == 8
+
+
+def test_put_for_copies_value_and_empty_result_is_not_cached():
+    redis = fakeredis.FakeStrictRedis()
+    cache = TranscriptionCache(redis)
+    cache.put('a', b'')
+    assert cache.get('a') is None
+
+    cache.put_for('data-key', b'1')
+    assert redis.get('data-key') == b'1'
+    assert redis.ttl('data-key') > 0
+
+
+def test_expired_entries_are_removed_from_index_and_bytes():
+    redis = fakeredis.FakeStrictRedis()
+    cache = TranscriptionCache(redis, ttl=1, max_entries=2)
+    cache.put('a', b'x' * 4)
+    cache.put('b', b'x' * 4)
+    time.sleep(1.1)
+
+    # 조회에서 만료된 항목을 만나면 정리한다
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 1 and cache.stats()['bytes'] == 4
+
+    # 저장할 때 남은 만료 항목을 정리하므로, 살아있는 항목을 지우지 않는다
+    cache.put('c', b'x' * 2)
+    cache.put('d', b'x' * 2)
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['bytes'] == 4
+    assert stats['expired'] == 2 and stats['evictions'] == 0
+    assert cache.get('c') and cache.get('d')
@@ -0,0 +1,27 @@
+from urllib3.connectionpool import HTTPConnectionPool
+
+from transport import PoolStats, Transport
+from transport.transport import _instrument
+
+
+def test_non_blocking_pool_records_discarded_connections():
+    stats = PoolStats()
+    pool = _instrument(HTTPConnectionPool, stats)('localhost', maxsize=1, block=False)
+    # 풀 크기보다 많은 커넥션을 쓰면 돌려줄 때 남는 커넥션을 버린다
+    first, second = pool._get_conn(), pool._get_conn()
+    pool._put_conn(first)
+    pool._put_conn(second)
+
+    snapshot = stats.snapshot()
+    assert snapshot['requests'] == 2
+    assert snapshot['discards'] == 1
+
+
+def test_boto3_client_pools_are_instrumented():
+    transport = Transport(pool_size=4)
+    client = transport.client('s3', region_name='ap-northeast-2', aws_access_key_id='test', aws_secret_access_key='test')
+    manager = client._endpoint.http_session._manager
+    pool = manager.connection_from_url('https://example.com')
+    pool._put_conn(pool._get_conn())
+    assert transport.boto_stats.snapshot()['requests'] == 1
+    assert transport.stats.snapshot()['requests'] == 0
@@ -1,7 +1,22 @@
-from .base_transcriber import BaseTranscriber
-from .aws_transcriber import AwsTranscriber
-from .clova_nest_transcriber import ClovaNestTranscriber
+from .base_transcriber import BaseTranscriber, ThrottledError
 
 from .enums import Lang, Vendor
 
 from .transcription import TranscriptionRequest, Transcription, TranscriptionWord
+from .clova_nest_parser import ClovaNestPayloadError, ClovaNestFailedError, loads_clova_nest_result, create_clova_nest_transcription
+
+from .async_transcriber import AsyncBaseTranscriber, AsyncTranscriberAdapter, AsyncAwsTranscriber
+
+
+# 벤더 구현은 boto3/smart_open 을 불러오므로 처음 사용할 때 import 한다 - 클라이언트와 웹훅은 벤더 모듈이 필요없다
+_VENDOR_MODULES = {
+    'AwsTranscriber': '.aws_transcriber',
+    'ClovaNestTranscriber': '.clova_nest_transcriber',
+}
+
+
+def __getattr__(name: str):
+    if name in _VENDOR_MODULES:
+        import importlib
+        return getattr(importlib.import_module(_VENDOR_MODULES[name], __name__), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
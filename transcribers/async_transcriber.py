@@ -0,0 +1,149 @@
+import abc
+import asyncio
+import functools
+import logging
+
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING
+
+from .base_transcriber import BaseTranscriber, ThrottledError
+from .enums import Lang
+
+if TYPE_CHECKING:
+    from .aws_transcriber import AwsTranscriber
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBaseTranscriber(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    async def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        pass
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        return None
+
+    async def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        return await self.transcribe(src, lang, media_format, duration=duration)
+
+    def detach(self):
+        pass
+
+
+class AsyncTranscriberAdapter(AsyncBaseTranscriber):
+    """동기 Transcriber 를 그대로 스레드에서 실행한다 - 비동기 구현이 없는 벤더용"""
+
+    def __init__(self, transcriber: BaseTranscriber, executor: Executor = None):
+        self.__transcriber = transcriber
+        self.__executor = executor
+
+    def detach(self):
+        self.__transcriber.detach()
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        return self.__transcriber.job_handle(src, lang, media_format)
+
+    async def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, functools.partial(self.__transcriber.resume, handle, src, lang, media_format, duration=duration))
+
+    async def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, functools.partial(self.__transcriber.transcribe, src, lang, media_format, duration=duration))
+
+
+class AsyncAwsTranscriber(AsyncBaseTranscriber):
+    """
+    작업 시작/조회 같은 짧은 API 호출만 스레드에서 수행하고, 작업 완료 대기는 이벤트 루프에서 한다.
+    대기 중인 작업이 스레드를 점유하지 않으므로 많은 작업을 동시에 기다릴 수 있다.
+    """
+
+    def __init__(self, transcriber: 'AwsTranscriber', delay=5, executor: Executor = None):
+        self.__transcriber = transcriber
+        self.__delay = delay
+        self.__executor = executor
+
+    def detach(self):
+        self.__transcriber.detach()
+
+    async def __call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, fn, *args)
+
+    async def __get_job(self, job_name: str):
+        # 조회가 요청량 제한에 걸리면 동기 구현과 같이 기다렸다 다시 조회한다
+        attempt = 0
+        while True:
+            try:
+                return await self.__call(self.__transcriber.get_job, job_name)
+            except Exception as e:
+                delay = self.__transcriber.poll_backoff(attempt) if self.__transcriber.is_throttled(e) else None
+                if delay is None:
+                    raise
+            attempt += 1
+            logging.warning(f'Polling the job is throttled. Retrying. [AWS] JobName={job_name}, Attempt={attempt}, Delay={delay:.1f}')
+            await asyncio.sleep(delay)
+
+    async def __wait(self, job_name: str, duration: float = None):
+        tracker = self.__transcriber.tracker
+        if tracker:
+            # 기다리는 쪽이 timeout 으로 취소하면 Tracker 의 Future 도 취소되어 이 요청만 추적에서 빠진다
+            await asyncio.wait_for(asyncio.wrap_future(tracker.track(job_name, duration)), self.__transcriber.timeout + tracker.max_delay * 2)
+            return await self.__get_job(job_name)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.__transcriber.timeout
+        while True:
+            job = await self.__get_job(job_name)
+            status = job['TranscriptionJob']['TranscriptionJobStatus']
+            if status in ('COMPLETED', 'FAILED'):
+                return job
+            if loop.time() >= deadline:
+                raise asyncio.TimeoutError(f'Transcription job is timed out. JobName={job_name}')
+            await asyncio.sleep(self.__delay)
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        return self.__transcriber.create_job_name(src, lang, media_format)
+
+    async def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        # 동기 구현과 같이 진행중이거나 끝난 작업만 이어받고, 없거나 실패한 작업은 새로 요청한다
+        status = await self.__call(self.__transcriber.job_status, handle)
+        if handle != self.job_handle(src, lang, media_format) or status in (None, 'FAILED'):
+            return await self.transcribe(src, lang, media_format, duration)
+        logging.info(f'Resumed the job. [AWS] JobName={handle}, Status={status}')
+        return await self.__wait_result(handle, duration)
+
+    async def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        job_name = self.__transcriber.create_job_name(src, lang, media_format)
+        logging.info(f'Started to transcribe. [AWS] JobName={job_name}')
+        return await self.__wait_result(job_name, duration, functools.partial(self.__transcriber.start_job, job_name, src, lang, media_format))
+
+    async def __wait_result(self, job_name: str, duration: float = None, start=None):
+        if start:
+            try:
+                await self.__call(start)
+            except Exception as e:
+                # 시작할 때의 요청량 제한만 동기 구현과 같이 ThrottledError 로 알린다 - 진행중일 수 있는 작업은 지우지 않는다
+                if self.__transcriber.is_throttled(e):
+                    logging.warning(f'Transcribing is throttled. [AWS] JobName={job_name}')
+                    raise ThrottledError(str(e)) from e
+                logging.error(f'Failed to start the job. [AWS] JobName={job_name}')
+                if not self.__transcriber.detached:
+                    await self.__call(self.__transcriber.delete_job, job_name)
+                return None
+
+        throttled = False
+        try:
+            job = await self.__wait(job_name, duration)
+            result = await self.__call(self.__transcriber.get_transcription_result, job)
+            logging.info(f'Transcribing is completed [AWS] JobName={job_name}')
+            return result
+        except Exception as e:
+            # 조회만 요청량 제한에 걸렸다면 작업은 남겨서, 다시 요청하면 이어받게 한다
+            throttled = self.__transcriber.is_throttled(e)
+            logging.error(f'Failed to transcribe. [AWS] JobName={job_name}, Throttled={throttled}')
+            return None
+        finally:
+            if not self.__transcriber.detached and not throttled:
+                await self.__call(self.__transcriber.delete_job, job_name)
@@ -1,25 +1,47 @@
-from .base_transcriber import BaseTranscriber
+from .base_transcriber import BaseTranscriber, ThrottledError
 from .enums import Lang, Vendor
 from .transcription import Transcription, TranscriptionWord
 
 from .utils.aws_waiter import TranscribeCompleteWaiter
+from .utils.aws_job_tracker import TranscribeJobTracker
+
+from transport import Transport
+
+from botocore.exceptions import ClientError
+
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 import hashlib
 import logging
-
-import requests
-import boto3
+import random
+import threading
+import time
 
 
 logger = logging.getLogger(__name__)
 
 
+# 요청량/동시 작업 수 제한으로 거절된 경우의 에러 코드
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'LimitExceededException', 'TooManyRequestsException', 'RequestLimitExceeded'}
+
+
 class AwsTranscriber(BaseTranscriber):
-    def __init__(self, access_key: str, secret_access_key: str, region: str, bucket: str, timeout=180):
-        self.__transcriber = boto3.client('transcribe', aws_access_key_id=access_key, aws_secret_access_key=secret_access_key, region_name=region)
+    def __init__(self, access_key: str, secret_access_key: str, region: str, bucket: str, timeout=180, transport: Transport = None, poll_retries=5, poll_delay=1.0, max_poll_delay=30.0):
+        self.__transport = transport or Transport()
+        self.__transcriber = self.__transport.client('transcribe', aws_access_key_id=access_key, aws_secret_access_key=secret_access_key, region_name=region)
         self.__region = region
         self.__bucket = bucket
         self.__timeout = timeout
+        self.__poll_retries = poll_retries
+        self.__poll_delay = poll_delay
+        self.__max_poll_delay = max_poll_delay
+        self.__tracker = None
+        self.__detached = threading.Event()
+
+    def enable_tracker(self, **tracker_params):
+        # 작업마다 Waiter 를 두지 않고, 하나의 Tracker 가 모든 작업의 상태를 한번에 조회한다
+        self.__tracker = TranscribeJobTracker(self.__transcriber, timeout=self.__timeout, **tracker_params).start()
+        return self.__tracker
 
     def delete_job(self, job_name):
         try:
@@ -30,13 +52,19 @@ class AwsTranscriber(BaseTranscriber):
     def get_job(self, job_name):
         return self.__transcriber.get_transcription_job(TranscriptionJobName=job_name)
 
-    @staticmethod
-    def get_transcription_result(job):
+    def job_status(self, job_name):
+        # 작업이 없거나 조회할 수 없으면 None
+        try:
+            return self.get_job(job_name)['TranscriptionJob']['TranscriptionJobStatus']
+        except ClientError:
+            return None
+
+    def get_transcription_result(self, job):
         if job['TranscriptionJob']['TranscriptionJobStatus'] == 'COMPLETED':
             save_json_uri = job['TranscriptionJob']['Transcript']['TranscriptFileUri']
 
             try:
-                pydict = requests.get(save_json_uri).json()
+                pydict = self.__transport.session.get(save_json_uri).json()
             except:
                 return None
 
@@ -53,27 +81,145 @@ class AwsTranscriber(BaseTranscriber):
             confidences = [round(confidence / len(words), 2) if len(words) > 0 else 0]
             return Transcription(transcripts, confidences, words, vendor=Vendor.AWS.value)
 
-    def transcribe(self, src: str, lang: Lang):
-        job_name = str(hashlib.sha256(src.encode()).hexdigest())
-        uri = f'https://{self.__bucket}.s3.{self.__region}.amazonaws.com/{src}'
-        logging.info(f'Started to transcribe. [AWS] JobName={job_name}')
+    @property
+    def tracker(self):
+        return self.__tracker
+
+    @property
+    def timeout(self):
+        return self.__timeout
+
+    @property
+    def detached(self):
+        return self.__detached.is_set()
+
+    @staticmethod
+    def is_throttled(e: Exception) -> bool:
+        # ClientError 는 response, Waiter 의 WaiterError 는 last_response 에 에러 코드가 있다
+        response = getattr(e, 'response', None) or getattr(e, 'last_response', None)
+        return isinstance(response, dict) and response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+    def poll_backoff(self, attempt: int):
+        # 작업 조회가 요청량 제한에 걸렸을 때 다시 조회하기 전에 기다릴 시간 (Full Jitter) - 재시도를 다 썼다면 None
+        if attempt >= self.__poll_retries:
+            return None
+        return random.uniform(0, min(self.__max_poll_delay, self.__poll_delay * 2 ** attempt))
+
+    def __poll(self, fn, *args):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except Exception as e:
+                delay = self.poll_backoff(attempt) if self.is_throttled(e) else None
+                if delay is None:
+                    raise
+            attempt += 1
+            logging.warning(f'Polling the job is throttled. Retrying. [AWS] Attempt={attempt}, Delay={delay:.1f}')
+            time.sleep(delay)
+
+    @staticmethod
+    def create_job_name(src: str, lang: Lang, media_format: str = 'wav'):
+        # 같은 파일이라도 언어나 포맷이 다르면 다른 작업이다
+        return str(hashlib.sha256(f'{src}:{lang.value}:{media_format}'.encode()).hexdigest())
 
+    def __start_job(self, job_name: str, uri: str, lang: Lang, media_format: str):
+        return self.__transcriber.start_transcription_job(
+            TranscriptionJobName=job_name,
+            Media={'MediaFileUri': uri},
+            MediaFormat=media_format,
+            LanguageCode=lang.value
+        )
+
+    def start_job(self, job_name: str, src: str, lang: Lang, media_format: str = 'wav'):
+        uri = f'https://{self.__bucket}.s3.{self.__region}.amazonaws.com/{src}'
         try:
-            self.__transcriber.start_transcription_job(
-                TranscriptionJobName=job_name,
-                Media={'MediaFileUri': uri},
-                MediaFormat='wav',
-                LanguageCode=lang.value
-            )
+            return self.__start_job(job_name, uri, lang, media_format)
+        except ClientError as e:
+            # 작업 이름은 src, 언어, 포맷으로 정해지므로, 이미 있다면 이전 러너가 시작한 작업이다 - 새로 요청하지 않고 이어받는다
+            if e.response.get('Error', {}).get('Code') != 'ConflictException':
+                raise
 
+        job = self.get_job(job_name)['TranscriptionJob']
+        if job.get('LanguageCode') != lang.value or job.get('Media', {}).get('MediaFileUri') != uri:
+            raise ValueError(f'Job name is used by another request. [AWS] JobName={job_name}, LanguageCode={job.get("LanguageCode")}')
+        if job['TranscriptionJobStatus'] == 'FAILED':
+            # 실패한 작업은 이어받지 않고 지운 뒤 다시 요청한다
+            logging.info(f'Restarting the failed job. [AWS] JobName={job_name}')
+            self.delete_job(job_name)
+            return self.__start_job(job_name, uri, lang, media_format)
+        logging.info(f'Resumed the job. [AWS] JobName={job_name}, Status={job["TranscriptionJobStatus"]}')
+        return None
+
+    def wait_job(self, job_name: str, duration: float = None):
+        if self.__tracker:
+            future = self.__tracker.track(job_name, duration)
+            try:
+                # Tracker 는 timeout 이 지난 뒤 다음 조회에서 실패로 끝낸다 - Tracker 가 멈췄더라도 그보다 오래 기다리지 않는다
+                future.result(timeout=self.__timeout + self.__tracker.max_delay * 2)
+            except FutureTimeoutError:
+                self.__tracker.untrack(job_name, future)
+                raise
+        else:
             waiter = TranscribeCompleteWaiter(self.__transcriber, timeout=self.__timeout)
             waiter.wait(job_name=job_name)
-            job = self.get_job(job_name)
+
+    def detach(self):
+        # 기다리던 transcribe 는 실패로 끝나지만, 작업은 지우지 않는다 - Tracker 없이 기다리는 요청은 Waiter 의 timeout 까지 기다린다
+        self.__detached.set()
+        if self.__tracker:
+            self.__tracker.untrack_all()
+
+    def cancel(self, src: str, lang: Lang, media_format: str = 'wav'):
+        # 작업을 지우면 기다리던 transcribe 는 실패로 끝난다
+        job_name = self.create_job_name(src, lang, media_format)
+        if self.__tracker:
+            self.__tracker.untrack(job_name)
+        self.delete_job(job_name)
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav'):
+        return self.create_job_name(src, lang, media_format)
+
+    def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        # 체크포인트의 작업이 진행중이거나 끝났다면 시작하지 않고 기다린다 - 없거나 (시작 전에 멈췄거나) 실패했다면 새로 요청한다
+        status = self.job_status(handle)
+        if handle != self.create_job_name(src, lang, media_format) or status in (None, 'FAILED'):
+            return self.transcribe(src, lang, media_format, duration)
+        logging.info(f'Resumed the job. [AWS] JobName={handle}, Status={status}')
+        return self.__wait_result(handle, duration)
+
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        job_name = self.create_job_name(src, lang, media_format)
+        logging.info(f'Started to transcribe. [AWS] JobName={job_name}')
+        return self.__wait_result(job_name, duration, lambda: self.start_job(job_name, src, lang, media_format))
+
+    def __wait_result(self, job_name: str, duration: float = None, start=None):
+        if start:
+            try:
+                start()
+            except Exception as e:
+                if self.is_throttled(e):
+                    # 작업을 시작하지 못했거나 이어받을 작업을 조회하지 못했다 - 진행중일 수 있는 작업은 지우지 않고 다시 요청하게 한다
+                    logging.warning(f'Transcribing is throttled. [AWS] JobName={job_name}')
+                    raise ThrottledError(str(e)) from e
+                logging.error(f'Failed to start the job. [AWS] JobName={job_name}')
+                if not self.detached:
+                    self.delete_job(job_name)
+                return None
+
+        throttled = False
+        try:
+            # 오디오 길이를 알면 Tracker 가 예상 처리 시간에 맞춰 조회한다
+            self.__poll(self.wait_job, job_name, duration)
+            job = self.__poll(self.get_job, job_name)
             result = self.get_transcription_result(job)
             logging.info(f'Transcribing is completed [AWS] JobName={job_name}')
             return result
         except Exception as e:
-            logging.error(f'Failed to transcribe. [AWS] JobName={job_name}')
+            # 조회만 요청량 제한에 걸렸다면 작업은 진행중이거나 끝났다 - 지우지 않고 남겨서, 다시 요청하면 이어받게 한다
+            throttled = self.is_throttled(e)
+            logging.error(f'Failed to transcribe. [AWS] JobName={job_name}, Throttled={throttled}')
             return None
         finally:
-            self.delete_job(job_name)
+            if not self.detached and not throttled:
+                self.delete_job(job_name)
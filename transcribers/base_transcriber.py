@@ -1,9 +1,35 @@
 import abc
 
+from typing import Union
+
 from .enums import Lang
 
 
+class ThrottledError(Exception):
+    """벤더가 요청량 제한으로 요청을 거절했다 - 잠시 뒤 다시 요청하면 성공할 수 있다"""
+    pass
+
+
 class BaseTranscriber(metaclass=abc.ABCMeta):
+    # transcribe 가 on_partial 로 중간 결과를 전달하는지 - 러너는 True 인 경우에만 중간 결과를 기록한다
+    partial_results = False
+
     @abc.abstractmethod
-    def transcribe(self, src: str, lang: Lang):
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        pass
+
+    def cancel(self, src: str, lang: Lang, media_format: str = 'wav'):
+        """진행중인 src 의 음성인식을 취소한다 - 취소할 수 없는 벤더는 아무것도 하지 않는다"""
+        pass
+
+    def job_handle(self, src: str, lang: Lang, media_format: str = 'wav') -> Union[str, None]:
+        """src 를 요청하면 만들어지는 벤더 작업의 식별자 - 러너가 요청 전에 체크포인트로 남긴다. 요청 전에 알 수 없는 벤더는 None"""
+        return None
+
+    def resume(self, handle: str, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
+        """체크포인트에 남은 작업을 새로 요청하지 않고 기다린다 - 이어받을 수 없는 벤더는 다시 요청한다"""
+        return self.transcribe(src, lang, media_format, duration=duration)
+
+    def detach(self):
+        """종료 전에 호출한다 - 진행중인 벤더 작업을 지우지 않고 남겨두어 다른 러너가 이어받게 한다"""
         pass
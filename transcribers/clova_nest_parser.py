@@ -0,0 +1,60 @@
+from array import array
+from typing import Union
+
+import orjson
+
+from .enums import Vendor
+from .transcription import Transcription
+
+
+class ClovaNestPayloadError(ValueError):
+    pass
+
+
+class ClovaNestFailedError(ClovaNestPayloadError):
+    """ClovaNest 가 음성인식에 실패했다고 알렸다 - 결과를 기다리는 클라이언트에게는 실패('')로 알린다"""
+    pass
+
+
+def loads_clova_nest_result(data: Union[bytes, str]) -> dict:
+    try:
+        result = orjson.loads(data)
+    except orjson.JSONDecodeError as e:
+        raise ClovaNestPayloadError(f'Invalid ClovaNest payload. {e}')
+    if not isinstance(result, dict):
+        raise ClovaNestPayloadError('ClovaNest payload must be an object')
+    return result
+
+
+def create_clova_nest_transcription(result: dict) -> Transcription:
+    """
+    ClovaNest 응답(동기 응답, 웹훅 모두)을 Transcription 으로 바꾼다.
+    사용하는 필드(text, confidence, segments[].words)만 확인하고, 단어는 한번의 순회로 텍스트/시작/끝 열에 담는다.
+    단어는 [시작(ms), 끝(ms), 텍스트] 형식이다.
+    result 가 COMPLETED 가 아니거나 텍스트와 단어가 모두 없으면 ClovaNestFailedError 를 낸다.
+    """
+    status = result.get('result')
+    if status != 'COMPLETED':
+        raise ClovaNestFailedError(f'ClovaNest transcription is not completed. result={status}, message={result.get("message")}')
+
+    texts = []
+    start_times = array('d')
+    end_times = array('d')
+    try:
+        for segment in result.get('segments') or ():
+            for start, end, text in segment.get('words') or ():
+                texts.append(text)
+                start_times.append(start / 1000)
+                end_times.append(end / 1000)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ClovaNestPayloadError(f'Invalid ClovaNest segments. {e}')
+
+    text = result.get('text')
+    confidence = result.get('confidence')
+    if text is not None and not isinstance(text, str):
+        raise ClovaNestPayloadError('ClovaNest text must be a string')
+    if confidence is not None and not isinstance(confidence, (int, float)):
+        raise ClovaNestPayloadError('ClovaNest confidence must be a number')
+    if text is None and not texts:
+        raise ClovaNestFailedError('ClovaNest result has neither text nor segments')
+    return Transcription.from_columns([text], [confidence], texts, start_times, end_times, Vendor.ClovaNest.value)
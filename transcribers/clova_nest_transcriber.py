@@ -1,25 +1,25 @@
-from .base_transcriber import BaseTranscriber
-from .enums import Lang, Vendor
-from .transcription import Transcription, TranscriptionWord
+from .base_transcriber import BaseTranscriber, ThrottledError
+from .enums import Lang
+from .clova_nest_parser import loads_clova_nest_result, create_clova_nest_transcription
+
+from transport import Transport
 
 from smart_open import open
 
 import logging
 import json
 
-import boto3
-import requests
-
 
 logger = logging.getLogger(__name__)
 
 
 class ClovaNestTranscriber(BaseTranscriber):
-    def __init__(self, invoke_url: str, secret_key: str, callback: str, access_key: str, secret_access_key: str, region: str, bucket: str):
+    def __init__(self, invoke_url: str, secret_key: str, callback: str, access_key: str, secret_access_key: str, region: str, bucket: str, transport: Transport = None):
         self.__invoke_url = invoke_url
         self.__secret_key = secret_key
         self.__aws_bucket = bucket
-        self.__aws_client = boto3.client('s3', aws_access_key_id=access_key, aws_secret_access_key=secret_access_key, region_name=region)
+        self.__transport = transport or Transport()
+        self.__aws_client = self.__transport.client('s3', aws_access_key_id=access_key, aws_secret_access_key=secret_access_key, region_name=region)
         self.__callback_url = callback
 
     def req_upload(self, file, completion, callback=None, userdata=None, forbiddens=None, boostings=None, wordAlignment=True, fullText=True, diarization=None):
@@ -45,10 +45,10 @@ class ClovaNestTranscriber(BaseTranscriber):
             'params': (None, json.dumps(request_body, ensure_ascii=False).encode(), 'application/json')
         }
 
-        response = requests.post(headers=headers, url=self.__invoke_url + '/recognizer/upload', files=files)
+        response = self.__transport.session.post(headers=headers, url=self.__invoke_url + '/recognizer/upload', files=files)
         return response
 
-    def transcribe(self, src: str, lang: Lang):
+    def transcribe(self, src: str, lang: Lang, media_format: str = 'wav', duration: float = None):
         uri = f's3://{self.__aws_bucket}/{src}'
         try:
             logging.info(f'Started to transcribe. [ClovaNest] Src={src}')
@@ -58,7 +58,10 @@ class ClovaNestTranscriber(BaseTranscriber):
                 if use_webhook:
                     kwargs.update({'completion': 'async', 'callback': self.__callback_url})
 
-                result = self.req_upload(f, **kwargs).json()
+                response = self.req_upload(f, **kwargs)
+                if response.status_code == 429:
+                    raise ThrottledError(f'Too many requests. [ClovaNest] Src={src}')
+                result = loads_clova_nest_result(response.content)
 
                 # 웹훅을 사용한다면, 토큰을 반환
                 if use_webhook:
@@ -70,13 +73,12 @@ class ClovaNestTranscriber(BaseTranscriber):
                     return None
 
                 # 동기 통신을 사용한다면 반환값을 그대로 사용한다.
-                words = []
-                for segment in result.get('segments', []):
-                    for word in segment.get('words', []):
-                        words.append(TranscriptionWord(word[2], word[0] / 1000, word[1] / 1000))
-                transcription = Transcription([result.get('text')], [result.get('confidence')], words, Vendor.ClovaNest.value)
+                transcription = create_clova_nest_transcription(result)
                 logging.info(f'Transcribing is completed [ClovaNest] Src={src}')
                 return transcription
+        except ThrottledError:
+            logging.warning(f'Transcribing is throttled. [ClovaNest] Src={src}')
+            raise
         except Exception as e:
             logging.error(f'Failed to transcribe. [ClovaNest] Src={src}')
             return None
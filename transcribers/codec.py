@@ -0,0 +1,92 @@
+import sys
+import zlib
+
+from array import array
+
+import msgpack
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# 바이너리 포맷: MAGIC(3) + VERSION(1) + 압축방식(1) + msgpack 본문
+MAGIC = b'TRB'
+VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+
+def _times_to_bytes(values):
+    times = array('d', values)
+    if sys.byteorder == 'big':
+        times.byteswap()
+    return times.tobytes()
+
+
+def _times_from_bytes(data: bytes):
+    times = array('d')
+    times.frombytes(data)
+    if sys.byteorder == 'big':
+        times.byteswap()
+    return times
+
+
+def _pack(transcription):
+    # 단어는 텍스트 목록과 시작/끝 시각 배열로 나눠서 저장한다
+    texts, start_times, end_times = transcription.columns
+    body = {
+        't': transcription.transcripts,
+        'c': transcription.confidences,
+        'v': transcription.vendor,
+        'w': texts,
+        's': _times_to_bytes(start_times),
+        'e': _times_to_bytes(end_times),
+    }
+    if transcription.alternatives:
+        body['a'] = [_pack(alt) for alt in transcription.alternatives]
+    return body
+
+
+def _unpack(body, transcription_cls):
+    alternatives = [_unpack(alt, transcription_cls) for alt in body.get('a', [])]
+    return transcription_cls.from_columns(body['t'], body['c'], body['w'], _times_from_bytes(body['s']), _times_from_bytes(body['e']), body['v'], alternatives)
+
+
+def _compress(data: bytes):
+    if zstandard is not None:
+        return COMPRESSION_ZSTD, zstandard.ZstdCompressor(level=3).compress(data)
+    return COMPRESSION_ZLIB, zlib.compress(data, 6)
+
+
+def _decompress(compression: int, data: bytes):
+    if compression == COMPRESSION_NONE:
+        return data
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError('zstandard is required to decode this transcription')
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f'Unknown compression. compression={compression}')
+
+
+def is_binary(data: bytes):
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode(transcription, compress=True) -> bytes:
+    body = msgpack.packb(_pack(transcription), use_bin_type=True)
+    compression, body = _compress(body) if compress else (COMPRESSION_NONE, body)
+    return MAGIC + bytes((VERSION, compression)) + body
+
+
+def decode(data: bytes, transcription_cls):
+    version, compression = data[len(MAGIC)], data[len(MAGIC) + 1]
+    if version != VERSION:
+        raise ValueError(f'Unsupported transcription version. version={version}')
+    body = msgpack.unpackb(_decompress(compression, data[len(MAGIC) + 2:]), raw=False)
+    return _unpack(body, transcription_cls)
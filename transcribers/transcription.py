@@ -1,8 +1,11 @@
-import json
-from typing import List
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import orjson
 
 from pydantic import BaseModel
 from .enums import Lang, Vendor
+from . import codec
 
 
 class TranscriptionRequest(BaseModel):
@@ -11,41 +14,90 @@ class TranscriptionRequest(BaseModel):
     file_key: str
     lang: Lang
     vendor: Vendor
+    # 업로드된 파일의 형식 - 전처리 과정에서 압축되었다면 flac 등
+    media_format: str = 'wav'
+    # 우선순위 스케줄링 - 높을수록 먼저, 짧을수록 먼저 처리한다
+    priority: int = 0
+    duration: Optional[float] = None
+    enqueued_at: Optional[float] = None
+    # 단계별 지연 시간 추적 - 클라이언트가 추적을 켠 요청만 있다
+    trace_id: Optional[str] = None
 
 
+# 긴 오디오는 단어가 수만개이므로, 단어는 __slots__ 로 작게 만들고 orjson 이 dict 변환 없이 바로 직렬화하도록 한다
+@dataclass(slots=True)
 class TranscriptionWord:
-    def __init__(self, word: str, start_time: float, end_time: float):
-        self.word = word
-        self.start_time = start_time
-        self.end_time = end_time
+    word: str
+    start_time: float
+    end_time: float
 
     @staticmethod
     def from_json(word):
         return TranscriptionWord(word['word'], word['start_time'], word['end_time'])
 
+    @property
+    def obj(self):
+        return {'word': self.word, 'start_time': self.start_time, 'end_time': self.end_time}
+
 
 class Transcription:
+    __slots__ = ('transcripts', 'confidences', 'vendor', 'alternatives', '_words', '_columns')
+
     def __init__(self, transcripts: List[str], confidences: List[float], words: List[TranscriptionWord], vendor: str = None, alternatives: List['Transcription']=[]):
         self.transcripts = transcripts
         self.confidences = confidences
-        self.words = words
         self.vendor = vendor
         self.alternatives = alternatives
+        self._words = words
+        self._columns = None
+
+    @staticmethod
+    def from_columns(transcripts: List[str], confidences: List[float], texts: List[str], start_times: Sequence[float], end_times: Sequence[float], vendor: str = None, alternatives: List['Transcription']=[]):
+        # 단어를 텍스트/시작/끝 열로 보관하고, words 에 처음 접근할 때 TranscriptionWord 를 만든다
+        transcription = Transcription(transcripts, confidences, None, vendor, alternatives)
+        transcription._columns = (texts, start_times, end_times)
+        return transcription
+
+    @property
+    def words(self) -> List[TranscriptionWord]:
+        if self._words is None:
+            self._words = [TranscriptionWord(*word) for word in zip(*self._columns)]
+            self._columns = None
+        return self._words
+
+    @words.setter
+    def words(self, words: List[TranscriptionWord]):
+        self._words = words
+        self._columns = None
+
+    @property
+    def columns(self):
+        if self._columns is not None:
+            return self._columns
+        words = self._words
+        return [word.word for word in words], [word.start_time for word in words], [word.end_time for word in words]
 
     @staticmethod
     def from_json(transcription):
         return Transcription(transcription['transcripts'],
                              transcription['confidences'],
-                             [TranscriptionWord.from_json(word) for word in transcription['words']],
+                             [TranscriptionWord(word['word'], word['start_time'], word['end_time']) for word in transcription['words']],
                              transcription['vendor'],
                              [Transcription.from_json(alt) for alt in transcription.get('alternatives', [])])
 
+    @staticmethod
+    def loads(data: bytes):
+        # 바이너리 포맷과 기존 JSON 포맷을 모두 읽는다
+        if codec.is_binary(data):
+            return codec.decode(data, Transcription)
+        return Transcription.from_json(orjson.loads(data))
+
     @property
     def obj(self):
         obj = {
             'transcripts': self.transcripts,
             'confidences': self.confidences,
-            'words': list(map(lambda x: vars(x), self.words)),
+            'words': [word.obj for word in self.words],
             'vendor': self.vendor,
         }
         if self.alternatives:
@@ -53,5 +105,27 @@ class Transcription:
 
         return obj
 
+    def __payload(self):
+        # obj 와 같은 구조지만 단어를 dict 로 바꾸지 않는다
+        payload = {
+            'transcripts': self.transcripts,
+            'confidences': self.confidences,
+            'words': self.words,
+            'vendor': self.vendor,
+        }
+        if self.alternatives:
+            payload['alternatives'] = [alt.__payload() for alt in self.alternatives]
+
+        return payload
+
+    def dumps(self) -> bytes:
+        return orjson.dumps(self.__payload())
+
     def tojson(self):
-        return json.dumps(self.obj, ensure_ascii=False)
+        return self.dumps().decode()
+
+    def encode(self, fmt: str = 'binary') -> bytes:
+        # Redis 에 저장할 값 - binary: 압축된 바이너리 포맷, json: 기존 JSON 포맷
+        if fmt == 'json':
+            return self.dumps()
+        return codec.encode(self)
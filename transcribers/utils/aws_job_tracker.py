@@ -0,0 +1,222 @@
+import contextlib
+import datetime
+import logging
+import threading
+import time
+
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict, List
+
+
+logger = logging.getLogger(__name__)
+
+
+FINISHED_STATUSES = ('COMPLETED', 'FAILED')
+
+
+class TrackedJob:
+    __slots__ = ('job_name', 'futures', 'duration', 'started_at', 'created_after', 'deadline', 'next_check')
+
+    def __init__(self, job_name: str, duration, started_at: float, created_after: datetime.datetime, deadline: float):
+        self.job_name = job_name
+        # 같은 작업을 여러 요청이 기다릴 수 있다 (같은 파일의 요청, 이어받은 작업) - 기다리는 쪽마다 Future 를 준다
+        self.futures: List[Future] = []
+        self.duration = duration
+        self.started_at = started_at
+        self.created_after = created_after
+        self.deadline = deadline
+        self.next_check = started_at
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+
+class TranscribeJobTracker:
+    """
+    진행중인 모든 AWS Transcribe 작업의 상태를 ListTranscriptionJobs 로 한번에 조회한다.
+    작업마다 GetTranscriptionJob 을 주기적으로 호출하는 대신, 조회 시점이 된 작업이 하나라도 있을 때만
+    최근 생성된 작업 목록을 훑어서 끝난 작업의 Future 를 완료시킨다.
+    목록에서 찾지 못한 작업 (조회 범위보다 먼저 만들어진, 이어받은 작업) 은 GetTranscriptionJob 으로 조회하고, 다음부터는 그 생성 시각까지 훑는다.
+
+    조회 주기는 작업별로 오디오 길이와 경과 시간에 따라 정한다.
+    - 오디오 길이를 알면 예상 처리 시간(길이 * speed)까지는 남은 시간의 절반 간격으로 조회한다.
+    - 예상 처리 시간이 지났거나 길이를 모르면 경과 시간에 비례해 간격을 늘린다.
+    """
+
+    def __init__(self, client, min_delay=2, max_delay=30, speed=0.3, timeout=180, page_size=100, name_contains: str = None, clock=time.monotonic):
+        self.__client = client
+        self.__min_delay = min_delay
+        self.__max_delay = max_delay
+        self.__speed = speed
+        self.__timeout = timeout
+        self.__page_size = page_size
+        self.__name_contains = name_contains
+        self.__clock = clock
+        self.__jobs: Dict[str, TrackedJob] = {}
+        self.__lock = threading.Condition()
+        self.__thread = None
+        self.__stopped = False
+
+    def __len__(self):
+        return len(self.__jobs)
+
+    @property
+    def max_delay(self):
+        return self.__max_delay
+
+    def __next_delay(self, job: TrackedJob, now: float):
+        elapsed = now - job.started_at
+        if job.duration:
+            remaining = job.duration * self.__speed - elapsed
+            if remaining > 0:
+                return min(self.__max_delay, max(self.__min_delay, remaining / 2))
+            elapsed = -remaining
+        return min(self.__max_delay, max(self.__min_delay, elapsed / 4))
+
+    def track(self, job_name: str, duration: float = None, timeout: float = None) -> Future:
+        now = self.__clock()
+        # 서버 시각과의 차이를 감안해 생성 시각 비교에 여유를 둔다
+        created_after = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)
+        deadline = now + (timeout or self.__timeout)
+        future = Future()
+        with self.__lock:
+            job = self.__jobs.get(job_name)
+            if job is None:
+                job = self.__jobs[job_name] = TrackedJob(job_name, duration, now, created_after, deadline)
+                job.next_check = now + self.__next_delay(job, now)
+            else:
+                # 이미 추적중인 작업이다 - 조회 주기는 그대로 두고, 늦게 기다리기 시작한 요청의 timeout 까지 기다린다
+                job.deadline = max(job.deadline, deadline)
+            job.futures.append(future)
+            self.__lock.notify()
+        return future
+
+    def untrack(self, job_name: str, future: Future = None):
+        # future 를 주면 그 요청만 기다리지 않고, 주지 않으면 작업을 기다리는 모든 요청을 취소한다
+        with self.__lock:
+            job = self.__jobs.get(job_name)
+            if job is None:
+                return
+            futures = [future] if future is not None else list(job.futures)
+            job.futures = [other for other in job.futures if other not in futures]
+            if not job.futures:
+                del self.__jobs[job_name]
+        for future in futures:
+            future.cancel()
+
+    def untrack_all(self):
+        with self.__lock:
+            jobs = list(self.__jobs.values())
+            self.__jobs.clear()
+        for job in jobs:
+            for future in job.futures:
+                future.cancel()
+
+    def __list_jobs(self, created_after: datetime.datetime):
+        kwargs = {'MaxResults': self.__page_size}
+        if self.__name_contains:
+            kwargs['JobNameContains'] = self.__name_contains
+
+        while True:
+            response = self.__client.list_transcription_jobs(**kwargs)
+            summaries = response.get('TranscriptionJobSummaries', [])
+            for summary in summaries:
+                yield summary
+
+            # 최신 작업부터 반환되므로 추적중인 가장 오래된 작업보다 이전 작업이 나오면 그만 조회한다
+            next_token = response.get('NextToken')
+            if not next_token or (summaries and summaries[-1]['CreationTime'] < created_after):
+                return
+            kwargs['NextToken'] = next_token
+
+    def poll_once(self) -> float:
+        """조회 시점이 된 작업이 있으면 상태를 한번 조회하고, 다음 조회까지 남은 시간을 반환한다."""
+        now = self.__clock()
+        with self.__lock:
+            jobs = list(self.__jobs.values())
+        # 곧 조회 시점이 되는 작업도 함께 조회해서 조회 횟수를 줄인다
+        due = [job for job in jobs if job.next_check <= now + self.__min_delay / 2]
+
+        if due:
+            pending = {job.job_name for job in due}
+            try:
+                for summary in self.__list_jobs(min(job.created_after for job in due)):
+                    job_name = summary['TranscriptionJobName']
+                    if summary['TranscriptionJobStatus'] in FINISHED_STATUSES:
+                        self.__finish(job_name, summary)
+                    pending.discard(job_name)
+                    if not pending:
+                        break
+                else:
+                    for job in due:
+                        if job.job_name in pending:
+                            self.__get_job(job)
+            except Exception:
+                logging.exception('Failed to list transcription jobs.')
+
+            now = self.__clock()
+            for job in due:
+                if job.done():
+                    with self.__lock:
+                        # 기다리던 요청이 모두 취소되었다
+                        if self.__jobs.get(job.job_name) is job:
+                            del self.__jobs[job.job_name]
+                    continue
+                if now >= job.deadline:
+                    self.__fail(job.job_name, TimeoutError(f'Transcription job is timed out. JobName={job.job_name}'))
+                else:
+                    job.next_check = now + self.__next_delay(job, now)
+
+        with self.__lock:
+            if not self.__jobs:
+                return self.__max_delay
+            return max(0, min(job.next_check for job in self.__jobs.values()) - self.__clock())
+
+    def __get_job(self, job: TrackedJob):
+        try:
+            summary = self.__client.get_transcription_job(TranscriptionJobName=job.job_name)['TranscriptionJob']
+        except Exception as e:
+            logging.error(f'Failed to get the transcription job. JobName={job.job_name}')
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'BadRequestException':
+                # 작업이 없다 (지워졌다) - 더 기다려도 끝나지 않는다
+                self.__fail(job.job_name, e)
+            return
+        if summary['TranscriptionJobStatus'] in FINISHED_STATUSES:
+            self.__finish(job.job_name, summary)
+        elif summary.get('CreationTime'):
+            job.created_after = min(job.created_after, summary['CreationTime'] - datetime.timedelta(minutes=1))
+
+    def __finish(self, job_name: str, summary: dict):
+        with self.__lock:
+            job = self.__jobs.pop(job_name, None)
+        # untrack 이나 기다리던 쪽에서 취소한 Future 는 이미 끝났으므로 건너뛴다 - 확인 직후에 취소될 수도 있다
+        for future in job.futures if job else ():
+            if not future.done():
+                with contextlib.suppress(InvalidStateError):
+                    future.set_result(summary)
+
+    def __fail(self, job_name: str, exc: Exception):
+        with self.__lock:
+            job = self.__jobs.pop(job_name, None)
+        for future in job.futures if job else ():
+            if not future.done():
+                with contextlib.suppress(InvalidStateError):
+                    future.set_exception(exc)
+
+    def __run(self):
+        while not self.__stopped:
+            delay = self.poll_once()
+            with self.__lock:
+                if not self.__stopped:
+                    self.__lock.wait(delay)
+
+    def start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name='transcribe-job-tracker', daemon=True)
+            self.__thread.start()
+        return self
+
+    def stop(self):
+        with self.__lock:
+            self.__stopped = True
+            self.__lock.notify()
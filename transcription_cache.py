@@ -0,0 +1,134 @@
+import hashlib
+import time
+
+from typing import Union
+
+from redis import StrictRedis
+
+from transcribers import Lang, Vendor
+
+
+def hash_file(filename: str, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_cache_key(content_hash: str, lang: Lang, vendor: Vendor):
+    return f'trans-cache:{content_hash}:{lang.value}:{vendor.value}'
+
+
+class TranscriptionCache:
+    """
+    오디오 내용의 해시 + 언어 + 벤더로 음성인식 결과를 저장하는 캐시.
+    같은 오디오가 다른 unique_key 로 요청되어도 다시 인식하지 않고, 캐시 결과를 해당 data_key 에 기록한다.
+    data_key 에는 캐시 결과를 그대로 복사하므로, 캐시 항목이 지워져도 data_key 의 결과는 남고 캐시를 사용하지 않는 클라이언트도 읽을 수 있다.
+    항목은 TTL 로 만료되고, 항목 수나 전체 크기가 한도를 넘으면 가장 오래 사용되지 않은 항목부터 지운다.
+    만료된 항목은 LRU 목록과 크기 합계에 남으므로, 조회에서 없는 항목을 만나거나 저장할 때 정리한다.
+    """
+
+    INDEX_KEY = 'trans-cache:index'
+    SIZES_KEY = 'trans-cache:sizes'
+    BYTES_KEY = 'trans-cache:bytes'
+    STATS_KEY = 'trans-cache:stats'
+
+    GET_SCRIPT = """
+    local value = redis.call('GET', KEYS[1])
+    if value then
+        redis.call('ZADD', KEYS[2], ARGV[1], KEYS[1])
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+        redis.call('HINCRBY', KEYS[5], 'hits', 1)
+    else
+        -- 만료된 항목이면 LRU 목록과 크기 합계에서도 뺀다
+        if redis.call('ZREM', KEYS[2], KEYS[1]) == 1 then
+            redis.call('INCRBY', KEYS[4], -tonumber(redis.call('HGET', KEYS[3], KEYS[1]) or '0'))
+            redis.call('HDEL', KEYS[3], KEYS[1])
+            redis.call('HINCRBY', KEYS[5], 'expired', 1)
+        end
+        redis.call('HINCRBY', KEYS[5], 'misses', 1)
+    end
+    return value
+    """
+
+    PUT_SCRIPT = """
+    local size = string.len(ARGV[1])
+    local old = tonumber(redis.call('HGET', KEYS[3], KEYS[1]) or '0')
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    redis.call('ZADD', KEYS[2], ARGV[2], KEYS[1])
+    redis.call('HSET', KEYS[3], KEYS[1], size)
+    local total = redis.call('INCRBY', KEYS[4], size - old)
+
+    -- 마지막 사용 후 TTL 이 지난 항목은 이미 만료되었다 - 한번에 정리하는 개수를 제한해 스크립트가 오래 걸리지 않게 한다
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[2]) - tonumber(ARGV[3]), 'LIMIT', 0, tonumber(ARGV[6]))
+    for _, key in ipairs(expired) do
+        if redis.call('EXISTS', key) == 0 then
+            redis.call('ZREM', KEYS[2], key)
+            total = redis.call('INCRBY', KEYS[4], -tonumber(redis.call('HGET', KEYS[3], key) or '0'))
+            redis.call('HDEL', KEYS[3], key)
+            redis.call('HINCRBY', KEYS[5], 'expired', 1)
+        end
+    end
+
+    local max_entries = tonumber(ARGV[4])
+    local max_bytes = tonumber(ARGV[5])
+    while redis.call('ZCARD', KEYS[2]) > max_entries or total > max_bytes do
+        local oldest = redis.call('ZPOPMIN', KEYS[2])
+        if not oldest[1] then
+            break
+        end
+        total = redis.call('INCRBY', KEYS[4], -tonumber(redis.call('HGET', KEYS[3], oldest[1]) or '0'))
+        redis.call('HDEL', KEYS[3], oldest[1])
+        -- 이미 만료된 항목은 지운 것으로 세지 않는다
+        if redis.call('DEL', oldest[1]) == 1 then
+            redis.call('HINCRBY', KEYS[5], 'evictions', 1)
+        else
+            redis.call('HINCRBY', KEYS[5], 'expired', 1)
+        end
+    end
+    return total
+    """
+
+    def __init__(self, redis: StrictRedis, ttl=60 * 60 * 24 * 7, max_entries=100000, max_bytes=1024 * 1024 * 1024, result_ttl=60 * 60 * 24, prune_batch=100):
+        self.__redis = redis
+        self.__ttl = ttl
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__result_ttl = result_ttl
+        self.__prune_batch = prune_batch
+        self.__get_script = redis.register_script(self.GET_SCRIPT)
+        self.__put_script = redis.register_script(self.PUT_SCRIPT)
+
+    def get(self, cache_key: str, client=None) -> Union[bytes, None]:
+        return self.__get_script(keys=[cache_key, self.INDEX_KEY, self.SIZES_KEY, self.BYTES_KEY, self.STATS_KEY], args=[time.time(), self.__ttl], client=client)
+
+    def put(self, cache_key: str, value: bytes):
+        # 실패한 결과(빈 값)는 캐시하지 않는다
+        if not value:
+            return
+        self.__put_script(keys=[cache_key, self.INDEX_KEY, self.SIZES_KEY, self.BYTES_KEY, self.STATS_KEY],
+                          args=[value, time.time(), self.__ttl, self.__max_entries, self.__max_bytes, self.__prune_batch])
+
+    def put_for(self, data_key: str, value: bytes):
+        # 캐시에서 찾은 결과를 data_key 에도 기록한다
+        self.__redis.set(data_key, value, ex=self.__result_ttl)
+
+    def stats(self):
+        with self.__redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.STATS_KEY)
+            pipe.zcard(self.INDEX_KEY)
+            pipe.get(self.BYTES_KEY)
+            counters, entries, total_bytes = pipe.execute()
+
+        hits = int(counters.get(b'hits', 0))
+        misses = int(counters.get(b'misses', 0))
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': int(counters.get(b'evictions', 0)),
+            'expired': int(counters.get(b'expired', 0)),
+            'entries': entries,
+            'bytes': int(total_bytes or 0),
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        }
@@ -0,0 +1,3 @@
+from .transport import PoolStats, Transport
+
+__all__ = ('PoolStats', 'Transport')
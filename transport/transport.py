@@ -0,0 +1,119 @@
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+
+class PoolStats:
+    """커넥션 풀에서 빈 커넥션을 기다린 횟수와 시간, 풀이 가득 차서 버린 커넥션 수"""
+
+    def __init__(self, wait_threshold=0.001):
+        self.__lock = threading.Lock()
+        self.__wait_threshold = wait_threshold
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.discards = 0
+
+    def record(self, elapsed: float):
+        with self.__lock:
+            self.requests += 1
+            if elapsed >= self.__wait_threshold:
+                self.waits += 1
+                self.wait_time += elapsed
+
+    def record_discard(self):
+        with self.__lock:
+            self.discards += 1
+
+    def snapshot(self):
+        with self.__lock:
+            return {'requests': self.requests, 'waits': self.waits, 'wait_time': self.wait_time, 'discards': self.discards}
+
+
+def _instrument(pool_class, stats: PoolStats):
+    class InstrumentedPool(pool_class):
+        def _get_conn(self, timeout=None):
+            started = time.monotonic()
+            try:
+                return super()._get_conn(timeout)
+            finally:
+                stats.record(time.monotonic() - started)
+
+        def _put_conn(self, conn):
+            # 기다리지 않는 풀(block=False)은 가득 차면 새 커넥션을 열고, 돌려줄 때 버린다 - 풀이 작다는 신호이다
+            if self.pool is not None and self.pool.full():
+                stats.record_discard()
+            super()._put_conn(conn)
+
+    return InstrumentedPool
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    def __init__(self, stats: PoolStats, **kwargs):
+        self.__stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _instrument(HTTPConnectionPool, self.__stats),
+            'https': _instrument(HTTPSConnectionPool, self.__stats),
+        }
+
+
+class Transport:
+    """
+    벤더 호출에 쓰는 HTTP 세션과 boto3 클라이언트를 만든다.
+    - HTTP 세션은 keep-alive 커넥션 풀과 재시도 정책을 공유하고, 풀이 가득 차면 빈 커넥션을 기다린다(대기는 stats 에 기록).
+    - boto3 클라이언트의 커넥션 풀은 동시 요청 수(pool_size)에 맞춘다. botocore 의 풀은 기다리지 않으므로, 풀이 가득 차서 버린 커넥션 수를 boto_stats 에 기록한다.
+    """
+
+    def __init__(self, pool_size=10, retries=3, backoff_factor=0.5):
+        self.__pool_size = pool_size
+        self.__retries = retries
+        self.__backoff_factor = backoff_factor
+        self.__stats = PoolStats()
+        self.__boto_stats = PoolStats()
+        self.__session = self.create_session()
+
+    @property
+    def pool_size(self):
+        return self.__pool_size
+
+    @property
+    def session(self) -> requests.Session:
+        return self.__session
+
+    @property
+    def stats(self) -> PoolStats:
+        return self.__stats
+
+    @property
+    def boto_stats(self) -> PoolStats:
+        return self.__boto_stats
+
+    def create_session(self) -> requests.Session:
+        # POST 같은 멱등하지 않은 요청은 접속 실패만 재시도한다 (urllib3 기본 정책)
+        retry = Retry(total=self.__retries, backoff_factor=self.__backoff_factor, status_forcelist=(500, 502, 503, 504))
+        adapter = InstrumentedHTTPAdapter(self.__stats, pool_connections=4, pool_maxsize=self.__pool_size, pool_block=True, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def client(self, service_name: str, **kwargs):
+        # boto3 는 클라이언트를 처음 만들 때 import 한다 - transport 를 import 하는 러너와 클라이언트가 boto3 를 불러오지 않는다
+        import boto3
+        from botocore.config import Config
+        config = Config(max_pool_connections=self.__pool_size, retries={'max_attempts': self.__retries, 'mode': 'standard'})
+        client = boto3.client(service_name, config=config, **kwargs)
+        # botocore 의 URLLib3Session 이 만드는 풀 클래스를 바꾼다 - 내부 구조가 다른 버전이면 기록하지 않는다
+        manager = getattr(getattr(getattr(client, '_endpoint', None), 'http_session', None), '_manager', None)
+        if manager is not None:
+            manager.pool_classes_by_scheme = {scheme: _instrument(pool_class, self.__boto_stats) for scheme, pool_class in manager.pool_classes_by_scheme.items()}
+        return client
@@ -1,82 +1,92 @@
 import logging
+import time
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from starlette.responses import Response
-from pydantic import BaseModel
-from redis import StrictRedis
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from redis.asyncio import StrictRedis, BlockingConnectionPool
 
 import uvicorn
 import click
 
-from typing import List
-
 from config import WebHookMainConfig
 
-from transcribers import Transcription, TranscriptionWord, Vendor
-
-
-class ClovaNestParams(BaseModel):
-    service: str
-    domain: str
-    completion: str
-    diarization: dict
-    boostings: dict
-    forbiddens: str
-    wordAlignment: bool
-    fullText: bool
-    priority: int
-    userdata: dict
-
-
-class ClovaNestResult(BaseModel):
-    result: str
-    message: str
-    token: str
-    version: str
-    params: ClovaNestParams
-    progress: int
-    segments: List[dict]
-    text: str
-    confidence: float
-    speakers: List[dict]
+from transcribers import ClovaNestPayloadError, ClovaNestFailedError, loads_clova_nest_result, create_clova_nest_transcription
+from messaging import create_webhook_key
+from messaging.reply import INFLIGHT_PREFIX, REPLY_PREFIX, WEBHOOK_PUBLISH_SCRIPT
+from monitoring.metrics import RESULT_BYTES, WEBHOOK_REQUESTS, WEBHOOK_PUBLISH_LATENCY
+from monitoring.tracing import RECORD_BY_DATA_KEY_SCRIPT, record_by_data_key_async
 
 
-@click.command()
-@click.option('-c', '--config_path', default='config/config-local.yml', help='config yaml file path', show_default=True)
-def main(config_path: str):
-    config = WebHookMainConfig.load_from_yml(config_path)
-    config.logger.setup()
-    redis = StrictRedis(**config.redis.kwargs)
+def create_app(config: WebHookMainConfig, redis: StrictRedis) -> FastAPI:
+    publish_webhook_result = redis.register_script(WEBHOOK_PUBLISH_SCRIPT)
+    record_trace = redis.register_script(RECORD_BY_DATA_KEY_SCRIPT)
+    live_timeout = 60 * 60 * 24
 
     app = FastAPI()
 
     @app.post('/clovanest/webhook')
-    async def clovanest_webhook(result: ClovaNestResult):
-        logging.info(f'WebHook is delivered from ClovaNest. result={result.result}, token={result.token}')
-        webhook_key = f'transcriber-webhook:{result.token}'
-        data_key = redis.get(webhook_key)
+    async def clovanest_webhook(request: Request):
+        received_at = time.time()
+        # 전체 모델 검증 없이 사용하는 필드만 확인한다
+        try:
+            result = loads_clova_nest_result(await request.body())
+            token = result.get('token')
+            if not isinstance(token, str):
+                raise ClovaNestPayloadError('ClovaNest token must be a string')
+            try:
+                encoded = create_clova_nest_transcription(result).encode(config.result.format)
+                status = 'published'
+            except ClovaNestFailedError as e:
+                # 실패한 작업도 결과를 기다리는 클라이언트가 있으므로, 러너와 같이 빈 결과로 실패를 알린다
+                logging.warning(f'ClovaNest failed to transcribe. token={token}, {e}')
+                encoded = ''
+                status = 'failed'
+        except ClovaNestPayloadError as e:
+            logging.error(f'Invalid WebHook is delivered from ClovaNest. {e}')
+            WEBHOOK_REQUESTS.labels('invalid').inc()
+            return Response(status_code=422)
+
+        logging.info(f'WebHook is delivered from ClovaNest. result={result.get("result")}, token={token}')
+
+        # 웹훅키에서 데이터키를 찾아 음성인식 결과를 기록하고 웹훅키는 지운다 - 한번의 왕복으로 처리
+        webhook_key = create_webhook_key(token)
+        RESULT_BYTES.labels('webhook').observe(len(encoded))
+        started_at = time.perf_counter()
+        data_key = await publish_webhook_result(keys=[webhook_key], args=[encoded, live_timeout, REPLY_PREFIX, INFLIGHT_PREFIX])
+        WEBHOOK_PUBLISH_LATENCY.observe(time.perf_counter() - started_at)
         if not data_key:
             # 웹훅키에서 데이터키를 찾을 수 없다 - 무시
-            logging.info(f'Cannot found data key from ClovaNest token. token={result.token}')
+            logging.info(f'Cannot found data key from ClovaNest token. token={token}')
+            WEBHOOK_REQUESTS.labels('unknown_token').inc()
         else:
-            # 웹훅키에서 데이터키를 찾았다 - 데이터키로 음성인식 결과 기록
-            logging.info(f'Data key is found from ClovaNest token. data_key={data_key.decode()}, token={result.token}')
-            words = []
-            for segment in result.segments:
-                for word in segment.get('words', []):
-                    words.append(TranscriptionWord(word[2], word[0] / 1000, word[1] / 1000))
-            transcription = Transcription([result.text], [result.confidence], words, Vendor.ClovaNest.value)
-            redis.set(data_key, transcription.tojson())
-
-        # 웹훅키는 지운다
-        redis.delete(webhook_key)
+            logging.info(f'Data key is found from ClovaNest token. data_key={data_key.decode()}, token={token}')
+            WEBHOOK_REQUESTS.labels(status).inc()
+            if config.tracing.enabled:
+                # 러너가 추적 아이디를 남긴 요청만 기록된다
+                stages = {'webhook_received': received_at, 'published': time.time()}
+                await record_by_data_key_async(redis, record_trace, data_key.decode(), stages, 'cn')
         return Response()
 
+    if config.metrics.enabled:
+        @app.get('/metrics')
+        async def metrics():
+            return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
     @app.get('/')
     async def root():
         return Response(':)')
 
-    uvicorn.run(app, **config.webhook.kwargs)
+    return app
+
+
+@click.command()
+@click.option('-c', '--config_path', default='config/config-local.yml', help='config yaml file path', show_default=True)
+def main(config_path: str):
+    config = WebHookMainConfig.load_from_yml(config_path)
+    config.logger.setup()
+    redis = StrictRedis(connection_pool=BlockingConnectionPool(**config.redis.kwargs, **config.redis_pool.kwargs))
+    uvicorn.run(create_app(config, redis), **config.webhook.kwargs)
 
 
 if __name__ == '__main__':